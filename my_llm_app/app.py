@@ -12,6 +12,7 @@
 
 import streamlit as st
 import datetime
+import json
 import pytz
 import time
 from typing import List
@@ -37,13 +38,16 @@ st.set_page_config(
 
 # モジュールのインポート
 from auth import AuthManager, CookieManager, call_cloud_function
-from firestore_db import get_firestore_manager, check_gakushi_permission, save_user_data, get_user_profile_for_ranking, save_user_profile
+from firestore_db import get_firestore_manager, check_gakushi_permission, save_user_data, get_user_profile_for_ranking, save_user_profile, prefetch_user_context
 from utils import (
     ALL_QUESTIONS,
     log_to_ga, 
     AnalyticsUtils,
     get_natural_sort_key
 )
+import perf_metrics
+import firestore_usage
+import card_cache
 
 # 必修問題セットは後でインポート（循環import回避）
 try:
@@ -55,7 +59,7 @@ except ImportError:
     print("[WARNING] HISSHU_Q_NUMBERS_SET と GAKUSHI_HISSHU_Q_NUMBERS_SET のインポートに失敗しました")
 
 # ページモジュールのインポート（高速化対応）
-from modules.practice_page import render_practice_page, render_practice_sidebar
+from modules.practice_page import render_practice_page, render_practice_sidebar, CARDS_VERSION_KEY
 from modules.updated_ranking_page import render_updated_ranking_page
 
 # パフォーマンス最適化は無効化
@@ -103,9 +107,90 @@ def render_profile_settings_in_sidebar(uid: str):
     # ランキング表示設定は updated_ranking_page.py で統合管理
 
 
+QUALITY_TO_MARK = {1: "×", 2: "△", 4: "◯", 5: "◎"}
+
+
+def _summarize_evaluations(cards: dict, result_log: dict) -> dict:
+    """自己評価の分布と最近の評価ログを集計（全カードを走査するためカード更新時のみ実行）"""
+    evaluated_marks = []
+
+    for card_id, card in cards.items():
+        # パターン1: historyから最新の評価を取得
+        history = card.get('history', [])
+        quality = history[-1].get('quality') if history else None
+        # パターン2: 直接qualityフィールドから取得
+        if quality not in QUALITY_TO_MARK:
+            quality = card.get('quality')
+        if quality in QUALITY_TO_MARK:
+            evaluated_marks.append(QUALITY_TO_MARK[quality])
+
+    # パターン3: result_logからも評価を取得（最新の自己評価を反映）
+    for q_id, result in result_log.items():
+        if q_id not in cards:  # cardsに含まれていない問題はスキップ
+            continue
+        quality = result.get("quality")
+        if quality in QUALITY_TO_MARK:
+            # 同じ評価が履歴に既にある場合は二重に数えない
+            if not any(h.get('quality') == quality for h in cards[q_id].get('history', [])):
+                evaluated_marks.append(QUALITY_TO_MARK[quality])
+
+    # 学習履歴があるカード（qualityとtimestampがある最新履歴のみ有効）
+    cards_with_history = []
+    for q_num, card in cards.items():
+        history = card.get('history', [])
+        if history and history[-1].get('quality') and history[-1].get('timestamp'):
+            cards_with_history.append((q_num, card))
+
+    # タイムスタンプでソート（最新順）
+    def get_timestamp_for_sort(item):
+        try:
+            timestamp = item[1]['history'][-1].get('timestamp')
+            if hasattr(timestamp, 'isoformat'):
+                return timestamp.isoformat()
+            elif isinstance(timestamp, str):
+                return timestamp
+            else:
+                return "1970-01-01T00:00:00"
+        except Exception:
+            return "1970-01-01T00:00:00"
+
+    return {
+        "counter": Counter(evaluated_marks),
+        "total": len(evaluated_marks),
+        "recent": sorted(cards_with_history, key=get_timestamp_for_sort, reverse=True)[:10],
+    }
+
+
+def get_evaluation_summary(cards: dict) -> dict:
+    """評価集計をカードのバージョンごとにキャッシュして取得"""
+    result_log = st.session_state.get("result_log", {})
+    cache_key = (st.session_state.get(CARDS_VERSION_KEY, 0), id(cards), len(result_log))
+    cached = st.session_state.get("_evaluation_summary")
+    if cached and cached[0] == cache_key:
+        return cached[1]
+
+    summary = _summarize_evaluations(cards, result_log)
+    st.session_state["_evaluation_summary"] = (cache_key, summary)
+    return summary
+
+
 # アプリバージョン
 APP_VERSION = "2024-08-24-refactored"
 
+# 処理時間パネルを表示できる権限（user_permissions コレクション）
+PERF_PANEL_PERMISSION = "can_view_perf_metrics"
+# 処理時間パネルで対象にする直近の再実行数
+PERF_PANEL_RECENT_RERUNS = 20
+# セッション単位のFirestore使用量（session_state のキー）
+FIRESTORE_SESSION_USAGE_KEY = "_firestore_usage"
+
+
+def finish_firestore_usage_session():
+    """セッション終了時（ログアウト）にFirestore使用量の集計をログ出力"""
+    counter = st.session_state.pop(FIRESTORE_SESSION_USAGE_KEY, None)
+    if counter is not None and (counter.reads or counter.writes or counter.deletes):
+        firestore_usage.finish(counter)
+
 
 class DentalApp:
     """歯科国家試験対策アプリのメインクラス"""
@@ -175,6 +260,10 @@ class DentalApp:
         #     }
         # )
         
+        # ページが変わったときだけページビューを記録（毎回の再実行では送信しない）
+        if st.session_state.get('current_page') != page_name:
+            AnalyticsUtils.track_page_view(page_name)
+        
         # 現在のページを記録
         st.session_state['current_page'] = page_name
         
@@ -314,18 +403,15 @@ class DentalApp:
                 st.session_state["cards"] = {}
                 return
             
-            # 最適化されたstudy_cardsコレクションからユーザーデータを読み込み
-            study_cards_ref = db.collection("study_cards")
-            user_cards_query = study_cards_ref.where("uid", "==", uid)
-            user_cards_docs = user_cards_query.get()
+            # ローカルキャッシュ（SQLite）に前回同期以降の差分だけを反映して読み込み
+            card_docs = card_cache.read_through(
+                uid, lambda since: firestore_manager.get_user_card_docs_since(uid, since)
+            )
             
             # カードデータを変換（既存の形式に合わせる）
             cards = {}
-            for doc in user_cards_docs:
+            for question_id, card_data in card_docs.items():
                 try:
-                    card_data = doc.to_dict()
-                    question_id = doc.id.split('_')[-1] if '_' in doc.id else doc.id
-                    
                     # 既存の形式に変換
                     card = {
                         "q_id": question_id,
@@ -350,7 +436,7 @@ class DentalApp:
                     cards[question_id] = card
                     
                 except Exception as card_error:
-                    print(f"[WARNING] カードデータ処理エラー ({doc.id}): {card_error}")
+                    print(f"[WARNING] カードデータ処理エラー ({question_id}): {card_error}")
                     continue
             
             # セッション状態に保存
@@ -412,6 +498,8 @@ class DentalApp:
             
             st.session_state["auto_login_attempted"] = True
             if self.cookie_manager.try_auto_login():
+                # プロフィールと権限を1回のバッチ読み取りでキャッシュ
+                prefetch_user_context(st.session_state.get("uid"))
                 # 自動ログイン成功時に科目を初期化
                 self._initialize_available_subjects()
                 
@@ -494,8 +582,61 @@ class DentalApp:
     def _render_sidebar(self):
         """サイドバーの描画（ログイン済みユーザー向け）"""
         
-        with st.sidebar:
+        with st.sidebar, perf_metrics.span("sidebar"):
             self._render_user_menu()
+            self._render_perf_panel()
+    
+    def _render_perf_panel(self):
+        """管理者向け：直近の再実行で遅かった処理の一覧"""
+        uid = st.session_state.get("uid")
+        if not uid or not get_firestore_manager().check_user_permission(uid, PERF_PANEL_PERMISSION):
+            return
+        
+        with st.expander("⏱ 処理時間（管理者）", expanded=False):
+            reruns = perf_metrics.recent_reruns(PERF_PANEL_RECENT_RERUNS)
+            if not reruns:
+                st.info("まだ計測データがありません。")
+                return
+            
+            st.markdown(f"**直近{len(reruns)}回の再実行**")
+            st.dataframe([
+                {
+                    "ページ": r["label"],
+                    "時間(ms)": round(r["duration"] * 1000, 1),
+                    "読取": r["reads"],
+                    "書込": r["writes"],
+                }
+                for r in reruns
+            ], hide_index=True)
+            
+            st.markdown("**遅い処理（上位）**")
+            st.dataframe([
+                {
+                    "処理": item["name"],
+                    "時間(ms)": round(item["duration"] * 1000, 1),
+                    "読取": item["reads"],
+                    "書込": item["writes"],
+                    "ページ": item["label"],
+                }
+                for item in perf_metrics.slowest_spans(PERF_PANEL_RECENT_RERUNS)
+            ], hide_index=True)
+            
+            st.markdown("**プロセス全体の集計**")
+            st.dataframe([
+                {"処理": name, **stats} for name, stats in perf_metrics.span_summary().items()
+            ], hide_index=True)
+            
+            col1, col2 = st.columns(2)
+            with col1:
+                st.download_button(
+                    "Prometheus形式", perf_metrics.export_prometheus(),
+                    file_name="perf_metrics.prom", mime="text/plain", key="perf_download_prom"
+                )
+            with col2:
+                st.download_button(
+                    "JSON形式", json.dumps(perf_metrics.export_json(), ensure_ascii=False, indent=2),
+                    file_name="perf_metrics.json", mime="application/json", key="perf_download_json"
+                )
     
     def _render_login_page(self):
         """🔐 2. Manual Login Screen - タブ形式のログイン画面"""
@@ -829,52 +970,12 @@ class DentalApp:
         # cardsの存在確認を強化
         cards = st.session_state.get("cards", {})
         if cards and len(cards) > 0:
-            quality_to_mark = {1: "×", 2: "△", 4: "◯", 5: "◎"}
             mark_to_label = {"◎": "簡単", "◯": "普通", "△": "難しい", "×": "もう一度"}
             
-            # カードデータから評価を取得（複数のパターンに対応）
-            evaluated_marks = []
-            cards_with_evaluations = 0
-            
-            # セッション状態から最新のcardsを取得
-            current_cards = st.session_state.get("cards", cards)
-            
-            for card_id, card in current_cards.items():
-                evaluation_found = False
-                
-                # パターン1: historyから最新の評価を取得
-                history = card.get('history', [])
-                if history:
-                    last_eval = history[-1]
-                    quality = last_eval.get('quality')
-                    if quality and quality in quality_to_mark:
-                        evaluated_marks.append(quality_to_mark[quality])
-                        evaluation_found = True
-                        cards_with_evaluations += 1
-                
-                # パターン2: 直接qualityフィールドから取得
-                if not evaluation_found and card.get('quality'):
-                    quality = card.get('quality')
-                    if quality in quality_to_mark:
-                        evaluated_marks.append(quality_to_mark[quality])
-                        evaluation_found = True
-                        cards_with_evaluations += 1
-            
-            # パターン3: result_logからも評価を取得（最新の自己評価を反映）
-            result_log = st.session_state.get("result_log", {})
-            for q_id, result in result_log.items():
-                if q_id not in current_cards:  # cardsに既に含まれている場合はスキップ
-                    continue
-                
-                quality = result.get("quality")
-                if quality and quality in quality_to_mark:
-                    # 既にこの問題の評価が processed されていない場合のみ追加
-                    if q_id not in [cid for cid, _ in current_cards.items() if any(h.get('quality') == quality for h in _.get('history', []))]:
-                        evaluated_marks.append(quality_to_mark[quality])
-                        cards_with_evaluations += 1
-            
-            total_evaluated = len(evaluated_marks)
-            counter = Counter(evaluated_marks)
+            # カード更新時のみ再集計
+            summary = get_evaluation_summary(cards)
+            total_evaluated = summary["total"]
+            counter = summary["counter"]
 
             with st.expander("自己評価の分布", expanded=True):
                 st.markdown(f"**合計評価数：{total_evaluated}問**")
@@ -887,38 +988,11 @@ class DentalApp:
                     st.info("まだ評価された問題がありません。")
 
             with st.expander("最近の評価ログ", expanded=False):
-                # 学習履歴があるカードを取得
-                cards_with_history = []
-                for q_num, card in st.session_state.cards.items():
-                    history = card.get('history', [])
-                    if history and len(history) > 0:
-                        last_history = history[-1]
-                        # qualityとtimestampがある履歴のみ有効
-                        if last_history.get('quality') and last_history.get('timestamp'):
-                            cards_with_history.append((q_num, card))
-                
-                if cards_with_history:
-                    # タイムスタンプでソート（最新順）
-                    def get_timestamp_for_sort(item):
-                        try:
-                            last_history = item[1]['history'][-1]
-                            timestamp = last_history.get('timestamp')
-                            
-                            if hasattr(timestamp, 'isoformat'):
-                                return timestamp.isoformat()
-                            elif isinstance(timestamp, str):
-                                return timestamp
-                            else:
-                                return "1970-01-01T00:00:00"
-                        except Exception:
-                            return "1970-01-01T00:00:00"
-                    
-                    sorted_cards = sorted(cards_with_history, key=get_timestamp_for_sort, reverse=True)
-                    
-                    for q_num, card in sorted_cards[:10]:
+                if summary["recent"]:
+                    for q_num, card in summary["recent"]:
                         last_history = card['history'][-1]
                         quality = last_history.get('quality')
-                        eval_mark = quality_to_mark.get(quality, "?")
+                        eval_mark = QUALITY_TO_MARK.get(quality, "?")
                         
                         # タイムスタンプ表示
                         timestamp = last_history.get('timestamp')
@@ -973,17 +1047,17 @@ class DentalApp:
             with col1:
                 if st.button("ログアウト", key="logout_btn"):
                     uid = st.session_state.get("uid")
-                    save_user_data(uid, session_state=st.session_state)
+                    save_user_data(uid, session_state=st.session_state, force_session_save=True)
                     self._handle_logout_real(keep_password)
             with col2:
                 if st.button("完全ログアウト", key="full_logout_btn", help="パスワード情報も含めて完全にログアウト"):
                     uid = st.session_state.get("uid")
-                    save_user_data(uid, session_state=st.session_state)
+                    save_user_data(uid, session_state=st.session_state, force_session_save=True)
                     self._handle_logout_real(False)
         else:
             if st.button("ログアウト", key="logout_btn"):
                 uid = st.session_state.get("uid")
-                save_user_data(uid, session_state=st.session_state)
+                save_user_data(uid, session_state=st.session_state, force_session_save=True)
                 self._handle_logout_real(True)
 
     def _render_session_status(self):
@@ -1186,6 +1260,7 @@ class DentalApp:
         if uid:
             log_to_ga("logout", uid, {"keep_password": str(keep_password)})
         
+        finish_firestore_usage_session()
         self.auth_manager.logout()
         
         # パスワード情報の処理
@@ -1247,16 +1322,18 @@ class DentalApp:
     def _render_main_content(self):
         """メインコンテンツの描画（ページ選択対応）"""
         current_page = st.session_state.get("page", "練習")
+        perf_metrics.set_rerun_label(current_page)
         
-        if current_page == "ランキング":
-            render_updated_ranking_page()
-        elif current_page == "検索・進捗":
-            
-            # 遅延インポートで初回ロード高速化
-            from modules.search_page import render_search_page
-            render_search_page()
-        else:
-            render_practice_page(self.auth_manager)
+        with perf_metrics.span(f"page.{current_page}"):
+            if current_page == "ランキング":
+                render_updated_ranking_page()
+            elif current_page == "検索・進捗":
+                
+                # 遅延インポートで初回ロード高速化
+                from modules.search_page import render_search_page
+                render_search_page()
+            else:
+                render_practice_page(self.auth_manager)
     
     def _handle_login(self, email: str, password: str, save_password: bool):
         """ログイン処理（パスワード保存機能付き）"""
@@ -1298,6 +1375,9 @@ class DentalApp:
                         "password_saved": str(save_password)
                     })
                 
+                # プロフィールと権限を1回のバッチ読み取りでキャッシュ
+                prefetch_user_context(st.session_state.get("uid"))
+                
                 # 科目の初期化（ログイン後にユーザー権限を反映）
                 self._initialize_available_subjects()
                 
@@ -1325,6 +1405,8 @@ class DentalApp:
                 uid = st.session_state.get("uid")
                 if uid:
                     log_to_ga("login", uid, {"method": "quick_login"})
+                    # プロフィールと権限を1回のバッチ読み取りでキャッシュ
+                    prefetch_user_context(uid)
                 
                 # 科目の初期化
                 self._initialize_available_subjects()
@@ -1392,8 +1474,33 @@ def main():
     #     # 初回初期化時にページビューを追跡
     #     enhanced_ga.track_page_view('main_app', '歯科国家試験対策アプリ')
     
-    app = DentalApp()
-    app.run()
+    # Firestore使用量はセッション単位と再実行単位の両方で集計
+    session_usage = st.session_state.get(FIRESTORE_SESSION_USAGE_KEY)
+    if session_usage is None:
+        session_usage = firestore_usage.UsageCounter("session")
+        st.session_state[FIRESTORE_SESSION_USAGE_KEY] = session_usage
+    rerun_usage = firestore_usage.UsageCounter(
+        "rerun", read_budget=firestore_usage.FIRESTORE_RERUN_READ_BUDGET
+    )
+    
+    perf_metrics.begin_rerun()
+    try:
+        with firestore_usage.track(session_usage), firestore_usage.track(rerun_usage):
+            app = DentalApp()
+            app.run()
+            
+            # 再実行ごとにバッファ済みのAnalyticsイベントを1回だけ送信
+            AnalyticsUtils.flush_events()
+    finally:
+        # st.rerun() による中断時も計測を確定する
+        uid = st.session_state.get("uid", "")
+        session_usage.scope_id = session_usage.scope_id or uid
+        rerun_usage.scope_id = f"{uid}:{st.session_state.get('page', '練習')}"
+        firestore_usage.check_budget(rerun_usage)
+        # ログアウトせずに閉じられたセッションの分も残るよう途中経過を追記（同じ id で上書き扱い）
+        firestore_usage.persist(session_usage)
+        perf_metrics.end_rerun()
+        perf_metrics.maybe_dump_metrics()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,173 @@
+"""
+構造化ログ
+
+バッチジョブ（ランキング更新など）の print を置き換えるためのログ機能。
+標準の logging をベースに、以下を1か所で設定する。
+
+- 遅延フォーマット: logger.debug("ユーザー %s: %d件", uid, n) の形式で書き、
+  レベルが無効なら文字列を組み立てない。集計自体が重い場合は
+  logger.isEnabledFor(logging.DEBUG) で囲む
+- モジュール別レベル: configure_logging(module_levels={"ranking_calculator": "DEBUG"})
+  または環境変数 APP_LOG_LEVELS="ranking_calculator=DEBUG,ranking_updater=INFO"
+- レート制限: 同じメッセージテンプレートは LOG_RATE_LIMIT_WINDOW 秒あたり
+  LOG_RATE_LIMIT_BURST 件まで出力し、抑制した件数を次の出力に付記する
+- JSON Lines 出力: jsonl_path（または環境変数 APP_LOG_JSONL）に1行1レコードで追記。
+  logger.info("...", extra={"data": {...}}) の data もそのまま出力される
+"""
+
+import datetime
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+ROOT_LOGGER_NAME = "dental_app"
+
+DEFAULT_LOG_LEVEL = os.environ.get("APP_LOG_LEVEL", "INFO")
+
+# 同じメッセージテンプレートの出力上限（window 秒あたり burst 件）
+LOG_RATE_LIMIT_WINDOW = 60.0
+LOG_RATE_LIMIT_BURST = 20
+
+_configure_lock = threading.Lock()
+_configured = False
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    同じ (ロガー, レベル, テンプレート) のレコードを一定件数に制限
+
+    コンソールと JSONL の両方のハンドラに同じインスタンスを付けるため、判定結果はレコードに
+    保存し、2つ目以降のハンドラはそれを使う（1レコードを1件として数える）。
+    """
+
+    def __init__(self, window: float = LOG_RATE_LIMIT_WINDOW, burst: int = LOG_RATE_LIMIT_BURST):
+        super().__init__()
+        self.window = window
+        self.burst = burst
+        self._state: Dict[tuple, list] = {}  # key -> [window_start, emitted, suppressed]
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        # エラー以上は常に出力
+        if record.levelno >= logging.ERROR:
+            return True
+
+        decided = getattr(record, "_rate_limited", None)
+        if decided is not None:
+            return not decided
+
+        key = (record.name, record.levelno, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            state = self._state.get(key)
+            if state is None or now - state[0] >= self.window:
+                suppressed = state[2] if state else 0
+                self._state[key] = [now, 1, 0]
+            elif state[1] < self.burst:
+                state[1] += 1
+                suppressed = 0
+            else:
+                state[2] += 1
+                record._rate_limited = True
+                return False
+
+        record._rate_limited = False
+        record.suppressed = suppressed
+        return True
+
+
+class ConsoleFormatter(logging.Formatter):
+    """従来の print と同じ "[LEVEL] メッセージ" 形式"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        message = f"[{record.levelname}] {record.getMessage()}"
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            message += f" （同種のログ {suppressed}件を抑制）"
+        if record.exc_info:
+            message += "\n" + self.formatException(record.exc_info)
+        return message
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """1レコード1行のJSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        data = getattr(record, "data", None)
+        if data:
+            payload["data"] = data
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            payload["suppressed"] = suppressed
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+def _parse_module_levels(spec: str) -> Dict[str, str]:
+    """"a=DEBUG,b=WARNING" → {"a": "DEBUG", "b": "WARNING"}"""
+    levels = {}
+    for item in spec.split(","):
+        if "=" in item:
+            name, level = item.split("=", 1)
+            if name.strip():
+                levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def configure_logging(level: Optional[str] = None,
+                      module_levels: Optional[Dict[str, str]] = None,
+                      jsonl_path: Optional[str] = None,
+                      console: bool = True,
+                      rate_limit: bool = True) -> logging.Logger:
+    """アプリ共通のロガーを設定（再設定すると既存のハンドラは置き換える）"""
+    global _configured
+    with _configure_lock:
+        root = logging.getLogger(ROOT_LOGGER_NAME)
+        root.setLevel((level or DEFAULT_LOG_LEVEL).upper())
+        root.propagate = False
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+            handler.close()
+
+        rate_filter = RateLimitFilter() if rate_limit else None
+
+        if console:
+            handler = logging.StreamHandler()
+            handler.setFormatter(ConsoleFormatter())
+            if rate_filter:
+                handler.addFilter(rate_filter)
+            root.addHandler(handler)
+
+        jsonl_path = jsonl_path or os.environ.get("APP_LOG_JSONL", "")
+        if jsonl_path:
+            os.makedirs(os.path.dirname(os.path.abspath(jsonl_path)), exist_ok=True)
+            handler = logging.FileHandler(jsonl_path, encoding="utf-8")
+            handler.setFormatter(JsonLinesFormatter())
+            if rate_filter:
+                handler.addFilter(rate_filter)
+            root.addHandler(handler)
+
+        levels = _parse_module_levels(os.environ.get("APP_LOG_LEVELS", ""))
+        levels.update(module_levels or {})
+        for name, module_level in levels.items():
+            logging.getLogger(f"{ROOT_LOGGER_NAME}.{name}").setLevel(module_level.upper())
+
+        _configured = True
+        return root
+
+
+def get_logger(name: str) -> logging.Logger:
+    """モジュール用のロガーを取得（未設定なら既定値で設定する）"""
+    if not _configured:
+        configure_logging()
+    return logging.getLogger(f"{ROOT_LOGGER_NAME}.{name}")
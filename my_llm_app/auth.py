@@ -13,6 +13,11 @@ import datetime
 import time
 from typing import Optional, Dict, Any
 
+try:
+    from perf_metrics import timed
+except ImportError:
+    from .perf_metrics import timed
+
 # Cookie関連のインポート（オプショナル）
 try:
     from streamlit_cookies_manager import EncryptedCookieManager
@@ -118,6 +123,7 @@ class AuthManager:
         except requests.exceptions.RequestException as e:
             return {"error": {"message": f"Network error: {str(e)}"}}
     
+    @timed("auth.signin")
     def signin(self, email: str, password: str) -> Dict[str, Any]:
         """Firebase認証（uid統一版）"""
         self._ensure_api_key()
@@ -131,7 +137,6 @@ class AuthManager:
         except Exception:
             pass
         
-        start = time.time()
         payload = {"email": email, "password": password, "returnSecureToken": True}
         
         try:
@@ -0,0 +1,228 @@
+"""
+学習カードのローカルキャッシュ（SQLite・読み取りスルー）
+
+ログインのたびに study_cards を全件ダウンロードしないよう、カードを同じホストの
+SQLite ファイルに (uid, 問題ID) 単位で保持し、ユーザーごとの更新時刻の最大値（high-water mark）
+以降に更新されたカードだけを Firestore から取得する。
+
+- WAL モードのため、複数の Streamlit ワーカープロセスが同じファイルを同時に読み書きできる
+  （書き込みは BEGIN IMMEDIATE で直列化し、古い更新時刻での上書きはしない）
+- 差分取得は FirestoreManager.get_user_card_docs_since（modified_at の数秒の重複を含む）
+- 削除されたカードや modified_at のない旧カードの変更は差分に現れないため、
+  CARD_CACHE_FULL_SYNC_HOURS ごとに全件取得してそのユーザーの行を入れ替える
+- SQLite が使えない場合（読み取り専用のファイルシステムなど）は Firestore から直接全件取得する
+
+保存するのは Firestore のドキュメント内容（変換前）で、日時はタグ付きの JSON にする。
+"""
+
+import datetime
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+_APP_DIR = os.path.dirname(os.path.abspath(__file__))
+CARD_CACHE_PATH = os.environ.get("CARD_CACHE_PATH", os.path.join(_APP_DIR, "cache", "user_cards.sqlite3"))
+# この時間が経過したユーザーは差分ではなく全件を取得し直す
+CARD_CACHE_FULL_SYNC_HOURS = 24
+# この期間ログインのないユーザーの行は削除する
+CARD_CACHE_RETENTION_DAYS = 30
+# 他プロセスの書き込み待ちの上限（ミリ秒）
+_BUSY_TIMEOUT_MS = 5000
+# カードの更新時刻フィールド（firestore_db.CARD_MODIFIED_FIELD）
+_MODIFIED_FIELD = "modified_at"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cards (
+    uid TEXT NOT NULL,
+    qid TEXT NOT NULL,
+    data TEXT NOT NULL,
+    modified_at REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (uid, qid)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS sync_state (
+    uid TEXT PRIMARY KEY,
+    high_water REAL NOT NULL,
+    full_synced_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+"""
+
+# 差分取得関数: since（None は全件）→ ({問題ID: ドキュメント内容}, 次回のカーソル)
+FetchChanges = Callable[[Optional[datetime.datetime]], Tuple[Dict[str, Any], Optional[datetime.datetime]]]
+
+
+def _json_default(obj):
+    if isinstance(obj, datetime.datetime):
+        return {"__dt__": obj.isoformat()}
+    if isinstance(obj, datetime.date):
+        return {"__date__": obj.isoformat()}
+    return str(obj)
+
+
+def _json_object_hook(obj):
+    if len(obj) == 1:
+        if "__dt__" in obj:
+            return datetime.datetime.fromisoformat(obj["__dt__"])
+        if "__date__" in obj:
+            return datetime.date.fromisoformat(obj["__date__"])
+    return obj
+
+
+def encode_card(data: Dict[str, Any]) -> str:
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=_json_default)
+
+
+def decode_card(text: str) -> Dict[str, Any]:
+    return json.loads(text, object_hook=_json_object_hook)
+
+
+def _epoch(value: Any) -> float:
+    """日時 → エポック秒（日時でなければ 0）"""
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=datetime.timezone.utc)
+        return value.timestamp()
+    return 0.0
+
+
+def _from_epoch(value: Optional[float]) -> Optional[datetime.datetime]:
+    if not value:
+        return None
+    return datetime.datetime.fromtimestamp(value, tz=datetime.timezone.utc)
+
+
+class CardCache:
+    """SQLite のカードキャッシュ（接続はスレッドごと）"""
+
+    def __init__(self, path: str = CARD_CACHE_PATH):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._connection().executescript(_SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # 自動トランザクションは使わず、書き込みは BEGIN IMMEDIATE で明示する
+            conn = sqlite3.connect(self.path, timeout=_BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA busy_timeout={_BUSY_TIMEOUT_MS}")
+            self._local.conn = conn
+        return conn
+
+    def sync_state(self, uid: str) -> Tuple[Optional[datetime.datetime], float]:
+        """(high-water mark, 最後に全件取得した時刻のエポック秒)。未同期なら (None, 0)"""
+        row = self._connection().execute(
+            "SELECT high_water, full_synced_at FROM sync_state WHERE uid = ?", (uid,)
+        ).fetchone()
+        if row is None:
+            return None, 0.0
+        return _from_epoch(row[0]), row[1]
+
+    def load(self, uid: str) -> Dict[str, Dict[str, Any]]:
+        rows = self._connection().execute("SELECT qid, data FROM cards WHERE uid = ?", (uid,))
+        return {qid: decode_card(data) for qid, data in rows}
+
+    def apply(self, uid: str, docs: Dict[str, Dict[str, Any]], cursor: Optional[datetime.datetime],
+              full: bool = False):
+        """取得したカードを反映（full=True ならそのユーザーの行を入れ替える）"""
+        now = time.time()
+        rows = [(uid, qid, encode_card(data), _epoch(data.get(_MODIFIED_FIELD))) for qid, data in docs.items()]
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if full:
+                conn.execute("DELETE FROM cards WHERE uid = ?", (uid,))
+            # 他プロセスがより新しいカードを書き込んでいれば上書きしない
+            conn.executemany(
+                "INSERT INTO cards (uid, qid, data, modified_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (uid, qid) DO UPDATE SET data = excluded.data, modified_at = excluded.modified_at "
+                "WHERE excluded.modified_at >= cards.modified_at",
+                rows,
+            )
+            conn.execute(
+                "INSERT INTO sync_state (uid, high_water, full_synced_at, accessed_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (uid) DO UPDATE SET "
+                "high_water = CASE WHEN ? THEN excluded.high_water ELSE MAX(high_water, excluded.high_water) END, "
+                "full_synced_at = CASE WHEN ? THEN excluded.full_synced_at ELSE full_synced_at END, "
+                "accessed_at = excluded.accessed_at",
+                (uid, _epoch(cursor), now if full else 0.0, now, full, full),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def invalidate(self, uid: str):
+        """ユーザーのキャッシュを破棄（次回は全件取得）"""
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM cards WHERE uid = ?", (uid,))
+            conn.execute("DELETE FROM sync_state WHERE uid = ?", (uid,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def prune(self, retention_days: int = CARD_CACHE_RETENTION_DAYS) -> int:
+        """しばらくログインのないユーザーの行を削除し、削除したユーザー数を返す"""
+        threshold = time.time() - retention_days * 86400
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            uids = [row[0] for row in conn.execute("SELECT uid FROM sync_state WHERE accessed_at < ?", (threshold,))]
+            for uid in uids:
+                conn.execute("DELETE FROM cards WHERE uid = ?", (uid,))
+                conn.execute("DELETE FROM sync_state WHERE uid = ?", (uid,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return len(uids)
+
+    def read_through(self, uid: str, fetch_changes: FetchChanges) -> Dict[str, Dict[str, Any]]:
+        """キャッシュ済みのカードに Firestore の差分を反映して全カードを返す"""
+        high_water, full_synced_at = self.sync_state(uid)
+        full = high_water is None or time.time() - full_synced_at > CARD_CACHE_FULL_SYNC_HOURS * 3600
+        docs, cursor = fetch_changes(None if full else high_water)
+        self.apply(uid, docs, cursor, full=full)
+        return self.load(uid)
+
+
+_cache: Optional[CardCache] = None
+_cache_lock = threading.Lock()
+_cache_failed = False
+
+
+def get_card_cache() -> Optional[CardCache]:
+    """プロセス共通の CardCache（作成できない場合は None）"""
+    global _cache, _cache_failed
+    if _cache is None and not _cache_failed:
+        with _cache_lock:
+            if _cache is None and not _cache_failed:
+                try:
+                    _cache = CardCache()
+                    pruned = _cache.prune()
+                    if pruned:
+                        print(f"[INFO] カードキャッシュ: {pruned}ユーザー分の古いデータを削除")
+                except Exception as e:
+                    print(f"[WARNING] カードキャッシュを使用できません: {e}")
+                    _cache_failed = True
+    return _cache
+
+
+def read_through(uid: str, fetch_changes: FetchChanges) -> Dict[str, Dict[str, Any]]:
+    """ユーザーの全カード（ドキュメント内容）を取得。キャッシュが使えない場合は全件取得"""
+    cache = get_card_cache()
+    if cache is not None:
+        try:
+            return cache.read_through(uid, fetch_changes)
+        except sqlite3.Error as e:
+            print(f"[WARNING] カードキャッシュエラー（全件取得に切り替え）: {e}")
+    docs, _ = fetch_changes(None)
+    return docs
@@ -0,0 +1,210 @@
+"""
+AI解説のキャッシュ
+
+(問題番号, プロンプトテンプレートのバージョン, モデル) をキーに、生成済みの解説を
+ローカルディスクと（任意で）Firestore の llm_feedback コレクションに保存する。
+
+- 同じ問題への同時リクエストは1回の生成を共有する（single-flight）
+- run_explanation_pregeneration.py で問題全体を事前生成しておくと、
+  アプリでのクリックはほぼキャッシュヒットになる
+"""
+
+import datetime
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional, Tuple
+
+import pytz
+
+JST = pytz.timezone('Asia/Tokyo')
+
+# キャッシュ保存先（環境変数で変更可能）
+EXPLANATION_CACHE_DIR = os.environ.get(
+    "EXPLANATION_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "explanations")
+)
+
+# llm_feedback コレクション内でキャッシュ用ドキュメントを識別するための値
+EXPLANATION_CACHE_UID = "system"
+EXPLANATION_CACHE_KIND = "explanation_cache"
+
+
+def _cache_key(question_id: str, template_version: str, model: str) -> str:
+    """キャッシュキー（ファイル名・ドキュメントIDに使える文字列）"""
+    raw = f"{question_id}\u0000{template_version}\u0000{model}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class ExplanationStore:
+    """ディスク＋Firestoreの2段キャッシュ（同一キーの生成は1回に集約）"""
+
+    def __init__(self, cache_dir: str = EXPLANATION_CACHE_DIR, use_firestore: bool = True):
+        self.cache_dir = cache_dir
+        self.use_firestore = use_firestore
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    # --- ディスク ---
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def _read_disk(self, key: str) -> Optional[str]:
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                return json.load(f).get("text")
+        except (OSError, ValueError):
+            return None
+
+    def _write_disk(self, key: str, record: Dict[str, str]):
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # 書き込み途中のファイルを読まれないように一時ファイル経由で置き換え
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(record, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"[WARNING] 解説キャッシュ書き込みエラー: {e}")
+
+    # --- Firestore（llm_feedback） ---
+    def _firestore_doc(self, key: str):
+        try:
+            from firestore_db import get_firestore_manager
+        except ImportError:
+            from .firestore_db import get_firestore_manager
+        return get_firestore_manager().db.collection("llm_feedback").document(f"{EXPLANATION_CACHE_KIND}_{key}")
+
+    def _read_firestore(self, key: str) -> Optional[str]:
+        if not self.use_firestore:
+            return None
+        try:
+            doc = self._firestore_doc(key).get()
+            if doc.exists:
+                return (doc.to_dict() or {}).get("generated_text")
+        except Exception as e:
+            print(f"[WARNING] 解説キャッシュ読み込みエラー（Firestore）: {e}")
+        return None
+
+    def _write_firestore(self, key: str, record: Dict[str, str]):
+        if not self.use_firestore:
+            return
+        try:
+            self._firestore_doc(key).set({
+                "uid": EXPLANATION_CACHE_UID,
+                "question_id": record["question_id"],
+                "generated_text": record["text"],
+                "user_rating": 0,
+                "metadata": {
+                    "kind": EXPLANATION_CACHE_KIND,
+                    "template_version": record["template_version"],
+                    "model": record["model"],
+                },
+                "created_at": record["created_at"],
+            })
+        except Exception as e:
+            print(f"[WARNING] 解説キャッシュ書き込みエラー（Firestore）: {e}")
+
+    # --- 公開API ---
+    def get(self, question_id: str, template_version: str, model: str) -> Optional[str]:
+        """キャッシュ済みの解説を取得（ディスク → Firestore の順）"""
+        key = _cache_key(question_id, template_version, model)
+        text = self._read_disk(key)
+        if text is not None:
+            return text
+
+        text = self._read_firestore(key)
+        if text is not None:
+            # 次回以降はディスクから返す
+            self._write_disk(key, {
+                "question_id": question_id, "template_version": template_version,
+                "model": model, "text": text, "created_at": datetime.datetime.now(JST).isoformat(),
+            })
+        return text
+
+    def put(self, question_id: str, template_version: str, model: str, text: str):
+        """解説をキャッシュに保存"""
+        key = _cache_key(question_id, template_version, model)
+        record = {
+            "question_id": question_id,
+            "template_version": template_version,
+            "model": model,
+            "text": text,
+            "created_at": datetime.datetime.now(JST).isoformat(),
+        }
+        self._write_disk(key, record)
+        self._write_firestore(key, record)
+
+    def claim(self, question_id: str, template_version: str, model: str) -> Tuple[Future, bool]:
+        """
+        生成の実行権を取得（single-flight）
+
+        Returns:
+            (Future, owner)。owner=True なら呼び出し側が生成し、必ず release する。
+            owner=False なら Future の結果（別リクエストの生成結果）を待つ
+        """
+        key = _cache_key(question_id, template_version, model)
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                return future, False
+            future = Future()
+            self._inflight[key] = future
+
+        # 直前に別スレッドの生成が完了していればそれを使う
+        text = self._read_disk(key)
+        if text is not None:
+            self.release(question_id, template_version, model, future, text=text)
+            return future, False
+        return future, True
+
+    def release(self, question_id: str, template_version: str, model: str, future: Future,
+                text: Optional[str] = None, error: Optional[BaseException] = None):
+        """claim した生成を完了し、待機中のリクエストに結果（または例外）を渡す"""
+        key = _cache_key(question_id, template_version, model)
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(text)
+
+    def get_or_generate(self, question_id: str, template_version: str, model: str,
+                        generate: Callable[[], str]) -> str:
+        """キャッシュになければ生成。同じキーの同時リクエストは1回の生成結果を共有する"""
+        cached = self.get(question_id, template_version, model)
+        if cached is not None:
+            return cached
+
+        future, owner = self.claim(question_id, template_version, model)
+        if not owner:
+            return future.result()
+
+        try:
+            text = generate()
+            if text:
+                self.put(question_id, template_version, model, text)
+        except Exception as e:
+            self.release(question_id, template_version, model, future, error=e)
+            raise
+        self.release(question_id, template_version, model, future, text=text)
+        return text
+
+
+_store: Optional[ExplanationStore] = None
+_store_lock = threading.Lock()
+
+
+def get_explanation_store() -> ExplanationStore:
+    """プロセス共通の ExplanationStore を取得"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ExplanationStore()
+    return _store
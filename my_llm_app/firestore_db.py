@@ -14,13 +14,48 @@ import datetime
 import time
 import tempfile
 import os
+import copy
+import threading
 import collections.abc
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Tuple
 import firebase_admin
 from firebase_admin import credentials, firestore, storage
 from google.cloud.firestore_v1 import FieldFilter
 from google.cloud import firestore as gcp_firestore
 
+try:
+    from session_queue import decode_session_document, diff_session_state, session_document
+except ImportError:
+    from .session_queue import decode_session_document, diff_session_state, session_document
+
+try:
+    from perf_metrics import timed
+except ImportError:
+    from .perf_metrics import timed
+
+try:
+    from firestore_usage import CountingClient
+except ImportError:
+    from .firestore_usage import CountingClient
+
+try:
+    import review_log
+except ImportError:
+    from . import review_log
+
+# プロフィール・権限ドキュメントのプロセス内キャッシュ有効期間（秒）
+USER_DOC_CACHE_TTL = 300
+# 権限一覧のページ取得サイズ（管理画面・一括取得用）
+PERMISSIONS_PAGE_SIZE = 300
+# セッション状態保存の間引き間隔（秒）。間引くのは出題位置だけの更新（SESSION_THROTTLED_FIELDS）で、
+# 解答記録・キューの入れ替えと force=True の保存は常に即時書き込み
+SESSION_SAVE_DEBOUNCE_SECONDS = 15
+SESSION_THROTTLED_FIELDS = frozenset({"queue_head", "current_q_group"})
+# カードの最終更新時刻（サーバー時刻）。差分同期のカーソルに使う
+CARD_MODIFIED_FIELD = "modified_at"
+# 差分同期で前回カーソルより少し前から取り直す幅（秒）。書き込みと読み取りの競合対策
+CARD_SYNC_OVERLAP_SECONDS = 5
+
 
 class FirestoreManager:
     """Firestoreデータベース操作を管理するクラス"""
@@ -28,6 +63,12 @@ class FirestoreManager:
     def __init__(self):
         self.db = None
         self.bucket = None
+        # (種別, uid) -> (有効期限, ドキュメント内容 or None)
+        self._user_doc_cache: Dict[Tuple[str, str], Tuple[float, Optional[Dict[str, Any]]]] = {}
+        self._user_doc_cache_lock = threading.Lock()
+        # uid -> (最終書き込み時刻, 保存済みセッション状態のスナップショット)
+        self._session_snapshots: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+        self._session_lock = threading.Lock()
         self._initialize_firebase()
     
     def _initialize_firebase(self):
@@ -64,7 +105,8 @@ class FirestoreManager:
                     except ValueError:
                         app = firebase_admin.initialize_app()  # Use Default Credentials
 
-                self.db = firestore.client(app=app)
+                # 読み書き件数を集計するラッパー経由で利用
+                self.db = CountingClient(firestore.client(app=app))
                 try:
                     self.bucket = storage.bucket(app=app)
                 except Exception:
@@ -78,7 +120,7 @@ class FirestoreManager:
                         pass
         else:
             # 既に初期化済みの場合は既存のクライアントを取得
-            self.db = firestore.client()
+            self.db = CountingClient(firestore.client())
             try:
                 self.bucket = storage.bucket()
             except Exception:
@@ -107,20 +149,75 @@ class FirestoreManager:
         b = b.replace("gs://", "").split("/")[0]
         return b
     
-    def load_user_profile(self, uid: str) -> Dict[str, Any]:
-        """ユーザーの基本プロフィール情報のみを高速読み込み（uid統一版）"""
-        start = time.time()
+    def _get_cached_user_doc(self, kind: str, uid: str):
+        """キャッシュ済みのユーザードキュメントを取得（未キャッシュ・期限切れはKeyError）"""
+        with self._user_doc_cache_lock:
+            expires_at, data = self._user_doc_cache[(kind, uid)]
+            if expires_at < time.time():
+                del self._user_doc_cache[(kind, uid)]
+                raise KeyError((kind, uid))
+        return copy.deepcopy(data)
+    
+    def _set_cached_user_doc(self, kind: str, uid: str, data: Optional[Dict[str, Any]]):
+        """ユーザードキュメントをキャッシュ（存在しない場合はNoneを保存）"""
+        with self._user_doc_cache_lock:
+            self._user_doc_cache[(kind, uid)] = (time.time() + USER_DOC_CACHE_TTL, copy.deepcopy(data))
+    
+    def invalidate_user_cache(self, uid: str, kind: Optional[str] = None):
+        """ユーザーのプロフィール・権限キャッシュを破棄（kind未指定時は両方）"""
+        kinds = [kind] if kind else ["profile", "permissions"]
+        with self._user_doc_cache_lock:
+            for k in kinds:
+                self._user_doc_cache.pop((k, uid), None)
+    
+    def prefetch_user_context(self, uid: str) -> Tuple[Optional[Dict[str, Any]], Dict[str, bool]]:
+        """ログイン時にプロフィールと権限ドキュメントを1回のバッチ読み取りで取得してキャッシュ"""
+        if not uid:
+            return None, {}
         
+        try:
+            profile_ref = self.db.collection("users").document(uid)
+            permissions_ref = self.db.collection("user_permissions").document(uid)
+            docs = {doc.reference.path: doc for doc in self.db.get_all([profile_ref, permissions_ref])}
+            
+            profile_doc = docs.get(profile_ref.path)
+            permissions_doc = docs.get(permissions_ref.path)
+            profile = profile_doc.to_dict() if profile_doc and profile_doc.exists else None
+            permissions = (permissions_doc.to_dict() or {}) if permissions_doc and permissions_doc.exists else {}
+            
+            self._set_cached_user_doc("profile", uid, profile)
+            self._set_cached_user_doc("permissions", uid, permissions)
+            return profile, permissions
+        except Exception as e:
+            print(f"[ERROR] ユーザー情報の事前読み込みエラー: {e}")
+            return None, {}
+    
+    def get_user_profile_doc(self, uid: str) -> Optional[Dict[str, Any]]:
+        """/users/{uid} をキャッシュ経由で取得（存在しない場合はNone）"""
+        if not uid:
+            return None
+        
+        try:
+            return self._get_cached_user_doc("profile", uid)
+        except KeyError:
+            pass
+        
+        doc = self.db.collection("users").document(uid).get(timeout=5)
+        data = doc.to_dict() if doc.exists else None
+        self._set_cached_user_doc("profile", uid, data)
+        return data
+    
+    @timed("firestore.load_user_profile")
+    def load_user_profile(self, uid: str) -> Dict[str, Any]:
+        """ユーザーの基本プロフィール情報のみを高速読み込み（uid統一版・キャッシュ対応）"""
         if not uid:
             return {"email": "", "settings": {"new_cards_per_day": 10}}
         
         try:
             # /users/{uid} から基本プロフィールのみ読み込み
-            doc_ref = self.db.collection("users").document(uid)
-            doc = doc_ref.get(timeout=5)
+            data = self.get_user_profile_doc(uid)
             
-            if doc.exists:
-                data = doc.to_dict()
+            if data is not None:
                 return data
             else:
                 # 新規ユーザーのデフォルトプロフィール作成
@@ -129,19 +226,21 @@ class FirestoreManager:
                     "email": email,
                     "uid": uid,  # UIDを明示的に保存
                     "createdAt": datetime.datetime.utcnow().isoformat(),
-                    "settings": {"new_cards_per_day": 10}
+                    "settings": {"new_cards_per_day": 10},
+                    # 新規ユーザーは最初からイベントログに全履歴が記録される
+                    review_log.REVIEW_LOG_COMPLETE_FIELD: True
                 }
-                doc_ref.set(default_profile)
+                self.db.collection("users").document(uid).set(default_profile)
+                self._set_cached_user_doc("profile", uid, default_profile)
                 return default_profile
                 
         except Exception as e:
             print(f"[ERROR] ユーザープロフィール読み込みエラー: {e}")
             return {"email": "", "settings": {"new_cards_per_day": 10}}
     
+    @timed("firestore.load_user_cards")
     def load_user_cards(self, uid: str) -> Dict[str, Any]:
         """ユーザーのカードデータを読み込み（uid統一版）"""
-        start = time.time()
-        
         if not uid:
             return {}
         
@@ -159,10 +258,9 @@ class FirestoreManager:
             print(f"[ERROR] カードデータ読み込みエラー: {e}")
             return {}
     
+    @timed("firestore.load_session_state")
     def load_session_state(self, uid: str) -> Dict[str, Any]:
         """セッション状態を読み込み（uid統一版）"""
-        start = time.time()
-        
         if not uid:
             return {
                 "main_queue": [],
@@ -175,26 +273,13 @@ class FirestoreManager:
             session_doc = session_ref.get(timeout=5)
             
             if session_doc.exists:
-                session_data = session_doc.to_dict()
-                
-                # Firestore対応：JSON文字列を元のリスト形式に復元
-                def deserialize_queue(queue):
-                    deserialized = []
-                    for item in queue:
-                        try:
-                            if isinstance(item, str):
-                                deserialized.append(json.loads(item))
-                            elif isinstance(item, list):
-                                deserialized.append(item)
-                        except (json.JSONDecodeError, TypeError):
-                            continue
-                    return deserialized
-                
-                result = {
-                    "current_q_group": deserialize_queue(session_data.get("current_q_group", [])),
-                    "main_queue": deserialize_queue(session_data.get("main_queue", [])),
-                    "short_term_review_queue": session_data.get("short_term_review_queue", [])
-                }
+                # 新形式・旧形式の両方から復元し、次回保存の差分比較用に保持
+                result, snapshot = decode_session_document(session_doc.to_dict())
+                with self._session_lock:
+                    if snapshot is None:
+                        self._session_snapshots.pop(uid, None)
+                    else:
+                        self._session_snapshots[uid] = (0.0, snapshot)
                 
                 return result
             else:
@@ -212,10 +297,9 @@ class FirestoreManager:
                 "current_q_group": []
             }
     
+    @timed("firestore.get_user_cards")
     def get_user_cards(self, uid: str) -> Dict[str, Any]:
         """ユーザーの学習カードデータを取得（最適化後構造対応版）"""
-        start = time.time()
-        
         if not uid:
             return {}
         
@@ -313,12 +397,78 @@ class FirestoreManager:
             print(f"[ERROR] レガシー構造からの取得も失敗: {e}")
             return {}
     
+    @timed("firestore.get_user_card_docs_since")
+    def get_user_card_docs_since(self, uid: str, since: Optional[datetime.datetime] = None
+                                 ) -> Tuple[Dict[str, Any], Optional[datetime.datetime]]:
+        """
+        前回の同期以降に更新された study_cards のドキュメントを取得（差分同期用）
+        
+        Returns:
+            (問題ID → ドキュメント内容（変換前）, 次回のカーソル)。since が None の場合は全カード。
+            カーソル付近のカードは重複して返ることがあるため、受け取り側は上書きで反映する
+        """
+        if not uid:
+            return {}, since
+        
+        started_at = datetime.datetime.now(datetime.timezone.utc)
+        try:
+            query = self.db.collection("study_cards").where("uid", "==", uid)
+            if since is not None:
+                # uid + modified_at の複合インデックスが必要
+                query = query.where(
+                    CARD_MODIFIED_FIELD, ">", since - datetime.timedelta(seconds=CARD_SYNC_OVERLAP_SECONDS)
+                )
+            
+            docs = {}
+            # 全件取得の場合、更新時刻のない旧カードもあるため取得開始時刻を下限にする
+            cursor = since or started_at
+            for doc in query.get(timeout=10):
+                if not doc.exists:
+                    continue
+                card_data = self._to_dict(doc.to_dict())
+                question_id = card_data.get("question_id") or str(doc.id).split("_", 1)[-1]
+                docs[question_id] = card_data
+                modified_at = card_data.get(CARD_MODIFIED_FIELD)
+                if isinstance(modified_at, datetime.datetime) and modified_at > cursor:
+                    cursor = modified_at
+            return docs, cursor
+            
+        except Exception as e:
+            print(f"[ERROR] カード差分取得エラー: {e}")
+            raise
+    
+    def get_user_cards_since(self, uid: str, since: Optional[datetime.datetime] = None
+                             ) -> Tuple[Dict[str, Any], Optional[datetime.datetime]]:
+        """前回の同期以降に更新されたカードを旧形式で取得（get_user_card_docs_since の変換版）"""
+        docs, cursor = self.get_user_card_docs_since(uid, since)
+        return {qid: self._convert_optimized_card_to_legacy(data) for qid, data in docs.items()}, cursor
+    
+    @timed("firestore.load_review_events")
+    def load_review_events(self, uid: str, start: datetime.date, end: datetime.date) -> Optional[List[Dict[str, Any]]]:
+        """
+        期間内の自己評価イベントを週パーティションから取得
+        
+        イベントログに過去の履歴が揃っていないユーザー・読み込みエラーの場合は None
+        （呼び出し側はカードの history を使う）
+        """
+        if not uid:
+            return None
+        
+        try:
+            if not review_log.is_complete(self.get_user_profile_doc(uid)):
+                return None
+            return review_log.load_events(self.db, uid, start, end)
+        except Exception as e:
+            print(f"[ERROR] 自己評価イベント読み込みエラー: {e}")
+            return None
+    
     def get_cards(self, uid: str) -> Dict[str, Any]:
         """ユーザーの学習カードデータを取得（get_user_cardsのエイリアス）"""
         return self.get_user_cards(uid)
     
-    def save_user_card(self, uid: str, question_id: str, card_data: Dict[str, Any]):
-        """単一カードデータを保存（最適化後構造対応版）"""
+    def save_user_card(self, uid: str, question_id: str, card_data: Dict[str, Any],
+                       review_events: Optional[List[Dict[str, Any]]] = None):
+        """単一カードデータを保存（最適化後構造対応版）。review_events があればイベントログにも同時に追記"""
         if not uid or not question_id:
             return
         
@@ -326,9 +476,21 @@ class FirestoreManager:
             # 旧形式のcard_dataを最適化後の構造に変換
             optimized_card = self._convert_legacy_card_to_optimized(uid, question_id, card_data)
             
+            # 差分同期用の更新時刻（サーバー時刻）
+            optimized_card[CARD_MODIFIED_FIELD] = firestore.SERVER_TIMESTAMP
+            
             # study_cardsコレクションに保存
             card_ref = self.db.collection("study_cards").document(f"{uid}_{question_id}")
-            card_ref.set(optimized_card, merge=True)
+            if not review_events:
+                card_ref.set(optimized_card, merge=True)
+                return
+            
+            # カードと週パーティションへの追記を1回のバッチで書き込む
+            batch = self.db.batch()
+            batch.set(card_ref, optimized_card, merge=True)
+            for ref, data in review_log.partition_writes(self.db, uid, review_events):
+                batch.set(ref, data, merge=True)
+            batch.commit()
         except Exception as e:
             print(f"[ERROR] カード保存エラー: {e}")
     
@@ -377,29 +539,49 @@ class FirestoreManager:
         
         return optimized_card
     
-    def save_session_state(self, uid: str, session_data: Dict[str, Any]):
-        """セッション状態を保存（uid統一版）"""
+    def save_session_state(self, uid: str, session_data: Dict[str, Any], force: bool = False) -> bool:
+        """
+        セッション状態を保存（前回保存からの差分のみ・間引きあり）
+        
+        出題位置だけの更新は前回の書き込みから SESSION_SAVE_DEBOUNCE_SECONDS 以内なら書き込まない。
+        スナップショットは更新しないため、保留した位置は次に書き込むときの差分に含まれる。
+        """
         if not uid:
-            return
+            return False
         
         try:
-            # Firestore対応：ネストした配列をJSON文字列に変換
-            def serialize_queue(queue):
-                return [json.dumps(group) for group in queue]
-
-            serialized_data = {
-                "current_q_group": serialize_queue(session_data.get("current_q_group", [])),
-                "main_queue": serialize_queue(session_data.get("main_queue", [])),
-                "short_term_review_queue": session_data.get("short_term_review_queue", []),
-                "result_log": session_data.get("result_log", {}),
-                "last_updated": datetime.datetime.utcnow().isoformat()
-            }
-            
-            session_ref = self.db.collection("users").document(uid).collection("sessionState").document("current")
-            session_ref.set(serialized_data, merge=True)
+            with self._session_lock:
+                written_at, previous = self._session_snapshots.get(uid, (0.0, None))
+                now = time.time()
+                
+                updates, snapshot = diff_session_state(previous, session_data)
+                if (not force and previous is not None and now - written_at < SESSION_SAVE_DEBOUNCE_SECONDS
+                        and all(key in SESSION_THROTTLED_FIELDS for key in updates)):
+                    return False
+                session_ref = self.db.collection("users").document(uid).collection("sessionState").document("current")
+                last_updated = datetime.datetime.utcnow().isoformat()
+                
+                if previous is None:
+                    # 初回（または旧形式からの移行）は全体を書き込み
+                    session_ref.set({**updates, "last_updated": last_updated})
+                elif updates:
+                    field_updates = {
+                        (gcp_firestore.FieldPath(*key).to_api_repr() if isinstance(key, tuple) else key): value
+                        for key, value in updates.items()
+                    }
+                    field_updates["last_updated"] = last_updated
+                    try:
+                        session_ref.update(field_updates)
+                    except Exception:
+                        # ドキュメントが削除されている場合などは全体を書き直す
+                        session_ref.set({**session_document(snapshot), "last_updated": last_updated})
+                
+                self._session_snapshots[uid] = (now, snapshot)
+                return True
             
         except Exception as e:
             print(f"[ERROR] セッション状態保存エラー: {e}")
+            return False
     
     def update_user_settings(self, uid: str, settings: Dict[str, Any]):
         """ユーザー設定を更新（uid統一版）"""
@@ -415,27 +597,16 @@ class FirestoreManager:
             user_ref.update(settings_update)
         except Exception as e:
             print(f"[ERROR] ユーザー設定更新エラー: {e}")
+        finally:
+            self.invalidate_user_cache(uid, "profile")
     
     def check_user_permission(self, uid: str, permission_key: str) -> bool:
-        """ユーザー権限をチェック（user_permissions コレクション使用）"""
+        """ユーザー権限をチェック（user_permissions コレクション使用・キャッシュ対応）"""
         if not uid:
             return False
         
-        try:
-            # user_permissions コレクションから権限を取得
-            doc_ref = self.db.collection("user_permissions").document(uid)
-            doc = doc_ref.get()
-            
-            if doc.exists:
-                data = doc.to_dict()
-                result = bool(data.get(permission_key, False))
-                return result
-            else:
-                return False
-                
-        except Exception as e:
-            print(f"[ERROR] 権限チェックエラー: {e}")
-            return False
+        permissions = self.get_user_permissions(uid)
+        return bool(permissions.get(permission_key, False))
     
     def grant_user_permission(self, uid: str, permission_key: str, value: bool = True):
         """ユーザーに権限を付与または剥奪"""
@@ -449,33 +620,69 @@ class FirestoreManager:
         except Exception as e:
             print(f"[ERROR] 権限設定エラー: {e}")
             return False
+        finally:
+            self.invalidate_user_cache(uid, "permissions")
     
     def get_user_permissions(self, uid: str) -> Dict[str, bool]:
-        """ユーザーの全権限を取得"""
+        """ユーザーの全権限を取得（キャッシュ対応）"""
         if not uid:
             return {}
         
+        try:
+            return self._get_cached_user_doc("permissions", uid) or {}
+        except KeyError:
+            pass
+        
         try:
             doc_ref = self.db.collection("user_permissions").document(uid)
             doc = doc_ref.get()
             
-            if doc.exists:
-                return doc.to_dict() or {}
-            else:
-                return {}
+            permissions = (doc.to_dict() or {}) if doc.exists else {}
+            self._set_cached_user_doc("permissions", uid, permissions)
+            return permissions
         except Exception as e:
             print(f"[ERROR] 権限取得エラー: {e}")
             return {}
     
-    def list_all_user_permissions(self) -> Dict[str, Dict[str, bool]]:
-        """全ユーザーの権限一覧を取得"""
+    def fetch_user_permissions_page(self, page_size: int = PERMISSIONS_PAGE_SIZE,
+                                    start_after: Optional[str] = None) -> Tuple[Dict[str, Dict[str, bool]], Optional[str]]:
+        """
+        権限一覧をドキュメントID順に1ページ分取得
+        
+        Returns:
+            (uid -> 権限の辞書, 次ページ取得用のカーソル。最終ページならNone)
+        """
+        permissions_ref = self.db.collection("user_permissions")
+        query = permissions_ref.order_by("__name__").limit(page_size)
+        if start_after:
+            query = query.start_after({"__name__": permissions_ref.document(start_after)})
+        
+        docs = list(query.stream())
+        page = {}
+        for doc in docs:
+            data = doc.to_dict() or {}
+            page[doc.id] = data
+            # 一括取得した権限は個別チェックにも再利用する
+            self._set_cached_user_doc("permissions", doc.id, data)
+        
+        next_cursor = docs[-1].id if len(docs) == page_size else None
+        return page, next_cursor
+    
+    def list_all_user_permissions(self, page_size: Optional[int] = None,
+                                  start_after: Optional[str] = None) -> Dict[str, Dict[str, bool]]:
+        """全ユーザーの権限一覧を取得（page_size指定時は start_after 以降の1ページのみ）"""
         try:
-            permissions_ref = self.db.collection("user_permissions")
-            permissions_docs = list(permissions_ref.stream())
+            if page_size:
+                page, _ = self.fetch_user_permissions_page(page_size, start_after)
+                return page
             
             result = {}
-            for doc in permissions_docs:
-                result[doc.id] = doc.to_dict() or {}
+            cursor = start_after
+            while True:
+                page, cursor = self.fetch_user_permissions_page(PERMISSIONS_PAGE_SIZE, cursor)
+                result.update(page)
+                if cursor is None:
+                    break
             
             return result
         except Exception as e:
@@ -701,17 +908,19 @@ def load_user_data_full(uid: str, cache_buster: int = 0) -> Dict[str, Any]:
     }
 
 
-def save_user_data(uid: str, question_id: str = None, updated_card_data: Dict[str, Any] = None, session_state: Dict[str, Any] = None):
+def save_user_data(uid: str, question_id: str = None, updated_card_data: Dict[str, Any] = None, session_state: Dict[str, Any] = None, force_session_save: bool = False):
     """ユーザーデータを保存（uid統一版・最適化）"""
     manager = get_firestore_manager()
     
-    # 単一カードデータの更新
+    # 単一カードデータの更新（最新の自己評価はイベントログにも追記）
     if question_id and updated_card_data:
-        manager.save_user_card(uid, question_id, updated_card_data)
+        history = updated_card_data.get("history") or []
+        event = review_log.event_from_history(question_id, history[-1]) if history else None
+        manager.save_user_card(uid, question_id, updated_card_data, review_events=[event] if event else None)
     
-    # セッション状態保存
+    # セッション状態保存（差分のみ。ログアウト時などは force_session_save で即時保存）
     if session_state:
-        manager.save_session_state(uid, session_state)
+        manager.save_session_state(uid, session_state, force=force_session_save)
         
         # 設定の更新
         if session_state.get("settings_changed", False):
@@ -721,8 +930,14 @@ def save_user_data(uid: str, question_id: str = None, updated_card_data: Dict[st
             manager.update_user_settings(uid, settings)
 
 
+def prefetch_user_context(uid: str) -> Tuple[Optional[Dict[str, Any]], Dict[str, bool]]:
+    """ログイン時にプロフィールと権限をまとめて読み込み、以降の参照をキャッシュから返す"""
+    manager = get_firestore_manager()
+    return manager.prefetch_user_context(uid)
+
+
 def check_gakushi_permission(uid: str) -> bool:
-    """学士試験アクセス権限をチェック（uid統一版）"""
+    """学士試験アクセス権限をチェック（uid統一版・キャッシュ対応）"""
     manager = get_firestore_manager()
     return manager.check_user_permission(uid, "can_access_gakushi")
 
@@ -739,12 +954,20 @@ def get_user_permissions(uid: str) -> Dict[str, bool]:
     return manager.get_user_permissions(uid)
 
 
-def list_all_permissions() -> Dict[str, Dict[str, bool]]:
-    """全ユーザーの権限一覧を取得"""
+def list_all_permissions(page_size: Optional[int] = None, start_after: Optional[str] = None) -> Dict[str, Dict[str, bool]]:
+    """全ユーザーの権限一覧を取得（page_size指定時はページ単位）"""
     manager = get_firestore_manager()
-    return manager.list_all_user_permissions()
+    return manager.list_all_user_permissions(page_size, start_after)
+
+
+def list_permissions_page(page_size: int = PERMISSIONS_PAGE_SIZE, start_after: Optional[str] = None) -> Tuple[Dict[str, Dict[str, bool]], Optional[str]]:
+    """管理画面用：権限一覧を1ページ分と次ページのカーソルを取得"""
     manager = get_firestore_manager()
-    return manager.check_user_permission(uid, "can_access_gakushi")
+    try:
+        return manager.fetch_user_permissions_page(page_size, start_after)
+    except Exception as e:
+        print(f"[ERROR] 権限ページ取得エラー: {e}")
+        return {}, None
 
 
 def fetch_ranking_data(limit: int = 100) -> List[Dict[str, Any]]:
@@ -766,11 +989,9 @@ def get_user_profile_for_ranking(uid: str) -> Optional[Dict[str, Any]]:
     
     try:
         manager = get_firestore_manager()
-        doc_ref = manager.db.collection("users").document(uid)
-        doc = doc_ref.get()
+        data = manager.get_user_profile_doc(uid)
         
-        if doc.exists:
-            data = doc.to_dict()
+        if data is not None:
             return {
                 "nickname": data.get("nickname", data.get("email", "").split("@")[0]),
                 "show_on_leaderboard": data.get("show_on_leaderboard", True),
@@ -865,6 +1086,7 @@ def save_user_profile(uid: str, nickname: str, show_on_leaderboard: bool) -> boo
         
         # merge=Trueで既存のデータを保持
         doc_ref.set(update_data, merge=True)
+        manager.invalidate_user_cache(uid, "profile")
         return True
         
     except Exception as e:
@@ -0,0 +1,490 @@
+"""
+Firestoreの読み書き件数の集計
+
+FirestoreManager.db（get_db() も同じクライアント）を CountingClient で包み、
+ドキュメントの読み取り・書き込み・削除件数を数える。
+
+- 件数は (論理操作, コレクション) ごとに集計する。論理操作は perf_metrics の
+  計測中スパン名（例: firestore.load_user_cards, page.練習）
+- track(counter) の間に発生した読み書きが counter に加算される
+  （アプリでは再実行ごと・セッションごと、バッチでは job() ごと）
+- 再実行・ジョブの読み取り件数が予算を超えたら警告を出す（処理は止めない）
+- セッション終了・ジョブ終了時の集計と、予算超過した再実行の集計を
+  FIRESTORE_USAGE_LOG（JSON Lines）に追記し、オフラインで集計できるようにする
+- ログアウトせずに終わるセッションの分も残るよう、セッションの集計は途中でも
+  persist() で追記する。同じ集計（id）の記録は最後のものだけを集計に使う
+"""
+
+import datetime
+import functools
+import json
+import os
+import threading
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+try:
+    import perf_metrics
+except ImportError:
+    from . import perf_metrics
+
+# 1回の再実行で読み取り件数がこれを超えたら警告
+FIRESTORE_RERUN_READ_BUDGET = int(os.environ.get("FIRESTORE_RERUN_READ_BUDGET", "200"))
+# バッチジョブ1回あたりの読み取り件数の予算（0なら警告しない）
+FIRESTORE_JOB_READ_BUDGET = int(os.environ.get("FIRESTORE_JOB_READ_BUDGET", "0"))
+
+# セッションの集計を途中で追記する間隔（再実行回数）
+FIRESTORE_SESSION_PERSIST_EVERY = int(os.environ.get("FIRESTORE_SESSION_PERSIST_EVERY", "5"))
+
+# 集計の追記先（空なら追記しない）
+FIRESTORE_USAGE_LOG = os.environ.get(
+    "FIRESTORE_USAGE_LOG",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "firestore_usage.jsonl")
+)
+
+UNTRACKED_OPERATION = "(untracked)"
+
+
+class UsageCounter:
+    """読み取り・書き込み・削除件数の集計（論理操作・コレクション別）"""
+
+    def __init__(self, scope: str, scope_id: str = "", read_budget: int = 0):
+        self.scope = scope
+        self.scope_id = scope_id
+        self.read_budget = read_budget
+        self.counter_id = uuid.uuid4().hex
+        self.started_at = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        self.reads = 0
+        self.writes = 0
+        self.deletes = 0
+        self._by_key: Dict[tuple, List[int]] = defaultdict(lambda: [0, 0, 0])
+        self._budget_warned = False
+        self._persisted_totals = (0, 0, 0)
+        self._persist_skips = 0
+        self._finished = False
+        self._lock = threading.Lock()
+
+    def add(self, operation: str, collection: str, reads: int = 0, writes: int = 0, deletes: int = 0):
+        with self._lock:
+            self.reads += reads
+            self.writes += writes
+            self.deletes += deletes
+            counts = self._by_key[(operation, collection)]
+            counts[0] += reads
+            counts[1] += writes
+            counts[2] += deletes
+
+    def over_budget(self) -> bool:
+        return bool(self.read_budget) and self.reads > self.read_budget
+
+    def breakdown(self) -> List[Dict[str, Any]]:
+        """論理操作・コレクション別の件数（読み取りの多い順）"""
+        with self._lock:
+            rows = [
+                {"operation": op, "collection": col, "reads": c[0], "writes": c[1], "deletes": c[2]}
+                for (op, col), c in self._by_key.items()
+            ]
+        rows.sort(key=lambda row: (row["reads"], row["writes"] + row["deletes"]), reverse=True)
+        return rows
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "id": self.counter_id,
+            "scope": self.scope,
+            "scope_id": self.scope_id,
+            "started_at": self.started_at,
+            "ended_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "reads": self.reads,
+            "writes": self.writes,
+            "deletes": self.deletes,
+            "breakdown": self.breakdown(),
+        }
+
+
+# スレッドごとの集計先と、全スレッド共通の集計先（バッチジョブ用）
+_local = threading.local()
+_global_counters: List[UsageCounter] = []
+_global_lock = threading.Lock()
+
+
+def _active_counters() -> List[UsageCounter]:
+    counters = getattr(_local, "counters", None) or []
+    if _global_counters:
+        with _global_lock:
+            counters = counters + [c for c in _global_counters if c not in counters]
+    return counters
+
+
+def _record(collection: str, reads: int = 0, writes: int = 0, deletes: int = 0):
+    """クライアントラッパーから呼ばれ、計測中のスパンと集計先に加算"""
+    perf_metrics.record_firestore(reads=reads, writes=writes + deletes)
+    counters = _active_counters()
+    if not counters:
+        return
+    operation = perf_metrics.current_span_name() or UNTRACKED_OPERATION
+    for counter in counters:
+        counter.add(operation, collection, reads, writes, deletes)
+
+
+@contextmanager
+def track(counter: UsageCounter, all_threads: bool = False) -> Iterator[UsageCounter]:
+    """ブロック内の読み書きを counter に加算（all_threads=True なら他スレッドの分も含める）"""
+    if all_threads:
+        with _global_lock:
+            _global_counters.append(counter)
+    else:
+        if getattr(_local, "counters", None) is None:
+            _local.counters = []
+        _local.counters.append(counter)
+    try:
+        yield counter
+    finally:
+        if all_threads:
+            with _global_lock:
+                _global_counters.remove(counter)
+        else:
+            _local.counters.remove(counter)
+
+
+def append_usage_log(record: Dict[str, Any], path: Optional[str] = None):
+    """集計結果を JSON Lines で追記"""
+    path = path or FIRESTORE_USAGE_LOG
+    if not path:
+        return
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        line = json.dumps(record, ensure_ascii=False)
+        with _global_lock, open(path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+    except OSError as e:
+        print(f"[WARNING] Firestore使用量ログ書き込みエラー: {e}")
+
+
+def _format_top(counter: UsageCounter, limit: int = 3) -> str:
+    return ", ".join(
+        f"{row['operation']}[{row['collection']}]={row['reads']}" for row in counter.breakdown()[:limit]
+    )
+
+
+def check_budget(counter: UsageCounter) -> bool:
+    """読み取り件数が予算を超えていれば1回だけ警告し、ログに記録する（予算超過ならTrue）"""
+    if not counter.over_budget():
+        return False
+    if not counter._budget_warned:
+        counter._budget_warned = True
+        print(f"[WARNING] Firestore読み取りが予算超過 ({counter.scope} {counter.scope_id}): "
+              f"{counter.reads}件 > {counter.read_budget}件 / 上位: {_format_top(counter)}")
+        append_usage_log(dict(counter.summary(), budget_exceeded=True))
+    return True
+
+
+def persist(counter: UsageCounter, every: int = FIRESTORE_SESSION_PERSIST_EVERY) -> bool:
+    """
+    途中経過を追記（再実行ごとに呼ぶ）。件数が変わっていて、前回の追記から every 回目の
+    呼び出しか初めての追記のときだけ書き込む。同じ id の記録は集計時に最後のものが使われる
+    """
+    totals = (counter.reads, counter.writes, counter.deletes)
+    if counter._finished or totals == counter._persisted_totals:
+        return False
+    counter._persist_skips += 1
+    if counter._persisted_totals != (0, 0, 0) and counter._persist_skips < every:
+        return False
+    counter._persisted_totals = totals
+    counter._persist_skips = 0
+    append_usage_log(dict(counter.summary(), final=False))
+    return True
+
+
+def finish(counter: UsageCounter) -> Dict[str, Any]:
+    """セッション・ジョブの集計を確定してログ出力"""
+    counter._finished = True
+    summary = counter.summary()
+    print(f"[INFO] Firestore使用量 ({counter.scope} {counter.scope_id}): "
+          f"読み取り {counter.reads} / 書き込み {counter.writes} / 削除 {counter.deletes}")
+    append_usage_log(summary)
+    return summary
+
+
+@contextmanager
+def job(name: str, read_budget: int = FIRESTORE_JOB_READ_BUDGET) -> Iterator[UsageCounter]:
+    """バッチジョブ全体の読み書きを集計し、終了時にログ出力"""
+    counter = UsageCounter("job", name, read_budget)
+    try:
+        with track(counter, all_threads=True):
+            yield counter
+    finally:
+        check_budget(counter)
+        finish(counter)
+
+
+def accounted_job(name: str, read_budget: int = FIRESTORE_JOB_READ_BUDGET) -> Callable:
+    """バッチジョブ関数用のデコレータ（戻り値が dict なら firestore_usage に件数を追加）"""
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with job(name, read_budget) as counter:
+                result = func(*args, **kwargs)
+            if isinstance(result, dict):
+                result["firestore_usage"] = {
+                    "reads": counter.reads, "writes": counter.writes, "deletes": counter.deletes,
+                }
+            return result
+        return wrapper
+    return decorator
+
+
+# --- オフライン集計 ---
+def load_usage_log(path: Optional[str] = None) -> List[Dict[str, Any]]:
+    """追記済みの集計ログを読み込む（壊れた行は無視）"""
+    path = path or FIRESTORE_USAGE_LOG
+    records = []
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+    except OSError:
+        pass
+    return records
+
+
+def latest_records(records: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """同じ集計（id）の記録は最後のものだけを残す（id のない旧形式の記録はそのまま）"""
+    latest: Dict[Any, Dict[str, Any]] = {}
+    for index, record in enumerate(records):
+        latest[record.get("id") or ("", index)] = record
+    return list(latest.values())
+
+
+def summarize_usage_log(records: Iterable[Dict[str, Any]], scope: Optional[str] = None) -> Dict[str, Any]:
+    """スコープ（session / rerun / job）・論理操作ごとに件数を合計"""
+    by_scope: Dict[str, Dict[str, Any]] = {}
+    by_operation: Dict[tuple, List[int]] = defaultdict(lambda: [0, 0, 0])
+
+    for record in latest_records(records):
+        if scope and record.get("scope") != scope:
+            continue
+        key = record.get("scope", "")
+        if record.get("scope") == "job":
+            key = f"job:{record.get('scope_id', '')}"
+        entry = by_scope.setdefault(key, {"count": 0, "reads": 0, "writes": 0, "deletes": 0, "max_reads": 0})
+        entry["count"] += 1
+        entry["reads"] += record.get("reads", 0)
+        entry["writes"] += record.get("writes", 0)
+        entry["deletes"] += record.get("deletes", 0)
+        entry["max_reads"] = max(entry["max_reads"], record.get("reads", 0))
+
+        for row in record.get("breakdown", []):
+            counts = by_operation[(row.get("operation", ""), row.get("collection", ""))]
+            counts[0] += row.get("reads", 0)
+            counts[1] += row.get("writes", 0)
+            counts[2] += row.get("deletes", 0)
+
+    for entry in by_scope.values():
+        entry["avg_reads"] = round(entry["reads"] / entry["count"], 1) if entry["count"] else 0
+
+    operations = [
+        {"operation": op, "collection": col, "reads": c[0], "writes": c[1], "deletes": c[2]}
+        for (op, col), c in by_operation.items()
+    ]
+    operations.sort(key=lambda row: row["reads"], reverse=True)
+    return {"scopes": by_scope, "operations": operations}
+
+
+# --- クライアントのラッパー ---
+def _unwrap(obj):
+    return obj._target if isinstance(obj, _Proxy) else obj
+
+
+def _collection_id(path: str) -> str:
+    """"users/xxx/userCards" → "userCards"（ドキュメントIDを含めずに集計するため）"""
+    parts = [p for p in path.split("/") if p]
+    if not parts:
+        return ""
+    return parts[-1] if len(parts) % 2 == 1 else parts[-2]
+
+
+class _Proxy:
+    """Firestoreオブジェクトのラッパー基底（未定義の属性は元のオブジェクトに委譲）"""
+
+    __slots__ = ("_target", "_collection")
+
+    def __init__(self, target, collection: str):
+        self._target = target
+        self._collection = collection
+
+    def __getattr__(self, name):
+        return getattr(self._target, name)
+
+    def __repr__(self):
+        return f"<{type(self).__name__} {self._target!r}>"
+
+
+class _QueryProxy(_Proxy):
+    """CollectionReference / Query のラッパー"""
+
+    __slots__ = ()
+
+    def _wrap(self, query):
+        return _QueryProxy(query, self._collection)
+
+    def where(self, *args, **kwargs):
+        return self._wrap(self._target.where(*args, **kwargs))
+
+    def order_by(self, *args, **kwargs):
+        return self._wrap(self._target.order_by(*args, **kwargs))
+
+    def limit(self, count):
+        return self._wrap(self._target.limit(count))
+
+    def limit_to_last(self, count):
+        return self._wrap(self._target.limit_to_last(count))
+
+    def offset(self, num_to_skip):
+        return self._wrap(self._target.offset(num_to_skip))
+
+    def select(self, field_paths):
+        return self._wrap(self._target.select(field_paths))
+
+    def start_at(self, document_fields_or_snapshot):
+        return self._wrap(self._target.start_at(_unwrap(document_fields_or_snapshot)))
+
+    def start_after(self, document_fields_or_snapshot):
+        return self._wrap(self._target.start_after(_unwrap(document_fields_or_snapshot)))
+
+    def end_at(self, document_fields_or_snapshot):
+        return self._wrap(self._target.end_at(_unwrap(document_fields_or_snapshot)))
+
+    def end_before(self, document_fields_or_snapshot):
+        return self._wrap(self._target.end_before(_unwrap(document_fields_or_snapshot)))
+
+    def document(self, document_id=None):
+        return _DocumentProxy(self._target.document(document_id), self._collection)
+
+    def add(self, document_data, *args, **kwargs):
+        result = self._target.add(document_data, *args, **kwargs)
+        _record(self._collection, writes=1)
+        update_time, ref = result
+        return update_time, _DocumentProxy(ref, self._collection)
+
+    def stream(self, *args, **kwargs):
+        count = 0
+        try:
+            for snapshot in self._target.stream(*args, **kwargs):
+                count += 1
+                yield snapshot
+        finally:
+            # 結果が0件のクエリも1読み取りとして課金される
+            _record(self._collection, reads=max(1, count))
+
+    def get(self, *args, **kwargs):
+        result = self._target.get(*args, **kwargs)
+        _record(self._collection, reads=max(1, len(result)))
+        return result
+
+
+class _DocumentProxy(_Proxy):
+    """DocumentReference のラッパー"""
+
+    __slots__ = ()
+
+    def get(self, *args, **kwargs):
+        snapshot = self._target.get(*args, **kwargs)
+        _record(self._collection, reads=1)
+        return snapshot
+
+    def set(self, *args, **kwargs):
+        result = self._target.set(*args, **kwargs)
+        _record(self._collection, writes=1)
+        return result
+
+    def create(self, *args, **kwargs):
+        result = self._target.create(*args, **kwargs)
+        _record(self._collection, writes=1)
+        return result
+
+    def update(self, *args, **kwargs):
+        result = self._target.update(*args, **kwargs)
+        _record(self._collection, writes=1)
+        return result
+
+    def delete(self, *args, **kwargs):
+        result = self._target.delete(*args, **kwargs)
+        _record(self._collection, deletes=1)
+        return result
+
+    def collection(self, collection_id):
+        return _QueryProxy(self._target.collection(collection_id), collection_id)
+
+
+class _BatchProxy(_Proxy):
+    """WriteBatch のラッパー（commit 時にまとめて加算）"""
+
+    __slots__ = ("_pending",)
+
+    def __init__(self, target):
+        super().__init__(target, "")
+        self._pending: List[tuple] = []
+
+    def _stage(self, method, reference, *args, **kwargs):
+        collection = reference._collection if isinstance(reference, _Proxy) else ""
+        getattr(self._target, method)(_unwrap(reference), *args, **kwargs)
+        self._pending.append((collection, "deletes" if method == "delete" else "writes"))
+        return self
+
+    def set(self, reference, *args, **kwargs):
+        return self._stage("set", reference, *args, **kwargs)
+
+    def create(self, reference, *args, **kwargs):
+        return self._stage("create", reference, *args, **kwargs)
+
+    def update(self, reference, *args, **kwargs):
+        return self._stage("update", reference, *args, **kwargs)
+
+    def delete(self, reference, *args, **kwargs):
+        return self._stage("delete", reference, *args, **kwargs)
+
+    def commit(self, *args, **kwargs):
+        result = self._target.commit(*args, **kwargs)
+        for collection, kind in self._pending:
+            _record(collection, **{kind: 1})
+        self._pending = []
+        return result
+
+
+class CountingClient(_Proxy):
+    """読み書き件数を数える firestore.Client のラッパー"""
+
+    __slots__ = ()
+
+    def __init__(self, client):
+        super().__init__(client, "")
+
+    def collection(self, *collection_path):
+        path = "/".join(collection_path)
+        return _QueryProxy(self._target.collection(*collection_path), _collection_id(path))
+
+    def collection_group(self, collection_id):
+        return _QueryProxy(self._target.collection_group(collection_id), collection_id)
+
+    def document(self, *document_path):
+        path = "/".join(document_path)
+        return _DocumentProxy(self._target.document(*document_path), _collection_id(path))
+
+    def get_all(self, references, *args, **kwargs):
+        references = list(references)
+        collections = {
+            _unwrap(ref).path: (ref._collection if isinstance(ref, _Proxy) else "")
+            for ref in references
+        }
+        for snapshot in self._target.get_all([_unwrap(ref) for ref in references], *args, **kwargs):
+            # 存在しないドキュメントも1読み取りとして課金される
+            _record(collections.get(snapshot.reference.path, ""), reads=1)
+            yield snapshot
+
+    def batch(self):
+        return _BatchProxy(self._target.batch())
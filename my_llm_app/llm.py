@@ -1,67 +1,271 @@
 # File: llm.py
 
+import threading
+import time
+from typing import Iterator, Optional
+
 import streamlit as st
 from huggingface_hub import InferenceClient
 
-# StreamlitのSecretsからAPIキーを取得
+try:
+    from explanation_cache import get_explanation_store
+except ImportError:
+    from .explanation_cache import get_explanation_store
+
+# StreamlitのSecretsからAPIキー・モデルを取得
 try:
     PROVIDER_API_KEY = st.secrets["PROVIDER_API_KEY"]
-    # Hugging Face直接接続を使用してInferenceClientを初期化
-    client = InferenceClient(api_key=PROVIDER_API_KEY)
 except (FileNotFoundError, KeyError):
     st.error("APIキーが設定されていません。管理者にお問い合わせください。")
-    client = None
+    PROVIDER_API_KEY = None
 
-def generate_dental_explanation(question_text: str, choices: list, image_url: str = None) -> str:
+try:
+    # 未設定の場合はテンプレート解説のみを使用
+    LLM_MODEL = st.secrets.get("LLM_MODEL", "")
+except Exception:
+    LLM_MODEL = ""
+
+# 解説キャッシュのキー（プロンプトや生成方法を変えたらバージョンを上げる）
+PROMPT_TEMPLATE_VERSION = "v1"
+EXPLANATION_MODEL = LLM_MODEL or "template"
+
+# プロバイダー障害時の再試行間隔（秒）。失敗が続くごとに倍にする
+PROVIDER_BACKOFF_INITIAL = 60
+PROVIDER_BACKOFF_MAX = 1800
+PROVIDER_TIMEOUT = 30
+
+# テンプレート解説をストリーミング表示する際の区切り
+TEMPLATE_STREAM_SEPARATOR = "\n\n"
+
+
+class _ProviderState:
+    """プロセス内で共有するクライアントとプロバイダーの健全性（失敗時は一定時間利用しない）"""
+    
+    def __init__(self):
+        self.client: Optional[InferenceClient] = None
+        self.token_checked = False
+        self.failures = 0
+        self.retry_at = 0.0
+        self.lock = threading.Lock()
+    
+    def get_client(self) -> Optional[InferenceClient]:
+        """利用可能なクライアントを返す（未設定・バックオフ中はNone）"""
+        if not PROVIDER_API_KEY:
+            return None
+        with self.lock:
+            if time.time() < self.retry_at:
+                return None
+            if self.client is None:
+                # Hugging Face直接接続を使用してInferenceClientを初期化
+                self.client = InferenceClient(api_key=PROVIDER_API_KEY, timeout=PROVIDER_TIMEOUT)
+            if not self.token_checked:
+                self.token_checked = True
+                if not _check_api_token():
+                    self._mark_failure_locked()
+                    return None
+            return self.client
+    
+    def mark_success(self):
+        with self.lock:
+            self.failures = 0
+            self.retry_at = 0.0
+    
+    def mark_failure(self):
+        with self.lock:
+            self._mark_failure_locked()
+    
+    def _mark_failure_locked(self):
+        self.failures += 1
+        backoff = min(PROVIDER_BACKOFF_INITIAL * (2 ** (self.failures - 1)), PROVIDER_BACKOFF_MAX)
+        self.retry_at = time.time() + backoff
+        # 次回はトークンも再確認する
+        self.token_checked = False
+        print(f"[DEBUG] LLM provider unavailable. Retrying after {backoff}s (failures: {self.failures})")
+
+
+_provider = _ProviderState()
+
+
+def _check_api_token() -> bool:
+    """APIトークンの有効性を確認（_ProviderState からのみ呼び出す）"""
+    try:
+        import requests
+        print("[DEBUG] Testing API token validity...")
+        test_response = requests.get(
+            "https://huggingface.co/api/whoami", 
+            headers={"Authorization": f"Bearer {PROVIDER_API_KEY}"},
+            timeout=5
+        )
+        print(f"[DEBUG] API test response status: {test_response.status_code}")
+        return test_response.status_code == 200
+    except Exception as test_error:
+        print(f"[DEBUG] API test failed: {test_error}")
+        return False
+
+def _build_messages(question_text: str, choices_string: str, image_url: str = None) -> list:
+    """プロバイダーへ送るメッセージを作成"""
+    prompt = (
+        "あなたは歯科医師国家試験の指導医です。次の問題について、正答とその根拠、"
+        "各選択肢が正しい/誤っている理由を日本語でMarkdown形式で簡潔に解説してください。\n\n"
+        f"## 問題文\n{question_text}\n\n## 選択肢\n{choices_string}"
+    )
+    if image_url:
+        content = [
+            {"type": "image_url", "image_url": {"url": image_url}},
+            {"type": "text", "text": prompt},
+        ]
+        return [{"role": "user", "content": content}]
+    return [{"role": "user", "content": prompt}]
+
+def stream_template_explanation(question_text: str, choices_string: str, image_url: str = None) -> Iterator[str]:
+    """テンプレート解説を段落単位でストリーミング"""
+    explanation = generate_template_explanation(question_text, choices_string, image_url)
+    parts = explanation.split(TEMPLATE_STREAM_SEPARATOR)
+    for i, part in enumerate(parts):
+        yield part + (TEMPLATE_STREAM_SEPARATOR if i < len(parts) - 1 else "")
+
+def stream_dental_explanation(question_text: str, choices: list, image_url: str = None,
+                              status: Optional[dict] = None) -> Iterator[str]:
     """
-    歯科国家試験の問題解説を生成する。
-    画像がある場合はVLモデル、ない場合はテキストモデルを使用する。
+    歯科国家試験の問題解説を受信したチャンクから順に返す。
+    プロバイダーが利用できない場合（未設定・障害によるバックオフ中）はテンプレート解説をストリーミングする。
+    
+    status を渡すと {"source": "provider" | "template" | "error"} が設定される。
     """
-    print(f"[DEBUG] generate_dental_explanation called with:")
-    print(f"[DEBUG] - question_text: {question_text[:100]}...")
-    print(f"[DEBUG] - choices: {len(choices) if choices else 0} items")
-    print(f"[DEBUG] - image_url: {image_url}")
-    print(f"[DEBUG] - client available: {client is not None}")
+    status = status if status is not None else {}
     
-    if client is None:
-        print("[DEBUG] Client is None, returning error message")
-        return "❌ エラー: APIキーが設定されていません。管理者にお問い合わせください。"
+    if not PROVIDER_API_KEY:
+        status["source"] = "error"
+        yield "❌ エラー: APIキーが設定されていません。管理者にお問い合わせください。"
+        return
 
     # 選択肢を番号付きの文字列に変換
     choices_string = '\n'.join(f'{i+1}. {choice}' for i, choice in enumerate(choices))
     
-    try:
-        # まずAPIトークンの有効性をテスト
-        test_response = None
+    provider_client = _provider.get_client() if LLM_MODEL else None
+    if provider_client is not None:
+        emitted = False
         try:
-            import requests
-            print("[DEBUG] Testing API token validity...")
-            test_response = requests.get(
-                "https://huggingface.co/api/whoami", 
-                headers={"Authorization": f"Bearer {st.secrets['PROVIDER_API_KEY']}"},
-                timeout=5
+            stream = provider_client.chat_completion(
+                messages=_build_messages(question_text, choices_string, image_url),
+                model=LLM_MODEL,
+                max_tokens=1500,
+                stream=True,
             )
-            print(f"[DEBUG] API test response status: {test_response.status_code if test_response else 'None'}")
-        except Exception as test_error:
-            print(f"[DEBUG] API test failed: {test_error}")
-        
-        # APIトークンが無効な場合、または HF Inference API が利用不可の場合
-        # 現在のHuggingFace Inference APIの状況により、直接テンプレートベースに移行
-        print(f"[DEBUG] HuggingFace Inference API is currently unavailable. Using template explanation.")
-        return generate_template_explanation(question_text, choices_string, image_url)
-        
-    except Exception as e:
-        error_msg = f"AI解説の生成中にエラーが発生しました: {str(e)}"
-        st.error(error_msg)
-        print(f"[DEBUG] LLM Error Details: {type(e).__name__}: {str(e)}")
-        
-        # より詳細なデバッグ情報
-        if hasattr(e, 'response'):
-            print(f"[DEBUG] Response status: {getattr(e.response, 'status_code', 'N/A')}")
-            print(f"[DEBUG] Response text: {getattr(e.response, 'text', 'N/A')}")
+            for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    emitted = True
+                    yield delta
+            _provider.mark_success()
+            status["source"] = "provider"
+            return
+        except Exception as e:
+            _provider.mark_failure()
+            print(f"[DEBUG] LLM Error Details: {type(e).__name__}: {str(e)}")
+            if emitted:
+                # 途中まで表示済みの場合は補足のみ
+                status["source"] = "error"
+                yield "\n\n⚠️ 解説の生成が途中で中断されました。再度お試しください。"
+                return
+    
+    # プロバイダーが利用不可の場合はテンプレートベースの解説を提供
+    status["source"] = "template"
+    yield from stream_template_explanation(question_text, choices_string, image_url)
+
+def stream_cached_explanation(question: dict, image_url: str = None) -> Iterator[str]:
+    """
+    問題の解説をキャッシュ経由でストリーミング。
+    キャッシュヒット時は全文を1回で返し、生成時は完了後にキャッシュへ保存する。
+    同じ問題を別のリクエストが生成中の場合は、その完了を待って全文を返す。
+    """
+    store = get_explanation_store()
+    qid = question.get('number', '')
+    cached = store.get(qid, PROMPT_TEMPLATE_VERSION, EXPLANATION_MODEL)
+    if cached is not None:
+        yield cached
+        return
+    
+    future, owner = store.claim(qid, PROMPT_TEMPLATE_VERSION, EXPLANATION_MODEL)
+    if not owner:
+        try:
+            yield future.result()
+            return
+        except _UncacheableExplanation as e:
+            yield e.text
+            return
+        except Exception:
+            # 生成側が中断・失敗した場合はこのリクエストで生成する（キャッシュへの保存は行う）
+            pass
+    
+    status = {}
+    chunks = []
+    result = None
+    try:
+        for chunk in stream_dental_explanation(question.get('question', ''), question.get('choices', []), image_url, status):
+            chunks.append(chunk)
+            yield chunk
         
-        # エラーの場合はテンプレートベースの解説を提供
-        return generate_template_explanation(question_text, choices_string, image_url)
+        text = "".join(chunks)
+        # 設定モデルで生成できた場合のみ保存（エラー・代替のテンプレートはキャッシュしない）
+        expected_source = "provider" if LLM_MODEL else "template"
+        if status.get("source") == expected_source:
+            store.put(qid, PROMPT_TEMPLATE_VERSION, EXPLANATION_MODEL, text)
+            result = text
+        else:
+            result = _UncacheableExplanation(text)
+    finally:
+        if owner:
+            # 表示が途中で破棄された場合（GeneratorExit）も待機中のリクエストを解放する
+            if result is None:
+                store.release(qid, PROMPT_TEMPLATE_VERSION, EXPLANATION_MODEL, future,
+                              error=RuntimeError("explanation stream was interrupted"))
+            elif isinstance(result, Exception):
+                store.release(qid, PROMPT_TEMPLATE_VERSION, EXPLANATION_MODEL, future, error=result)
+            else:
+                store.release(qid, PROMPT_TEMPLATE_VERSION, EXPLANATION_MODEL, future, text=result)
+
+def get_cached_explanation(question: dict, image_url: str = None) -> str:
+    """
+    問題の解説をキャッシュ経由で取得する。
+    キャッシュになければ生成し、同じ問題への同時リクエストは1回の生成を共有する。
+    """
+    if not PROVIDER_API_KEY:
+        # エラーメッセージはキャッシュしない
+        return generate_dental_explanation(question.get('question', ''), question.get('choices', []), image_url)
+    
+    def _generate():
+        status = {}
+        text = "".join(stream_dental_explanation(question.get('question', ''), question.get('choices', []), image_url, status))
+        expected_source = "provider" if LLM_MODEL else "template"
+        if status.get("source") != expected_source:
+            # 代替結果はキャッシュせずに返す
+            raise _UncacheableExplanation(text)
+        return text
+    
+    try:
+        return get_explanation_store().get_or_generate(
+            question.get('number', ''),
+            PROMPT_TEMPLATE_VERSION,
+            EXPLANATION_MODEL,
+            _generate
+        )
+    except _UncacheableExplanation as e:
+        return e.text
+
+class _UncacheableExplanation(Exception):
+    """キャッシュすべきでない生成結果（テンプレートへの代替・エラー）"""
+    
+    def __init__(self, text: str):
+        super().__init__("uncacheable explanation")
+        self.text = text
+
+def generate_dental_explanation(question_text: str, choices: list, image_url: str = None) -> str:
+    """
+    歯科国家試験の問題解説を生成する（ストリーミング版をまとめて返す）。
+    画像がある場合はVLモデル、ない場合はテキストモデルを使用する。
+    """
+    return "".join(stream_dental_explanation(question_text, choices, image_url))
 
 def generate_template_explanation(question_text: str, choices_string: str, image_url: str = None) -> str:
     """テンプレートベースの解説生成（API接続失敗時の代替手段）"""
@@ -0,0 +1,351 @@
+"""
+マスターデータの増分ビルド
+
+data/ の問題ファイルを自動検出し、ファイルごとの内容ハッシュ（SHA-256）で変更を判定して、
+変更されたファイルのシャードだけを作り直す。
+- シャード（MASTER_CACHE_DIR/shards/<sha256>-<ビルダー>.json）: 検証済みの問題・症例と派生データ
+  （問題メタデータ・検索用テキスト）。内容が同じファイルのシャードは再利用する。
+  ビルダー（検証・問題メタデータ・検索テキストを作るコード）のダイジェストもキーに含めるため、
+  question_meta などを変更してデプロイすると古いシャードは使われなくなる
+- マニフェスト（data/master_manifest.json）: ファイルの並び・ハッシュ・問題数・検証結果と
+  データバージョン。アプリはこのバージョンをキャッシュキーに使うため、問題ファイルを
+  追加してもコード変更は不要
+
+    python run_master_data_build.py          # 変更されたファイルのみ再ビルド
+    python run_master_data_build.py --check  # 検証のみ
+"""
+
+import datetime
+import fnmatch
+import functools
+import hashlib
+import inspect
+import json
+import os
+import re
+import tempfile
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import question_meta
+    from shared_cache import _code_digest
+except ImportError:
+    from . import question_meta
+    from .shared_cache import _code_digest
+
+_APP_DIR = os.path.dirname(os.path.abspath(__file__))
+MASTER_DATA_DIR = os.path.join(_APP_DIR, "data")
+MASTER_CACHE_DIR = os.environ.get("MASTER_CACHE_DIR", os.path.join(_APP_DIR, "cache", "master_data"))
+MANIFEST_NAME = "master_manifest.json"
+
+# 問題ファイルとして読み込むファイル名（先に一致したパターンのファイルが優先。同じ番号は先勝ち）
+QUESTION_FILE_PATTERNS = ("master_questions_final.json", "gakushi-*.json")
+
+# シャードの形式を変えたら上げる（古いシャードは使われなくなる）
+SHARD_FORMAT = 1
+
+
+def _now_iso() -> str:
+    return datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+
+def _atomic_write_json(path: str, data: Any):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def discover_question_files(data_dir: str = MASTER_DATA_DIR) -> List[str]:
+    """問題ファイル名を読み込み順で返す"""
+    try:
+        names = sorted(os.listdir(data_dir))
+    except OSError:
+        return []
+    files = []
+    for pattern in QUESTION_FILE_PATTERNS:
+        files.extend(n for n in names if fnmatch.fnmatch(n, pattern) and n not in files)
+    return files
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def data_version(files: List[Dict[str, Any]]) -> str:
+    """ファイルの並びと内容ハッシュから決まるデータバージョン"""
+    digest = hashlib.sha256(f"format={SHARD_FORMAT}\0builder={builder_digest()}".encode("utf-8"))
+    for entry in files:
+        digest.update(f"\0{entry['name']}\0{entry['sha256']}".encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+# ===== 検証 =====
+
+def validate_questions(data: Any) -> Tuple[Dict[str, Any], List[Dict[str, Any]], List[str], List[str]]:
+    """
+    1ファイル分の内容を検証し (症例, 問題, エラー, 警告) を返す
+
+    番号のない問題・ファイル内で重複した番号はエラーとして除外し（従来の読み込みと同じ扱い）、
+    問題文・解答の欠落は警告のみとする
+    """
+    errors: List[str] = []
+    warnings: List[str] = []
+    cases: Dict[str, Any] = {}
+
+    if isinstance(data, dict):
+        raw_cases = data.get("cases", {})
+        if isinstance(raw_cases, dict):
+            cases = raw_cases
+        else:
+            errors.append("'cases' がオブジェクトではありません")
+        raw_questions = data.get("questions", [])
+        if not isinstance(raw_questions, list):
+            errors.append("'questions' がリストではありません")
+            raw_questions = []
+    elif isinstance(data, list):
+        raw_questions = data
+    else:
+        return {}, [], ["トップレベルがオブジェクトでもリストでもありません"], []
+
+    questions = []
+    seen = set()
+    for i, q in enumerate(raw_questions):
+        if not isinstance(q, dict):
+            errors.append(f"{i + 1}件目: 問題がオブジェクトではありません")
+            continue
+        num = q.get("number")
+        if not num or not isinstance(num, str):
+            errors.append(f"{i + 1}件目: 'number' がありません")
+            continue
+        if num in seen:
+            errors.append(f"{num}: ファイル内で番号が重複しています")
+            continue
+        seen.add(num)
+        if not q.get("question"):
+            warnings.append(f"{num}: 'question' がありません")
+        if "answer" not in q:
+            warnings.append(f"{num}: 'answer' がありません")
+        if not isinstance(q.get("choices", []), list):
+            warnings.append(f"{num}: 'choices' がリストではありません")
+        questions.append(q)
+    return cases, questions, errors, warnings
+
+
+# ===== シャード =====
+
+def _meta_to_json(meta: Dict[str, Any]) -> Dict[str, Any]:
+    return dict(meta, answer_masks=sorted(meta["answer_masks"]), answer_strings=sorted(meta["answer_strings"]))
+
+
+def _meta_from_json(meta: Dict[str, Any]) -> Dict[str, Any]:
+    return dict(meta, answer_masks=frozenset(meta["answer_masks"]), answer_strings=frozenset(meta["answer_strings"]))
+
+
+def search_text(question: Dict[str, Any]) -> str:
+    """キーワード検索の対象テキスト（小文字化済み）"""
+    return f"{question.get('question', '')} {question.get('subject', '')} {question.get('number', '')}".lower()
+
+
+def build_shard(path: str, sha256: str) -> Dict[str, Any]:
+    """1ファイル分のシャードを作成"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        cases, questions, errors, warnings = {}, [], [f"読み込めません: {e}"], []
+    else:
+        cases, questions, errors, warnings = validate_questions(data)
+
+    return {
+        "format": SHARD_FORMAT,
+        "builder": builder_digest(),
+        "source": os.path.basename(path),
+        "sha256": sha256,
+        "cases": cases,
+        "questions": questions,
+        "meta": {q["number"]: _meta_to_json(question_meta.build_question_meta(q)) for q in questions},
+        "search": {q["number"]: search_text(q) for q in questions},
+        "errors": errors,
+        "warnings": warnings,
+    }
+
+
+@functools.lru_cache(maxsize=None)
+def builder_digest() -> str:
+    """シャードの内容を作るコードのダイジェスト（question_meta の関数・定数とこのモジュールの検証・変換）"""
+    digest = hashlib.sha256()
+    for func in (validate_questions, build_shard, _meta_to_json, search_text):
+        digest.update(_code_digest(func).encode("utf-8"))
+    for name, value in sorted(vars(question_meta).items()):
+        if inspect.isfunction(value) and value.__module__ == question_meta.__name__:
+            digest.update(f"\0{name}={_code_digest(value)}".encode("utf-8"))
+        elif isinstance(value, re.Pattern):
+            digest.update(f"\0{name}={value.pattern!r}/{value.flags}".encode("utf-8"))
+        elif name.isupper() and isinstance(value, (str, int, tuple, dict)):
+            digest.update(f"\0{name}={value!r}".encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def _shard_path(cache_dir: str, sha256: str) -> str:
+    return os.path.join(cache_dir, "shards", f"{sha256}-{builder_digest()}.json")
+
+
+def _load_shard(cache_dir: str, sha256: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(_shard_path(cache_dir, sha256), "r", encoding="utf-8") as f:
+            shard = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if shard.get("format") != SHARD_FORMAT or shard.get("builder") != builder_digest():
+        return None
+    return shard
+
+
+# ===== マニフェスト =====
+
+def read_manifest(data_dir: str = MASTER_DATA_DIR) -> Optional[Dict[str, Any]]:
+    try:
+        with open(os.path.join(data_dir, MANIFEST_NAME), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _file_stats(data_dir: str) -> List[Dict[str, Any]]:
+    stats = []
+    for name in discover_question_files(data_dir):
+        st_result = os.stat(os.path.join(data_dir, name))
+        stats.append({"name": name, "size": st_result.st_size, "mtime_ns": st_result.st_mtime_ns})
+    return stats
+
+
+def _resolve_hashes(data_dir: str, manifest: Optional[Dict[str, Any]], force: bool = False) -> List[Dict[str, Any]]:
+    """ファイルごとのハッシュ（サイズ・更新時刻がマニフェストと同じファイルは再計算しない）"""
+    known = {} if force or not manifest else {f["name"]: f for f in manifest.get("files", [])}
+    files = []
+    for stat in _file_stats(data_dir):
+        entry = known.get(stat["name"])
+        if entry and entry.get("size") == stat["size"] and entry.get("mtime_ns") == stat["mtime_ns"]:
+            sha256 = entry["sha256"]
+        else:
+            sha256 = file_sha256(os.path.join(data_dir, stat["name"]))
+        files.append(dict(stat, sha256=sha256))
+    return files
+
+
+def current_version(data_dir: str = MASTER_DATA_DIR) -> str:
+    """
+    アプリのキャッシュキーに使うデータバージョン
+
+    ビルド済みのファイルはマニフェストのハッシュを使い、ビルド後に追加・変更された
+    ファイルだけその場でハッシュを計算する（マニフェストの version と同じ規則）
+    """
+    return data_version(_resolve_hashes(data_dir, read_manifest(data_dir)))
+
+
+def build(data_dir: str = MASTER_DATA_DIR, cache_dir: str = MASTER_CACHE_DIR,
+          force: bool = False, save_shards: bool = True,
+          save_manifest: bool = True) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """
+    変更されたファイルのシャードだけを作り直し、(マニフェスト, シャードのリスト) を返す
+
+    save_shards / save_manifest が False の場合は保存しない（検証のみ・アプリからの読み込み）
+    """
+    manifest = read_manifest(data_dir)
+    files = _resolve_hashes(data_dir, manifest, force=force)
+
+    shards = []
+    rebuilt = []
+    for entry in files:
+        shard = None if force else _load_shard(cache_dir, entry["sha256"])
+        if shard is None:
+            shard = build_shard(os.path.join(data_dir, entry["name"]), entry["sha256"])
+            rebuilt.append(entry["name"])
+            if save_shards:
+                _atomic_write_json(_shard_path(cache_dir, entry["sha256"]), shard)
+        shards.append(shard)
+
+    # ファイルをまたいだ番号の重複（先に読み込んだファイルが優先）
+    owners: Dict[str, str] = {}
+    duplicates: Dict[Tuple[str, str], List[str]] = {}
+    for entry, shard in zip(files, shards):
+        for q in shard["questions"]:
+            owner = owners.setdefault(q["number"], entry["name"])
+            if owner != entry["name"]:
+                duplicates.setdefault((entry["name"], owner), []).append(q["number"])
+
+    new_manifest = {
+        "version": data_version(files),
+        "built_at": _now_iso(),
+        "shard_format": SHARD_FORMAT,
+        "builder": builder_digest(),
+        "files": [
+            dict(entry, questions=len(shard["questions"]), cases=len(shard["cases"]),
+                 errors=shard["errors"], warnings=shard["warnings"])
+            for entry, shard in zip(files, shards)
+        ],
+        "duplicates": [
+            {"file": name, "kept": owner, "numbers": numbers}
+            for (name, owner), numbers in duplicates.items()
+        ],
+        "rebuilt": rebuilt,
+        "question_count": len(owners),
+    }
+    if save_manifest:
+        _atomic_write_json(os.path.join(data_dir, MANIFEST_NAME), new_manifest)
+    return new_manifest, shards
+
+
+def merge_shards(shards: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """シャードを読み込み順にまとめる（同じ番号は先勝ち）"""
+    cases: Dict[str, Any] = {}
+    questions: List[Dict[str, Any]] = []
+    meta: Dict[str, Dict[str, Any]] = {}
+    search: Dict[str, str] = {}
+    for shard in shards:
+        cases.update(shard["cases"])
+        for q in shard["questions"]:
+            num = q["number"]
+            if num in meta:
+                continue
+            questions.append(q)
+            meta[num] = _meta_from_json(shard["meta"][num])
+            search[num] = shard["search"][num]
+    return {"cases": cases, "questions": questions, "meta": meta, "search": search}
+
+
+_loaded: Dict[str, Dict[str, Any]] = {}
+_load_lock = threading.Lock()
+
+
+def load_master(version: Optional[str] = None, data_dir: str = MASTER_DATA_DIR,
+                cache_dir: str = MASTER_CACHE_DIR) -> Dict[str, Any]:
+    """
+    マスターデータ（cases / questions / meta / search）を読み込む
+
+    キャッシュ済みシャードを優先し、ないファイルだけ解析する（保存できなければメモリ上のみ）。
+    マニフェストはビルドコマンドだけが書き込む。同じバージョンはプロセス内で1回だけ読み込む
+    """
+    key = version or current_version(data_dir)
+    with _load_lock:
+        if key not in _loaded:
+            try:
+                _, shards = build(data_dir, cache_dir, save_manifest=False)
+            except OSError as e:
+                # 読み取り専用環境などでキャッシュを書けない場合
+                print(f"[WARNING] マスターデータのキャッシュを保存できません: {e}")
+                _, shards = build(data_dir, cache_dir, save_shards=False, save_manifest=False)
+            for shard in shards:
+                for error in shard["errors"]:
+                    print(f"{shard['source']} の読み込みでエラー: {error}")
+            _loaded.clear()
+            _loaded[key] = merge_shards(shards)
+        return _loaded[key]
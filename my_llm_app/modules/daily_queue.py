@@ -0,0 +1,233 @@
+"""
+おまかせ学習の日次キュー生成
+
+おまかせ学習の出題キュー（新規カード＋期限切れ復習カード）の選択ポリシーを
+1か所にまとめ、アプリ内のローカル生成と事前計算ワーカーの両方から利用する。
+
+保存先コレクション:
+- daily_queues/{uid}
+    date:       JST 3時基準の日付（ranking_updater と同じ境界）
+    main_queue: "qid,qid,...;qid,..." 形式の圧縮文字列（; がグループ区切り）
+    new_count / review_count / generated_at
+
+おまかせ学習の開始時は daily_queues/{uid} を1回読むだけでキューを復元できる。
+"""
+
+from __future__ import annotations
+
+import datetime
+import random
+from typing import Dict, Any, List, Optional
+
+import pytz
+
+# import safety: work both when importing as top-level `modules.*` and as package
+try:
+    from firestore_db import get_firestore_manager  # type: ignore
+except ImportError:  # pragma: no cover - fallback
+    from my_llm_app.firestore_db import get_firestore_manager  # type: ignore
+
+try:
+    from utils import CardSelectionUtils  # type: ignore
+except ImportError:  # pragma: no cover - fallback
+    from my_llm_app.utils import CardSelectionUtils  # type: ignore
+
+try:
+    from firestore_usage import accounted_job  # type: ignore
+except ImportError:  # pragma: no cover - fallback
+    from my_llm_app.firestore_usage import accounted_job  # type: ignore
+
+try:
+    from session_queue import encode_queue, decode_queue  # type: ignore
+except ImportError:  # pragma: no cover - fallback
+    from my_llm_app.session_queue import encode_queue, decode_queue  # type: ignore
+
+try:
+    from modules.ranking_updater import _effective_date, _get_user_profiles, _load_user_cards  # type: ignore
+except ImportError:  # pragma: no cover - fallback
+    from .ranking_updater import _effective_date, _get_user_profiles, _load_user_cards  # type: ignore
+
+
+JST = pytz.timezone("Asia/Tokyo")
+
+DAILY_QUEUE_COLLECTION = "daily_queues"
+QUEUE_GROUP_SIZE = 5
+DEFAULT_NEW_CARDS_PER_DAY = 10
+
+
+def _parse_due(due_date) -> Optional[datetime.datetime]:
+    """カードの復習期限をタイムゾーン付きdatetimeに変換"""
+    if not due_date:
+        return None
+    try:
+        if isinstance(due_date, str):
+            due_date = datetime.datetime.fromisoformat(due_date.replace("Z", "+00:00"))
+        if due_date.tzinfo is None:
+            due_date = due_date.replace(tzinfo=datetime.timezone.utc)
+        return due_date
+    except (ValueError, TypeError, AttributeError):
+        return None
+
+
+def select_due_cards(cards: Dict[str, Any], now: Optional[datetime.datetime] = None) -> List[str]:
+    """復習期限を過ぎたカードのIDを期限の古い順に返す"""
+    if now is None:
+        now = datetime.datetime.now(datetime.timezone.utc)
+
+    due = []
+    for qid, card in cards.items():
+        sm2_data = card.get("sm2") or card.get("sm2_data") or {}
+        due_dt = _parse_due(sm2_data.get("due_date"))
+        if due_dt is not None and due_dt <= now:
+            due.append((due_dt, qid))
+
+    due.sort()
+    return [qid for _, qid in due]
+
+
+def reviewed_on(card: Dict[str, Any], effective_date: datetime.date) -> bool:
+    """カードの最後の自己評価が指定日（JST 3時基準）かどうか"""
+    history = (card or {}).get("history") or []
+    if not history or not isinstance(history[-1], dict):
+        return False
+    reviewed_at = _parse_due(history[-1].get("timestamp"))
+    return reviewed_at is not None and _effective_date(reviewed_at.astimezone(JST)) == effective_date
+
+
+def drop_reviewed_today(queue: List[List[str]], cards: Dict[str, Any],
+                        effective_date: Optional[datetime.date] = None) -> List[List[str]]:
+    """当日（JST 3時基準）すでに回答したカードをキューから除く（空になったグループも除く）"""
+    if effective_date is None:
+        effective_date = _effective_date()
+    reviewed = {qid for qid, card in cards.items() if isinstance(card, dict) and reviewed_on(card, effective_date)}
+    if not reviewed:
+        return queue
+    queue = [[qid for qid in group if qid not in reviewed] for group in queue]
+    return [group for group in queue if group]
+
+
+def build_daily_queue(
+    all_questions: List[Dict[str, Any]],
+    cards: Dict[str, Any],
+    new_cards_per_day: int = DEFAULT_NEW_CARDS_PER_DAY,
+    recent_qids: Optional[List[str]] = None,
+    now: Optional[datetime.datetime] = None,
+    group_size: int = QUEUE_GROUP_SIZE,
+    rng: Optional[random.Random] = None,
+) -> Dict[str, Any]:
+    """おまかせ学習の日次キューを生成（Firestore・Streamlitに依存しない選択ポリシー）
+
+    Returns:
+        {"main_queue": [[qid, ...], ...], "new_qids": [...], "review_qids": [...]}
+    """
+    selected_new = CardSelectionUtils.pick_new_cards_for_today(
+        all_questions, cards, new_cards_per_day, recent_qids or []
+    )
+    due_cards = select_due_cards(cards, now)
+
+    # 新規と復習を混ぜてグループ化
+    all_cards = selected_new + due_cards
+    (rng or random).shuffle(all_cards)
+
+    main_queue = [all_cards[i:i + group_size] for i in range(0, len(all_cards), group_size)]
+
+    return {
+        "main_queue": main_queue,
+        "new_qids": selected_new,
+        "review_qids": due_cards,
+    }
+
+
+def _queue_document(queue: Dict[str, Any], effective_date: datetime.date) -> Dict[str, Any]:
+    """Firestore保存用の圧縮ドキュメントを作成"""
+    return {
+        "date": effective_date.isoformat(),
+        "main_queue": encode_queue(queue["main_queue"]),
+        "new_count": len(queue["new_qids"]),
+        "review_count": len(queue["review_qids"]),
+        "generated_at": datetime.datetime.now(JST).isoformat(),
+    }
+
+
+def save_daily_queue(uid: str, queue: Dict[str, Any], db=None) -> bool:
+    """生成済みキューを daily_queues/{uid} に保存"""
+    if not uid:
+        return False
+    try:
+        if db is None:
+            db = get_firestore_manager().db
+        doc = _queue_document(queue, _effective_date())
+        db.collection(DAILY_QUEUE_COLLECTION).document(uid).set(doc)
+        return True
+    except Exception as e:
+        print(f"[ERROR] 日次キュー保存エラー: {e}")
+        return False
+
+
+def load_daily_queue(uid: str, db=None) -> Optional[List[List[str]]]:
+    """当日分（JST 3時基準）の事前計算キューを1回の読み取りで取得（なければNone）"""
+    if not uid:
+        return None
+    try:
+        if db is None:
+            db = get_firestore_manager().db
+        doc = db.collection(DAILY_QUEUE_COLLECTION).document(uid).get()
+        if not doc.exists:
+            return None
+        data = doc.to_dict() or {}
+        if data.get("date") != _effective_date().isoformat():
+            return None
+        return decode_queue(data.get("main_queue", ""))
+    except Exception as e:
+        print(f"[ERROR] 日次キュー読み込みエラー: {e}")
+        return None
+
+
+@accounted_job("precompute_daily_queues")
+def precompute_daily_queues(all_questions: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """全ユーザーの日次キューを事前計算して保存（夜間バッチ用）
+
+    Returns: summary dict
+    """
+    if all_questions is None:
+        try:
+            from utils import ALL_QUESTIONS  # type: ignore
+        except ImportError:  # pragma: no cover - fallback
+            from my_llm_app.utils import ALL_QUESTIONS  # type: ignore
+        all_questions = ALL_QUESTIONS
+
+    fm = get_firestore_manager()
+    db = fm.db
+
+    profiles = _get_user_profiles(db)
+    processed = 0
+    skipped = 0
+    errors = 0
+
+    for p in profiles:
+        uid = p.get("uid")
+        try:
+            cards = _load_user_cards(uid)
+            # 学習履歴のないユーザーは初回アクセス時に生成する
+            if not cards:
+                skipped += 1
+                continue
+            settings = (fm.get_user_profile_doc(uid) or {}).get("settings", {})
+            queue = build_daily_queue(
+                all_questions,
+                cards,
+                settings.get("new_cards_per_day", DEFAULT_NEW_CARDS_PER_DAY),
+            )
+            if save_daily_queue(uid, queue, db):
+                processed += 1
+            else:
+                errors += 1
+        except Exception:
+            errors += 1
+
+    return {
+        "date": _effective_date().isoformat(),
+        "processed": processed,
+        "skipped": skipped,
+        "errors": errors,
+    }
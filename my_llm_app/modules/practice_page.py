@@ -10,6 +10,7 @@
 """
 
 import streamlit as st
+from streamlit.errors import StreamlitAPIException
 import datetime
 import time
 import random
@@ -81,40 +82,54 @@ except ImportError:
         save_user_profile = None
         save_llm_feedback = None
 
+try:
+    import question_meta
+except ImportError:
+    from .. import question_meta
+
 # LLM機能のインポート
 try:
-    from llm import generate_dental_explanation
+    from llm import generate_dental_explanation, stream_cached_explanation
 except ImportError:
     try:
-        from ..llm import generate_dental_explanation
+        from ..llm import generate_dental_explanation, stream_cached_explanation
     except ImportError:
         generate_dental_explanation = None
+        stream_cached_explanation = None
 
-def handle_llm_explanation_request(question: dict, group_id: str):
-    """LLMへの解説生成リクエストを専門に扱う関数"""
-    qid = question.get('number', '')
-    explanation_key = f"llm_explanation_{qid}_{group_id}"
+# 関連問題インデックス（未作成の環境では表示しない）
+try:
+    from related_questions import get_related_index
+except ImportError:
+    try:
+        from ..related_questions import get_related_index
+    except ImportError:
+        get_related_index = None
 
-    with st.spinner("🤔 AI解説を生成中..."):
-        # get_image_source関数を使って最終的な画像URLを取得
-        final_image_url = None
-        raw_image_source = QuestionComponent.get_image_source(question)
-        if raw_image_source:
-            try:
-                # utils.pyの関数で安全なURLに変換
-                from utils import get_secure_image_url
-                final_image_url = get_secure_image_url(raw_image_source) or raw_image_source
-            except Exception as e:
-                final_image_url = raw_image_source # 失敗した場合は元のURLをそのまま使用
+# 結果画面に表示する関連問題の件数
+RELATED_QUESTIONS_COUNT = 5
 
-        # llm.pyのメイン関数を呼び出し
-        explanation = generate_dental_explanation(
-            question_text=question.get('question', ''),
-            choices=question.get('choices', []),
-            image_url=final_image_url
-        )
-        st.session_state[explanation_key] = explanation
-    st.rerun()
+# カードデータの更新回数（サイドバー統計のキャッシュキー）
+CARDS_VERSION_KEY = "cards_version"
+
+# 解答パネルを st.fragment として分離（未対応バージョンでは通常の関数として実行）
+_panel_fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None) or (lambda func: func)
+
+
+def _rerun_panel():
+    """解答パネルのみ再実行（fragment外・未対応バージョンではアプリ全体を再実行）"""
+    try:
+        st.rerun(scope="fragment")
+    except (TypeError, StreamlitAPIException):
+        st.rerun()
+
+def _resolve_explanation_image_url(question: dict) -> Optional[str]:
+    """解説生成に渡す画像URLを取得"""
+    try:
+        from utils import resolve_explanation_image_url
+    except ImportError:
+        from ..utils import resolve_explanation_image_url
+    return resolve_explanation_image_url(question)
 
 try:
     from utils import (
@@ -142,6 +157,22 @@ except ImportError:
         ALL_SUBJECTS = []
         CASES = []
 
+try:
+    from session_queue import coerce_main_queue, coerce_review_queue
+except ImportError:
+    from ..session_queue import coerce_main_queue, coerce_review_queue
+
+try:
+    from modules.daily_queue import build_daily_queue, load_daily_queue, save_daily_queue, drop_reviewed_today
+except ImportError:
+    try:
+        from .daily_queue import build_daily_queue, load_daily_queue, save_daily_queue, drop_reviewed_today
+    except ImportError:
+        build_daily_queue = None
+        load_daily_queue = None
+        save_daily_queue = None
+        drop_reviewed_today = None
+
 # 必修問題セットは後でインポート（循環import回避）
 try:
     from utils import HISSHU_Q_NUMBERS_SET, GAKUSHI_HISSHU_Q_NUMBERS_SET
@@ -387,24 +418,7 @@ class QuestionComponent:
     @staticmethod
     def format_chemical_formula(text: str) -> str:
         """化学式をLaTeX形式に変換"""
-        if not text:
-            return text
-        
-        # よく使われる化学式パターンの変換
-        replacements = {
-            'Ca2+': r'$\mathrm{Ca^{2+}}$',
-            'Mg2+': r'$\mathrm{Mg^{2+}}$',
-            'H2O': r'$\mathrm{H_2O}$',
-            'CO2': r'$\mathrm{CO_2}$',
-            'OH-': r'$\mathrm{OH^-}$',
-            'HCO3-': r'$\mathrm{HCO_3^-}$',
-            'PO4-': r'$\mathrm{PO_4^-}$'
-        }
-        
-        for pattern, replacement in replacements.items():
-            text = text.replace(pattern, replacement)
-        
-        return text
+        return question_meta.format_chemical_formula(text)
     
     @staticmethod
     def get_image_source(question_data: Dict) -> Optional[str]:
@@ -478,11 +492,8 @@ class QuestionComponent:
                 if question_number:
                     st.markdown(f"#### {question_number}")
                 
-                # 問題文（化学式対応）
-                question_text = QuestionComponent.format_chemical_formula(
-                    question.get('question', '')
-                )
-                st.markdown(question_text)
+                # 問題文（化学式変換済み）
+                st.markdown(QuestionUtils.get_meta(question)['question_text'])
                 
                 # 画像表示（問題文の後）
                 image_urls = question.get('image_urls', []) or []
@@ -612,11 +623,9 @@ class AnswerModeComponent:
                     if question_number:
                         st.markdown(f"#### {question_number}")
                     
-                    # 問題文（化学式対応）
-                    question_text = QuestionComponent.format_chemical_formula(
-                        question.get('question', '')
-                    )
-                    st.markdown(question_text)
+                    # 問題文（化学式変換済み）
+                    meta = QuestionUtils.get_meta(question)
+                    st.markdown(meta['question_text'])
                     
                     if not choices:
                         # 自由入力問題
@@ -627,7 +636,7 @@ class AnswerModeComponent:
                             placeholder="解答を入力..."
                         )
                     
-                    elif AnswerModeComponent._is_ordering_question(question.get('question', ''), question.get('choices', [])):
+                    elif meta['type'] == question_meta.QUESTION_TYPE_ORDERING:
                         # 並び替え問題
                         shuffle_key = f"shuffled_choices_{qid}_{group_id}"
                         mapping_key = f"label_mapping_{qid}_{group_id}"
@@ -842,27 +851,7 @@ class AnswerModeComponent:
     @staticmethod
     def _is_ordering_question(question_text: str, choices: List[str] = None) -> bool:
         """並び替え問題の判定"""
-        # 明確な並び替えキーワードがある場合のみ並び替え問題と判定
-        strict_ordering_keywords = ['順番', '順序', '配列', '並び替え']
-        
-        # 明確な並び替えキーワードがある場合
-        if any(keyword in question_text for keyword in strict_ordering_keywords):
-            return True
-        
-        # 「手順」キーワードがある場合は選択肢もチェック
-        if '手順' in question_text and choices:
-            # 選択肢が単語の組み合わせ（例：「ア→イ→ウ」）の場合のみ並び替え問題
-            # 通常の文章選択肢の場合は並び替え問題ではない
-            choice_pattern_count = 0
-            for choice in choices:
-                # 矢印やカンマで区切られた短い記号パターンを検出
-                if ('→' in choice or ',' in choice) and len(choice) < 20:
-                    choice_pattern_count += 1
-            
-            # 選択肢の大部分が順序パターンの場合のみ並び替え問題
-            return choice_pattern_count >= len(choices) * 0.8
-        
-        return False
+        return question_meta.is_ordering_question(question_text, choices)
 
 
 class ResultModeComponent:
@@ -880,13 +869,48 @@ class ResultModeComponent:
         # LLM解説エリアを自己評価の前に追加 (一時的に無効化)
         # ResultModeComponent._render_llm_explanation(questions, group_id)
         
+        # 関連問題（インデックスがある場合のみ）
+        ResultModeComponent._render_related_questions(questions)
+        
         # 自己評価エリア（結果データも渡す）
         return ResultModeComponent._render_self_evaluation(group_id, result_data)
     
+    @staticmethod
+    def _render_related_questions(questions: List[Dict]):
+        """解いた問題に類似した問題を表示"""
+        index = get_related_index() if get_related_index is not None else None
+        if index is None:
+            return
+        
+        group_ids = [q.get('number', '') for q in questions]
+        has_gakushi_permission = st.session_state.get("has_gakushi_permission", False)
+        allow = None if has_gakushi_permission else (lambda qid: not qid.startswith('G'))
+        
+        # グループ内の各問題の近傍をまとめ、類似度の高い順に表示
+        best_scores: Dict[str, float] = {}
+        for qid in group_ids:
+            for related_id, score in index.related(qid, RELATED_QUESTIONS_COUNT, exclude=group_ids, allow=allow):
+                if score > best_scores.get(related_id, float('-inf')):
+                    best_scores[related_id] = score
+        if not best_scores:
+            return
+        
+        related_ids = sorted(best_scores, key=best_scores.get, reverse=True)[:RELATED_QUESTIONS_COUNT]
+        with st.expander("🔗 関連問題", expanded=False):
+            lines = []
+            for related_id in related_ids:
+                related_q = ALL_QUESTIONS_DICT.get(related_id, {})
+                text = str(related_q.get('question', ''))
+                if len(text) > 40:
+                    text = text[:40] + "…"
+                subject = get_standardized_subject(related_q.get('subject', ''))
+                lines.append(f"- **{related_id}**（{subject}）{text}")
+            st.markdown("\n".join(lines))
+    
     @staticmethod
     def _render_llm_explanation(questions: List[Dict], group_id: str):
         """LLM解説セクションの描画（修正版）"""
-        if generate_dental_explanation is None:
+        if stream_cached_explanation is None:
             st.info("🚧 AI解説機能は現在メンテナンス中です。基本的な解説機能をご利用ください。")
             return
         
@@ -900,27 +924,38 @@ class ResultModeComponent:
             if explanation_key not in st.session_state:
                 st.session_state[explanation_key] = None
             
-            # ボタンが押されたら、そのボタンに対応する'question'データを直接ヘルパー関数に渡す
+            # ボタンが押されたら受信したチャンクから順に表示（キャッシュ済みなら即時表示）
             if st.button(f"📝 問題 {qid} の解説を生成", key=f"explain_btn_{qid}_{group_id}"):
-                handle_llm_explanation_request(question, group_id)
-            
-            if st.session_state[explanation_key]:
+                with st.expander(f"📖 問題 {qid} の解説", expanded=True):
+                    placeholder = st.empty()
+                    explanation = ""
+                    for chunk in stream_cached_explanation(question, _resolve_explanation_image_url(question)):
+                        explanation += chunk
+                        placeholder.markdown(explanation + "▌")
+                    placeholder.markdown(explanation)
+                    st.session_state[explanation_key] = explanation
+                    ResultModeComponent._render_explanation_feedback(qid, group_id, explanation)
+            
+            elif st.session_state[explanation_key]:
                 with st.expander(f"📖 問題 {qid} の解説", expanded=True):
                     st.markdown(st.session_state[explanation_key])
-                    
-                    # フィードバックボタン
-                    col1, col2, col3 = st.columns([1, 1, 4])
-                    
-                    with col1:
-                        if st.button("👍", key=f"like_{qid}_{group_id}", help="この解説は役に立った"):
-                            ResultModeComponent._save_feedback(qid, st.session_state[explanation_key], 1, "helpful")
-                            st.success("フィードバックありがとうございます！")
-                    
-                    with col2:
-                        if st.button("👎", key=f"dislike_{qid}_{group_id}", help="この解説は役に立たなかった"):
-                            ResultModeComponent._save_feedback(qid, st.session_state[explanation_key], -1, "not_helpful")
-                            st.success("フィードバックありがとうございます！")
-                            st.warning("フィードバックありがとうございます。改善に努めます。")
+                    ResultModeComponent._render_explanation_feedback(qid, group_id, st.session_state[explanation_key])
+    
+    @staticmethod
+    def _render_explanation_feedback(qid: str, group_id: str, explanation: str):
+        """解説へのフィードバックボタン"""
+        col1, col2, col3 = st.columns([1, 1, 4])
+        
+        with col1:
+            if st.button("👍", key=f"like_{qid}_{group_id}", help="この解説は役に立った"):
+                ResultModeComponent._save_feedback(qid, explanation, 1, "helpful")
+                st.success("フィードバックありがとうございます！")
+        
+        with col2:
+            if st.button("👎", key=f"dislike_{qid}_{group_id}", help="この解説は役に立たなかった"):
+                ResultModeComponent._save_feedback(qid, explanation, -1, "not_helpful")
+                st.success("フィードバックありがとうございます！")
+                st.warning("フィードバックありがとうございます。改善に努めます。")
     
     @staticmethod
     def _save_feedback(question_id: str, generated_text: str, rating: int, feedback_type: str):
@@ -1007,62 +1042,34 @@ class PracticeSession:
         """次の問題グループを取得（日本時間ベース）"""
         now = get_japan_now()
         
-        # 利用可能な復習問題を取得
-        stq = st.session_state.get("short_term_review_queue", [])
-        ready_reviews = []
-        for i, item in enumerate(stq):
-            ra = item.get("ready_at")
-            if isinstance(ra, str):
-                try:
-                    ra = datetime.datetime.fromisoformat(ra)
-                except Exception:
-                    ra = now
-            if not ra or ra <= now:
-                ready_reviews.append((i, item))
-        
-        # 利用可能な新規問題を取得
-        main_queue = st.session_state.get("main_queue", [])
+        # 短期復習キュー（復習可能時刻のヒープ）とメインキュー（deque）を取得
+        stq = coerce_review_queue(st.session_state.get("short_term_review_queue", []))
+        st.session_state["short_term_review_queue"] = stq
+        main_queue = coerce_main_queue(st.session_state.get("main_queue", []))
+        st.session_state["main_queue"] = main_queue
         
         # 復習問題と新規問題のバランス調整
-        review_count = len(ready_reviews)
+        review_count = stq.ready_count(now)
         new_count = len(main_queue)
         
-        
         # 復習問題が5個以上溜まっている場合は復習を優先
         if review_count >= 5:
-            if ready_reviews:
-                i, item = ready_reviews[0]
-                stq.pop(i)
-                st.session_state["short_term_review_queue"] = stq
-                result_group = item.get("group", [])
-                return result_group
+            return stq.pop_ready()
         
         # 通常時：復習30%、新規70%の確率で選択
         elif review_count > 0 and new_count > 0:
             if random.random() < 0.3:  # 30%の確率で復習
-                i, item = ready_reviews[0]
-                stq.pop(i)
-                st.session_state["short_term_review_queue"] = stq
-                result_group = item.get("group", [])
-                return result_group
+                return stq.pop_ready()
             else:
-                result_group = main_queue.pop(0) if main_queue else []
-                st.session_state["main_queue"] = main_queue
-                return result_group
+                return main_queue.popleft()
         
         # 復習問題のみ利用可能
-        elif ready_reviews:
-            i, item = ready_reviews[0]
-            stq.pop(i)
-            st.session_state["short_term_review_queue"] = stq
-            result_group = item.get("group", [])
-            return result_group
+        elif review_count > 0:
+            return stq.pop_ready()
         
         # 新規問題のみ利用可能
         elif main_queue:
-            result_group = main_queue.pop(0)
-            st.session_state["main_queue"] = main_queue
-            return result_group
+            return main_queue.popleft()
         
         # 問題がない場合
         return []
@@ -1070,12 +1077,9 @@ class PracticeSession:
     def enqueue_short_review(self, group: List[str], minutes: int):
         """短期復習キューに追加（日本時間ベース）"""
         ready_at = get_japan_now() + datetime.timedelta(minutes=minutes)
-        if "short_term_review_queue" not in st.session_state:
-            st.session_state.short_term_review_queue = []
-        st.session_state.short_term_review_queue.append({
-            "group": group,
-            "ready_at": ready_at
-        })
+        stq = coerce_review_queue(st.session_state.get("short_term_review_queue", []))
+        stq.push(group, ready_at)
+        st.session_state["short_term_review_queue"] = stq
     
     def setup_daily_quiz_from_cloud_function(self):
         """Cloud Functionからおまかせクイズをセットアップ"""
@@ -1084,6 +1088,25 @@ class PracticeSession:
             st.error("ユーザーIDが見つかりません")
             return False
         
+        # 事前計算済みの当日キューがあれば1回の読み取りで復元
+        if load_daily_queue is not None:
+            precomputed_queue = load_daily_queue(uid)
+            # 今日すでに回答した問題（保存前に閉じた以前のセッション分を含む）とこのセッションの回答を除外
+            if precomputed_queue:
+                precomputed_queue = drop_reviewed_today(precomputed_queue, st.session_state.get("cards", {}))
+            answered = set(st.session_state.get("result_log", {}).keys())
+            if precomputed_queue and answered:
+                precomputed_queue = [
+                    [qid for qid in group if qid not in answered] for group in precomputed_queue
+                ]
+                precomputed_queue = [group for group in precomputed_queue if group]
+            if precomputed_queue:
+                st.session_state["main_queue"] = precomputed_queue
+                st.session_state["current_q_group"] = []
+                st.session_state["short_term_review_queue"] = []
+                st.success(f"おまかせ学習キューを読み込みました（{len(precomputed_queue)}グループ）")
+                return True
+        
         # getDailyQuiz Cloud Functionを呼び出し
         from auth import call_cloud_function
         payload = {"uid": uid}
@@ -1122,41 +1145,15 @@ class PracticeSession:
                 cards = self.firestore_manager.load_user_cards(uid)
                 st.session_state["cards"] = cards
             
-            # 新規カード選択
+            # 新規カード＋期限切れ復習カードを共通ポリシーで選択（5問ずつグループ化）
             new_cards_per_day = st.session_state.get("new_cards_per_day", 10)
             recent_qids = list(st.session_state.get("result_log", {}).keys())[-10:]
             
-            selected_new = CardSelectionUtils.pick_new_cards_for_today(
-                ALL_QUESTIONS, cards, new_cards_per_day, recent_qids
-            )
-            
-            # 復習カード選択（期限切れのもの）
-            now = datetime.datetime.now(datetime.timezone.utc)
-            due_cards = []
-            for qid, card in cards.items():
-                # SM2データから復習期限を取得
-                sm2_data = card.get("sm2", {})
-                due_date = sm2_data.get("due_date")
-                if due_date:
-                    try:
-                        if isinstance(due_date, str):
-                            next_dt = datetime.datetime.fromisoformat(due_date)
-                        else:
-                            next_dt = due_date
-                        if next_dt <= now:
-                            due_cards.append(qid)
-                    except (ValueError, TypeError):
-                        continue
+            queue = build_daily_queue(ALL_QUESTIONS, cards, new_cards_per_day, recent_qids)
+            main_queue = queue["main_queue"]
             
-            # グループ化（5問ずつ）
-            all_cards = selected_new + due_cards
-            random.shuffle(all_cards)
-            
-            main_queue = []
-            for i in range(0, len(all_cards), 5):
-                group = all_cards[i:i+5]
-                if group:
-                    main_queue.append(group)
+            # 当日（JST 3時基準）の最初の生成結果を保存し、次回以降は1回の読み取りで復元
+            save_daily_queue(uid, queue)
             
             st.session_state["main_queue"] = main_queue
             st.session_state["current_q_group"] = []
@@ -1273,7 +1270,7 @@ def _render_omakase_session(practice_session: PracticeSession, uid: str):
             return
     
     # 問題表示
-    _display_current_question(practice_session, uid)
+    _render_question_panel(practice_session, uid)
 
 
 def _render_free_learning_session(practice_session: PracticeSession, uid: str):
@@ -1311,7 +1308,7 @@ def _render_free_learning_session(practice_session: PracticeSession, uid: str):
             return
     
     # 問題表示
-    _display_current_question(practice_session, uid)
+    _render_question_panel(practice_session, uid)
 
 
 
@@ -1354,6 +1351,12 @@ def _is_review_mode(current_group: List[str]) -> bool:
     return False
 
 
+@_panel_fragment
+def _render_question_panel(practice_session: PracticeSession, uid: str):
+    """問題・解答・結果パネル（解答や自己評価ではこのパネルのみ再実行される）"""
+    _display_current_question(practice_session, uid)
+
+
 def _display_current_question(practice_session: PracticeSession, uid: str):
     """現在の問題を表示（コンポーネントベースの実装）"""
     
@@ -1501,16 +1504,19 @@ def _process_group_answer_improved(q_objects: List[Dict], user_selections: Dict,
                     mapped_answer += mapped_char
                 user_answer_str = mapped_answer
         
-        # 正誤判定（複数解答対応）
-        is_correct = QuestionUtils.check_answer(user_answer_str, correct_answer)
-        
         result_data[qid] = {
             'user_answer': user_answer,
             'user_answer_str': user_answer_str,
             'correct_answer': correct_answer,
-            'is_correct': is_correct
         }
     
+    # 正誤判定（事前計算済みの正答マスクでグループをまとめて採点）
+    grades = QuestionUtils.grade_many(
+        q_objects, {qid: data['user_answer_str'] for qid, data in result_data.items()}
+    )
+    for qid, data in result_data.items():
+        data['is_correct'] = grades.get(qid, False)
+    
     # 結果をセッションに保存（自己評価まで待機）
     st.session_state[f"result_{group_id}"] = result_data
     st.session_state[f"checked_{group_id}"] = True
@@ -1530,7 +1536,7 @@ def _process_group_answer_improved(q_objects: List[Dict], user_selections: Dict,
         total_count = len(result_data)
         st.info(f"📊 {correct_count}/{total_count} 問正解 - 自己評価をして学習記録を保存しましょう。")
     
-    st.rerun()
+    _rerun_panel()
 
 
 def _process_self_evaluation_improved(q_objects: List[Dict], quality_text: str, 
@@ -1588,6 +1594,7 @@ def _process_self_evaluation_improved(q_objects: List[Dict], quality_text: str,
     
     # セッション状態を強制的に更新
     st.session_state["cards"] = cards.copy()  # コピーして確実に更新を検知させる
+    st.session_state[CARDS_VERSION_KEY] = st.session_state.get(CARDS_VERSION_KEY, 0) + 1
     
     # ランキングスコア更新（カード更新後に実行）
     try:
@@ -1691,11 +1698,13 @@ def _process_self_evaluation_improved(q_objects: List[Dict], quality_text: str,
     if next_group:
         st.session_state["current_q_group"] = next_group
         st.success("✅ 学習記録を保存しました。次の問題に進みます！")
+        # 次の問題は解答パネルのみ再実行（サイドバー統計は次回の全体再実行時にカードのバージョンで更新）
+        _rerun_panel()
     else:
         st.session_state["current_q_group"] = []
         st.success("🎉 全ての問題が完了しました！お疲れ様でした！")
     
-    # サイドバーの表示を即座に更新するためのフラグ
+    # セッション完了時はサイドバーも含めて更新
     st.session_state["sidebar_refresh_needed"] = True
     
     st.rerun()
@@ -1747,7 +1756,7 @@ def _skip_current_group(practice_session: PracticeSession):
     else:
         st.session_state["current_q_group"] = []
     
-    st.rerun()
+    _rerun_panel()
 
 
 def _reset_session():
@@ -1775,15 +1784,92 @@ def _reset_session():
     st.rerun()
 
 
+def _calculate_today_study_stats(cards: Dict, result_log: Dict, today: datetime.date) -> Dict[str, Any]:
+    """本日の復習対象・学習完了数を計算（全カードを走査するためサイドバー表示時のみ使用）"""
+    from modules.search_page import get_review_priority_cards
+
+    # 今日の復習対象カードを優先度付きで取得
+    priority_cards = get_review_priority_cards(cards, today)
+
+    # 本日の学習完了数を計算（重複カウント防止強化版）
+    today_reviews_done = 0
+    today_new_done = 0
+    processed_cards = set()  # 重複カウント防止
+
+    try:
+        for q_num, card in cards.items():
+            if not isinstance(card, dict) or q_num in processed_cards:
+                continue
+
+            history = card.get('history', [])
+            if not history:
+                continue
+
+            # 履歴の日付を日本時間で1回だけ変換
+            review_dates = []
+            for review in history:
+                if isinstance(review, dict):
+                    try:
+                        review_dates.append(get_japan_datetime_from_timestamp(review.get('timestamp', '')).date())
+                    except Exception:
+                        continue
+
+            if today in review_dates:
+                processed_cards.add(q_num)  # 処理済みマーク
+
+                # 今日より前に学習記録があるかどうかで新規/復習を判定（日本時間ベース）
+                if any(review_date < today for review_date in review_dates):
+                    today_reviews_done += 1
+                else:
+                    today_new_done += 1
+    except Exception as e:
+        # エラーが発生した場合は0で初期化
+        today_reviews_done = 0
+        today_new_done = 0
+
+    # result_logからも本日のデータを取得（補完用）
+    for q_id, result_data in result_log.items():
+        if q_id in processed_cards:
+            continue  # 既にhistoryでカウント済み
+
+        timestamp = result_data.get('timestamp', '')
+        if isinstance(timestamp, str):
+            try:
+                result_date = datetime.datetime.fromisoformat(timestamp.replace('Z', '+00:00')).date()
+                if result_date == today:
+                    # result_logでは全て新規として扱う（自己評価時のログなので）
+                    today_new_done += 1
+                    processed_cards.add(q_id)
+            except:
+                pass
+
+    return {
+        "priority_cards": priority_cards,
+        "overdue_count": sum(1 for card in priority_cards if card[2] > 0),  # 経過日数 > 0
+        "due_today_count": sum(1 for card in priority_cards if card[2] == 0),  # 今日が復習予定日
+        "reviews_done": today_reviews_done,
+        "new_done": today_new_done,
+    }
+
+
+def _get_today_study_stats(cards: Dict, today: datetime.date) -> Dict[str, Any]:
+    """本日の学習統計をカードのバージョンごとにキャッシュして取得"""
+    cache_key = (st.session_state.get(CARDS_VERSION_KEY, 0), id(cards), today)
+    cached = st.session_state.get("_today_study_stats")
+    if cached and cached[0] == cache_key:
+        return cached[1]
+
+    stats = _calculate_today_study_stats(cards, st.session_state.get("result_log", {}), today)
+    st.session_state["_today_study_stats"] = (cache_key, stats)
+    return stats
+
+
 def render_practice_sidebar():
     """練習ページ専用のサイドバーを描画"""
     
-    # サイドバー更新フラグをチェック
+    # サイドバー更新フラグをチェック（統計はカードのバージョンで再計算されるためフラグのクリアのみ）
     if st.session_state.get("sidebar_refresh_needed", False):
         st.session_state["sidebar_refresh_needed"] = False
-        # フラグをクリアした後、少し待ってから処理を続行
-        import time
-        time.sleep(0.1)
     
     try:
         uid = st.session_state.get("uid")
@@ -1817,19 +1903,14 @@ def render_practice_sidebar():
                 today = get_japan_today()  # 日本時間の今日
                 cards = st.session_state.get("cards", {})
 
-                # SM-2アルゴリズムベースの復習スケジュール計算
-                from modules.search_page import calculate_sm2_review_schedule, get_review_priority_cards
-                
-                # 7日分の復習スケジュールを計算
-                review_schedule = calculate_sm2_review_schedule(cards, days_ahead=7)
-                
-                # 今日の復習対象カードを優先度付きで取得
-                today_priority_cards = get_review_priority_cards(cards, today)
+                # カードが更新された時だけ再計算（解答パネルのみの再実行では再計算しない）
+                stats = _get_today_study_stats(cards, today)
+                today_priority_cards = stats["priority_cards"]
                 review_count = len(today_priority_cards)
-                
-                # 今日の復習統計
-                overdue_cards = [card for card in today_priority_cards if card[2] > 0]  # 経過日数 > 0
-                due_today_cards = [card for card in today_priority_cards if card[2] == 0]  # 今日が復習予定日
+                overdue_count = stats["overdue_count"]
+                due_today_count = stats["due_today_count"]
+                today_reviews_done = stats["reviews_done"]
+                today_new_done = stats["new_done"]
 
                 # 今日の復習情報のみ表示（シンプル・前向き）
                 col1, col2 = st.columns(2)
@@ -1838,8 +1919,8 @@ def render_practice_sidebar():
                     st.metric(
                         label="今日の復習",
                         value=f"{review_count}問",
-                        delta=f"期限切れ: {len(overdue_cards)}問" if overdue_cards else "すべて期限内 ✅",
-                        help=f"期限切れ: {len(overdue_cards)}問 / 今日予定: {len(due_today_cards)}問"
+                        delta=f"期限切れ: {overdue_count}問" if overdue_count else "すべて期限内 ✅",
+                        help=f"期限切れ: {overdue_count}問 / 今日予定: {due_today_count}問"
                     )
                 
                 with col2:
@@ -1852,96 +1933,8 @@ def render_practice_sidebar():
                     )
 
                 # 復習詳細（シンプル表示）
-                if review_count > 0 and overdue_cards:
-                    st.warning(f"⚠️ 期限切れの復習問題が {len(overdue_cards)}問 あります。優先的に学習することをお勧めします。")
-
-                # デバッグ情報表示（今日にフォーカス）
-
-                # 本日の学習完了数を計算（重複カウント防止強化版）
-                today_reviews_done = 0
-                today_new_done = 0
-                processed_cards = set()  # 重複カウント防止
-                
-
-                try:
-                    for q_num, card in cards.items():
-                        if not isinstance(card, dict) or q_num in processed_cards:
-                            continue
-
-                        history = card.get('history', [])
-                        if not history:
-                            continue
-
-                        # 本日の学習履歴があるかチェック（日本時間ベース）
-                        has_today_session = False
-                        for review in history:
-                            if isinstance(review, dict):
-                                review_timestamp = review.get('timestamp', '')
-                                review_date_obj = None
-                                
-                                # タイムスタンプのパース処理（日本時間変換）
-                                try:
-                                    review_datetime_jst = get_japan_datetime_from_timestamp(review_timestamp)
-                                    review_date_obj = review_datetime_jst.date()
-                                except Exception:
-                                    continue
-                                
-                                if review_date_obj == today:
-                                    has_today_session = True
-                                    break
-
-                        if has_today_session:
-                            processed_cards.add(q_num)  # 処理済みマーク
-
-                            # 今日より前に学習記録があるかどうかで新規/復習を判定（日本時間ベース）
-                            has_previous_learning = False
-                            
-                            for review in history:
-                                if isinstance(review, dict):
-                                    timestamp = review.get('timestamp', '')
-                                    
-                                    try:
-                                        review_datetime_jst = get_japan_datetime_from_timestamp(timestamp)
-                                        review_date_obj = review_datetime_jst.date()
-                                        
-                                        # 今日より前の学習記録があるかチェック
-                                        if review_date_obj and review_date_obj < today:
-                                            has_previous_learning = True
-                                            break
-                                    except Exception:
-                                        continue
-
-                            if has_previous_learning:
-                                # 過去に学習記録があるので復習
-                                today_reviews_done += 1
-                            else:
-                                # 今日が初回学習なので新規
-                                today_new_done += 1
-                                
-                                
-                except Exception as e:
-                    # エラーが発生した場合は0で初期化
-                    today_reviews_done = 0
-                    today_new_done = 0
-
-                # result_logからも本日のデータを取得（補完用）
-                result_log = st.session_state.get("result_log", {})
-                
-                for q_id, result_data in result_log.items():
-                    if q_id in processed_cards:
-                        continue  # 既にhistoryでカウント済み
-                        
-                    timestamp = result_data.get('timestamp', '')
-                    if isinstance(timestamp, str):
-                        try:
-                            result_date = datetime.datetime.fromisoformat(timestamp.replace('Z', '+00:00')).date()
-                            if result_date == today:
-                                # result_logでは全て新規として扱う（自己評価時のログなので）
-                                today_new_done += 1
-                                processed_cards.add(q_id)
-                        except:
-                            pass
-                
+                if review_count > 0 and overdue_count:
+                    st.warning(f"⚠️ 期限切れの復習問題が {overdue_count}問 あります。優先的に学習することをお勧めします。")
 
                 # 新規学習目標数（安全な取得）
                 new_target = st.session_state.get("new_cards_per_day", 10)
@@ -2031,8 +2024,8 @@ def render_practice_sidebar():
                         # SM-2アルゴリズムベースの復習カード選択
                         grouped_queue = []
                         
-                        # 今日の復習対象カードを優先度順で取得
-                        priority_cards = get_review_priority_cards(cards, today)
+                        # 今日の復習対象カードを優先度順で取得（サイドバー表示と同じ計算結果を利用）
+                        priority_cards = today_priority_cards
                         
                         
                         # 復習カードを優先度順で追加（最大100問まで）
@@ -2089,7 +2082,7 @@ def render_practice_sidebar():
                                 if k.startswith(("checked_", "user_selection_", "shuffled_", "free_input_", "order_input_")):
                                     del st.session_state[k]
 
-                            save_user_data(st.session_state.get("uid"), st.session_state)
+                            save_user_data(st.session_state.get("uid"), session_state=st.session_state)
                             st.session_state["initializing_study"] = False
                             st.success(f"今日の学習を開始します！（{len(grouped_queue)}問）")
                             st.rerun()
@@ -2271,7 +2264,7 @@ def render_practice_sidebar():
                             if key.startswith(("checked_", "user_selection_", "shuffled_", "free_input_", "order_input_")):
                                 del st.session_state[key]
 
-                        save_user_data(st.session_state.get("uid"), st.session_state)
+                        save_user_data(st.session_state.get("uid"), session_state=st.session_state)
                         st.success(f"演習を開始します！（{len(grouped_queue)}グループ）")
                         st.rerun()
 
@@ -2281,16 +2274,9 @@ def render_practice_sidebar():
 
         # 短期復習の「準備完了」件数を表示（日本時間ベース）
         now_jst = get_japan_now()
-        ready_short = 0
-        for item in st.session_state.get("short_term_review_queue", []):
-            ra = item.get("ready_at")
-            if isinstance(ra, str):
-                try:
-                    ra = datetime.datetime.fromisoformat(ra)
-                except Exception:
-                    ra = now_jst
-            if not ra or ra <= now_jst:
-                ready_short += 1
+        stq = coerce_review_queue(st.session_state.get("short_term_review_queue", []))
+        st.session_state["short_term_review_queue"] = stq
+        ready_short = stq.ready_count(now_jst)
 
         st.write(f"メインキュー: **{len(st.session_state.get('main_queue', []))}** グループ")
         st.write(f"短期復習: **{ready_short}** グループ準備完了")
@@ -2298,13 +2284,13 @@ def render_practice_sidebar():
         # SM-2復習状況（今日のみ表示、日本時間ベース）
         try:
             cards = st.session_state.get("cards", {})
-            from modules.search_page import get_review_priority_cards, get_japan_today
+            from modules.search_page import get_japan_today
             
-            # 今日の復習状況のみ表示（日本時間）
+            # 今日の復習状況のみ表示（日本時間、カード更新時のみ再計算）
             today = get_japan_today()
-            today_priority_cards = get_review_priority_cards(cards, today)
-            today_count = len(today_priority_cards)
-            overdue_count = len([card for card in today_priority_cards if card[2] > 0])
+            stats = _get_today_study_stats(cards, today)
+            today_count = len(stats["priority_cards"])
+            overdue_count = stats["overdue_count"]
             
             if today_count > 0:
                 st.markdown("**📅 今日の復習:**")
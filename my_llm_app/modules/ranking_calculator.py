@@ -2,11 +2,19 @@
 ランキングスコア計算モジュール
 演習データからリアルタイムでランキングスコアを計算
 """
+import bisect
 import datetime
 import streamlit as st
 from typing import Dict, List, Any, Optional
 from collections import defaultdict
 
+try:
+    from app_logging import get_logger  # type: ignore
+except ImportError:  # pragma: no cover - fallback
+    from my_llm_app.app_logging import get_logger  # type: ignore
+
+logger = get_logger("ranking_calculator")
+
 # 日本時間用のタイムゾーン
 import pytz
 JST = pytz.timezone('Asia/Tokyo')
@@ -55,6 +63,29 @@ def get_japan_datetime_from_timestamp(timestamp) -> datetime.datetime:
     except Exception:
         return datetime.datetime.now(JST)
 
+# 評価ログと学習履歴を同一の学習とみなす時間差（秒）
+DUPLICATE_WINDOW_SECONDS = 60
+
+def _history_epochs(card: Any) -> List[float]:
+    """カードの学習履歴のタイムスタンプをエポック秒の昇順リストに変換"""
+    if not isinstance(card, dict):
+        return []
+    history = card.get('history', [])
+    if not isinstance(history, list):
+        return []
+    return sorted(
+        get_japan_datetime_from_timestamp(study['timestamp']).timestamp()
+        for study in history
+        if isinstance(study, dict) and study.get('timestamp')
+    )
+
+def _has_nearby_epoch(epochs: List[float], target: float, window: float = DUPLICATE_WINDOW_SECONDS) -> bool:
+    """昇順リストに target との差が window 秒未満の値があるか（二分探索）"""
+    i = bisect.bisect_left(epochs, target)
+    if i < len(epochs) and epochs[i] - target < window:
+        return True
+    return i > 0 and target - epochs[i - 1] < window
+
 def calculate_weekly_points(cards: Dict, evaluation_logs: List[Dict] = None) -> int:
     """
     週間ポイントを計算
@@ -69,8 +100,8 @@ def calculate_weekly_points(cards: Dict, evaluation_logs: List[Dict] = None) ->
     weekly_studies = 0
     weekly_correct = 0
     
-    print(f"[DEBUG] 週間ポイント計算開始 - 今日: {today}, 週開始: {week_start}")
-    print(f"[DEBUG] カード数: {len(cards)}, 評価ログ数: {len(evaluation_logs) if evaluation_logs else 0}")
+    logger.debug("週間ポイント計算開始 - 今日: %s, 週開始: %s", today, week_start)
+    logger.debug("カード数: %d, 評価ログ数: %d", len(cards), len(evaluation_logs) if evaluation_logs else 0)
     
     # カードデータから今週の学習を計算
     cards_with_history = 0
@@ -104,8 +135,7 @@ def calculate_weekly_points(cards: Dict, evaluation_logs: List[Dict] = None) ->
                             if quality >= 5:
                                 weekly_points += 2
                 except Exception as e:
-                    # デバッグ用
-                    print(f"週間ポイント計算エラー (q_id: {q_id}): {e}")
+                    logger.debug("週間ポイント計算エラー (q_id: %s): %s", q_id, e)
                     continue
         else:
             # フォールバック: 履歴がない最適化カードの場合、performance/updated_at から推定
@@ -142,6 +172,8 @@ def calculate_weekly_points(cards: Dict, evaluation_logs: List[Dict] = None) ->
     
     # セッション状態の評価ログも考慮
     if evaluation_logs:
+        # 問題IDごとの履歴タイムスタンプ（ログで参照された問題だけ1回ずつ変換）
+        history_epochs: Dict[str, List[float]] = {}
         for log in evaluation_logs:
             try:
                 log_timestamp = log.get('timestamp')
@@ -151,20 +183,12 @@ def calculate_weekly_points(cards: Dict, evaluation_logs: List[Dict] = None) ->
                 if log_date >= week_start:
                     quality = log.get('quality', 0)
                     
-                    # 重複チェック（同じ問題IDの場合はスキップ）
+                    # 重複チェック（同じ問題の学習記録と1分以内なら同一の学習とみなす）
                     q_id = log.get('question_id', '')
-                    card = cards.get(q_id, {})
-                    history = card.get('history', [])
-                    
-                    # 最新の学習記録と重複していないかチェック
-                    is_duplicate = False
-                    for study in history:
-                        study_timestamp = study.get('timestamp')
-                        if study_timestamp:
-                            study_datetime_jst = get_japan_datetime_from_timestamp(study_timestamp)
-                            if abs((log_datetime_jst - study_datetime_jst).total_seconds()) < 60:  # 1分以内は重複とみなす
-                                is_duplicate = True
-                                break
+                    epochs = history_epochs.get(q_id)
+                    if epochs is None:
+                        epochs = history_epochs[q_id] = _history_epochs(cards.get(q_id))
+                    is_duplicate = _has_nearby_epoch(epochs, log_datetime_jst.timestamp())
                     
                     if not is_duplicate:
                         weekly_studies += 1
@@ -189,9 +213,39 @@ def calculate_weekly_points(cards: Dict, evaluation_logs: List[Dict] = None) ->
         elif accuracy_rate >= 0.6:
             weekly_points += int(weekly_studies * 0.1)  # 10%ボーナス
     
-    print(f"[DEBUG] 履歴ありカード数: {cards_with_history}")
-    print(f"[DEBUG] 週間学習数: {weekly_studies}, 週間正解数: {weekly_correct}, 週間ポイント: {weekly_points}")
+    logger.debug("週間: 履歴ありカード数=%d, 学習数=%d, 正解数=%d, ポイント=%d",
+                 cards_with_history, weekly_studies, weekly_correct, weekly_points)
+    
+    return weekly_points
+
+def calculate_weekly_points_from_events(events: List[Dict]) -> int:
+    """
+    週間ポイントを今週の自己評価イベント（review_log のパーティション）から計算
+    - 配点は calculate_weekly_points と同じ（カードの history は走査しない）
+    """
+    weekly_points = 0
+    weekly_correct = 0
+    for event in events:
+        quality = event.get('g', 0)
+        weekly_points += 10
+        if quality >= 3:
+            weekly_correct += 1
+            weekly_points += 5
+            if quality >= 4:
+                weekly_points += 3
+            if quality >= 5:
+                weekly_points += 2
+    
+    weekly_studies = len(events)
+    if weekly_studies > 0:
+        accuracy_rate = weekly_correct / weekly_studies
+        if accuracy_rate >= 0.8:
+            weekly_points += int(weekly_studies * 0.2)
+        elif accuracy_rate >= 0.6:
+            weekly_points += int(weekly_studies * 0.1)
     
+    logger.debug("週間（イベントログ）: 学習数=%d, 正解数=%d, ポイント=%d",
+                 weekly_studies, weekly_correct, weekly_points)
     return weekly_points
 
 def calculate_total_points(cards: Dict, evaluation_logs: List[Dict] = None) -> tuple[int, int, float]:
@@ -202,7 +256,7 @@ def calculate_total_points(cards: Dict, evaluation_logs: List[Dict] = None) -> t
     total_problems = 0
     total_correct = 0
     
-    print(f"[DEBUG] 総合ポイント計算開始 - カード数: {len(cards)}")
+    logger.debug("総合ポイント計算開始 - カード数: %d", len(cards))
     
     cards_with_history = 0
     total_studies = 0
@@ -279,9 +333,8 @@ def calculate_total_points(cards: Dict, evaluation_logs: List[Dict] = None) -> t
     
     accuracy_rate = (total_correct / total_problems * 100) if total_problems > 0 else 0
     
-    print(f"[DEBUG] 履歴ありカード数: {cards_with_history}")
-    print(f"[DEBUG] 総学習数: {total_studies}, 総問題数: {total_problems}, 総正解数: {total_correct}")
-    print(f"[DEBUG] 総ポイント: {total_points}, 正答率: {accuracy_rate:.1f}%")
+    logger.debug("総合: 履歴ありカード数=%d, 学習数=%d, 問題数=%d, 正解数=%d, ポイント=%d, 正答率=%.1f%%",
+                 cards_with_history, total_studies, total_problems, total_correct, total_points, accuracy_rate)
     
     return total_points, total_problems, accuracy_rate
 
@@ -16,6 +16,7 @@ updated_ranking_page から呼び出されることを想定。
 from __future__ import annotations
 
 import datetime
+import logging
 import re
 from typing import Dict, Any, List, Tuple
 
@@ -30,20 +31,39 @@ try:
 except ImportError:  # pragma: no cover - fallback
     from my_llm_app.firestore_db import get_firestore_manager  # type: ignore
 
+try:
+    from app_logging import get_logger  # type: ignore
+except ImportError:  # pragma: no cover - fallback
+    from my_llm_app.app_logging import get_logger  # type: ignore
+
+try:
+    from firestore_usage import accounted_job  # type: ignore
+except ImportError:  # pragma: no cover - fallback
+    from my_llm_app.firestore_usage import accounted_job  # type: ignore
+
+try:
+    import review_log  # type: ignore
+except ImportError:  # pragma: no cover - fallback
+    from my_llm_app import review_log  # type: ignore
+
 try:
     from modules.ranking_calculator import (  # type: ignore
         calculate_weekly_points,
+        calculate_weekly_points_from_events,
         calculate_total_points,
         calculate_mastery_score,
     )
 except ImportError:  # pragma: no cover - fallback
     from .ranking_calculator import (  # type: ignore
         calculate_weekly_points,
+        calculate_weekly_points_from_events,
         calculate_total_points,
         calculate_mastery_score,
     )
 
 
+logger = get_logger("ranking_updater")
+
 JST = pytz.timezone("Asia/Tokyo")
 
 
@@ -62,7 +82,7 @@ def _get_user_profiles(db: FirestoreClient) -> List[Dict[str, Any]]:
     """全ユーザーのプロフィールを取得し、重複を除去"""
     profiles = []
     
-    print("[DEBUG] ユーザープロフィール取得開始")
+    logger.debug("ユーザープロフィール取得開始")
     
     # usersコレクションとstudy_cardsコレクションの両方から取得
     try:
@@ -85,12 +105,13 @@ def _get_user_profiles(db: FirestoreClient) -> List[Dict[str, Any]]:
                 "uid": doc.id,
                 "email": email,
                 "nickname": nickname,
-                "source": "users"
+                "source": "users",
+                "review_log_complete": review_log.is_complete(data)
             }
             profiles.append(profile)
-            print(f"[DEBUG] users からプロフィール取得: {doc.id[:8]} - {nickname or email or f'ユーザー{doc.id[:8]}'}")
+            logger.debug("users からプロフィール取得: %s - %s", doc.id[:8], nickname or email)
     except Exception as e:
-        print(f"[ERROR] users コレクション読み込みエラー: {e}")
+        logger.error("users コレクション読み込みエラー: %s", e)
     
     # study_cardsからユニークユーザーを取得（効率化）
     try:
@@ -115,13 +136,13 @@ def _get_user_profiles(db: FirestoreClient) -> List[Dict[str, Any]]:
                         "source": "study_cards"
                     }
                     profiles.append(profile)
-                    print(f"[DEBUG] study_cards からプロフィール取得: {uid[:8]}")
+                    logger.debug("study_cards からプロフィール取得: %s", uid[:8])
                     
-        print(f"[DEBUG] study_cards から {len(uids_from_cards)} 人のユーザーを検出")
+        logger.debug("study_cards から %d 人のユーザーを検出", len(uids_from_cards))
     except Exception as e:
-        print(f"[ERROR] study_cards コレクション読み込みエラー: {e}")
+        logger.error("study_cards コレクション読み込みエラー: %s", e)
     
-    print(f"[DEBUG] 重複除去前ユーザー数: {len(profiles)}")
+    logger.debug("重複除去前ユーザー数: %d", len(profiles))
     
     # 重複除去処理
     by_uid = {}
@@ -145,7 +166,8 @@ def _get_user_profiles(db: FirestoreClient) -> List[Dict[str, Any]]:
             if _is_similar_user(uid, email_norm, nickname_norm, 
                               existing_uid, existing_email, existing_nickname):
                 if uid != existing_uid:  # 同一UIDは除外
-                    print(f"[DEBUG] 重複ユーザー検出: {nickname} (uid:{uid[:8]}, email:{email_norm}) vs {existing_nickname} (uid:{existing_uid[:8]}, email:{existing_email})")
+                    logger.debug("重複ユーザー検出: %s (uid:%s, email:%s) vs %s (uid:%s, email:%s)",
+                                 nickname, uid[:8], email_norm, existing_nickname, existing_uid[:8], existing_email)
                     
                     # より完全な情報を持つユーザーを判定
                     current_score = _get_profile_completeness_score(
@@ -157,30 +179,32 @@ def _get_user_profiles(db: FirestoreClient) -> List[Dict[str, Any]]:
                     
                     if current_score > existing_score:
                         # 現在のユーザーの方が完全 - 既存を置き換え
-                        print(f"[DEBUG] より完全なプロフィール: {nickname} (score:{current_score}) > {existing_nickname} (score:{existing_score})")
+                        logger.debug("より完全なプロフィール: %s (score:%d) > %s (score:%d)",
+                                     nickname, current_score, existing_nickname, existing_score)
                         merge_target_uid = existing_uid
                         duplicate_found = False  # 現在のユーザーを保持するため
                         break
                     else:
                         # 既存のユーザーの方が完全 - 現在をスキップ
-                        print(f"[DEBUG] 既存ユーザーを保持: {existing_nickname} (score:{existing_score}) >= {nickname} (score:{current_score})")
+                        logger.debug("既存ユーザーを保持: %s (score:%d) >= %s (score:%d)",
+                                     existing_nickname, existing_score, nickname, current_score)
                         duplicate_found = True
                         break
         
         # マージ対象がある場合は既存を削除
         if merge_target_uid:
             del by_uid[merge_target_uid]
-            print(f"[DEBUG] 既存ユーザー削除: {merge_target_uid[:8]}")
+            logger.debug("既存ユーザー削除: %s", merge_target_uid[:8])
         
         if duplicate_found:
-            print(f"[DEBUG] 重複ユーザーをスキップ: {nickname}")
+            logger.debug("重複ユーザーをスキップ: %s", nickname)
             continue
             
         # 重複でない、または優先度の高いユーザーを追加
-        print(f"[DEBUG] 新規ユーザー追加: {uid[:8]} - {nickname}")
+        logger.debug("新規ユーザー追加: %s - %s", uid[:8], nickname)
         by_uid[uid] = profile
     
-    print(f"[DEBUG] 最終ユーザー数: {len(by_uid)}")
+    logger.info("対象ユーザー数: %d（重複除去前 %d）", len(by_uid), len(profiles))
     return list(by_uid.values())
 
 
@@ -190,39 +214,38 @@ def _load_user_cards(uid: str) -> Dict[str, Any]:
     db = fm.db
     cards = {}
     
-    print(f"[DEBUG] カードデータ読み込み開始 - UID: {uid}")
+    logger.debug("カードデータ読み込み開始 - UID: %s", uid[:8])
     
     # 1. 従来の userCards コレクションから読み込み
     try:
         cards = fm.load_user_cards(uid)
-        print(f"[DEBUG] userCards コレクションから: {len(cards)}件")
+        logger.debug("userCards コレクションから: %d件", len(cards))
         
         # カードが見つかった場合のサンプル情報
-        if cards:
-            sample_key = list(cards.keys())[0]
-            sample_card = cards[sample_key]
-            history_count = len(sample_card.get('history', []))
-            print(f"[DEBUG] userCards サンプル: {sample_key}, 履歴数: {history_count}")
+        if cards and logger.isEnabledFor(logging.DEBUG):
+            sample_key = next(iter(cards))
+            logger.debug("userCards サンプル: %s, 履歴数: %d",
+                         sample_key, len(cards[sample_key].get('history', [])))
     except Exception as e:
-        print(f"[DEBUG] userCards読み込みエラー: {e}")
+        logger.debug("userCards読み込みエラー: %s", e)
         cards = {}
     
     # 2. userCards が空の場合、study_cards コレクションから読み込み
     if not cards:
         try:
-            print(f"[DEBUG] study_cards コレクションを検索中...")
+            logger.debug("study_cards コレクションを検索中...")
             study_cards_ref = db.collection("study_cards")
             user_cards_query = study_cards_ref.where("uid", "==", uid)
             user_cards_docs = user_cards_query.get()
             
-            print(f"[DEBUG] study_cards コレクションから: {len(user_cards_docs)}件")
+            logger.debug("study_cards コレクションから: %d件", len(user_cards_docs))
             
             # サンプルドキュメントIDを確認
-            if user_cards_docs:
+            if user_cards_docs and logger.isEnabledFor(logging.DEBUG):
                 sample_doc = user_cards_docs[0]
-                print(f"[DEBUG] study_cards サンプルID: {sample_doc.id}")
-                sample_data = sample_doc.to_dict()
-                print(f"[DEBUG] study_cards サンプルデータ: uid={sample_data.get('uid')}, history={len(sample_data.get('history', []))}")
+                sample_data = sample_doc.to_dict() or {}
+                logger.debug("study_cards サンプル: id=%s, uid=%s, history=%d",
+                             sample_doc.id, sample_data.get('uid'), len(sample_data.get('history', [])))
             
             # カードデータを変換（既存の形式に合わせる）
             for doc in user_cards_docs:
@@ -254,64 +277,98 @@ def _load_user_cards(uid: str) -> Dict[str, Any]:
                     cards[question_id] = card
                     
                 except Exception as card_error:
-                    print(f"[WARNING] カードデータ処理エラー ({doc.id}): {card_error}")
+                    logger.warning("カードデータ処理エラー (%s): %s", doc.id, card_error)
                     continue
                     
         except Exception as e:
-            print(f"[ERROR] study_cards読み込みエラー: {e}")
+            logger.error("study_cards読み込みエラー: %s", e)
     
-    # 3. まだ空の場合、他の可能性のあるコレクションも確認
-    if not cards:
+    # 3. まだ空の場合、他の可能性のあるコレクションも確認（データ構造の調査用なのでDEBUG時のみ）
+    if not cards and logger.isEnabledFor(logging.DEBUG):
         potential_collections = ["cards", "user_cards", "userCards", "learningCards", "learning_data"]
         for collection_name in potential_collections:
             try:
-                print(f"[DEBUG] {collection_name} コレクションを検索中...")
+                logger.debug("%s コレクションを検索中...", collection_name)
                 collection_ref = db.collection(collection_name)
                 docs = collection_ref.where("uid", "==", uid).limit(5).get()
                 if docs:
-                    print(f"[DEBUG] {collection_name} コレクションに {len(docs)}件のデータが見つかりました")
+                    logger.debug("%s コレクションに %d件のデータが見つかりました", collection_name, len(docs))
                     # 最初の1つでブレイク（データ構造確認用）
                     sample_doc = docs[0]
                     sample_data = sample_doc.to_dict()
-                    print(f"[DEBUG] {collection_name} サンプルデータ: {list(sample_data.keys())}")
+                    logger.debug("%s サンプルデータ: %s", collection_name, list(sample_data.keys()))
                     break
                 else:
-                    print(f"[DEBUG] {collection_name} コレクションにデータなし")
+                    logger.debug("%s コレクションにデータなし", collection_name)
             except Exception as e:
-                print(f"[DEBUG] {collection_name} 検索エラー: {e}")
-    
-    # デバッグ情報
-    cards_with_history = 0
-    total_history_count = 0
-    for q_id, card in cards.items():
-        if isinstance(card, dict):
-            history = card.get('history', [])
-            if history:
-                cards_with_history += 1
-                total_history_count += len(history)
-    
-    print(f"[DEBUG] ユーザー {uid[:8]}: 総カード数={len(cards)}, 履歴ありカード数={cards_with_history}, 総履歴数={total_history_count}")
+                logger.debug("%s 検索エラー: %s", collection_name, e)
+    
+    # デバッグ情報（全カードを走査するのでDEBUG時のみ集計）
+    if logger.isEnabledFor(logging.DEBUG):
+        cards_with_history = 0
+        total_history_count = 0
+        for card in cards.values():
+            if isinstance(card, dict):
+                history = card.get('history', [])
+                if history:
+                    cards_with_history += 1
+                    total_history_count += len(history)
+
+        logger.debug("ユーザー %s: 総カード数=%d, 履歴ありカード数=%d, 総履歴数=%d",
+                     uid[:8], len(cards), cards_with_history, total_history_count)
     
     return cards
 
 
-def _compute_user_metrics(uid: str, nickname: str, cards: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any], Dict[str, Any]]:
+def _load_weekly_events(db: FirestoreClient, profiles: List[Dict[str, Any]],
+                        chunk_size: int = 100) -> Dict[str, List[Dict[str, Any]]]:
+    """イベントログが揃っているユーザーの今週のパーティションをまとめて読み込む（uid → イベント）"""
+    week_id = review_log.iso_week_id(datetime.datetime.now(JST).date())
+    uids = [p["uid"] for p in profiles if p.get("review_log_complete")]
+    events: Dict[str, List[Dict[str, Any]]] = {uid: [] for uid in uids}
+    for start in range(0, len(uids), chunk_size):
+        refs = [
+            db.collection(review_log.REVIEW_EVENTS_COLLECTION).document(review_log.partition_id(uid, week_id))
+            for uid in uids[start:start + chunk_size]
+        ]
+        try:
+            for snapshot in db.get_all(refs):
+                if snapshot.exists:
+                    data = snapshot.to_dict() or {}
+                    events[data.get("uid") or snapshot.id.rsplit("_", 1)[0]] = data.get("events", [])
+        except Exception as e:
+            # 読み込めなかったユーザーはカードの history から計算する
+            logger.error("週間イベント読み込みエラー: %s", e)
+            for uid in uids[start:start + chunk_size]:
+                events.pop(uid, None)
+    logger.debug("週間イベントを読み込んだユーザー数: %d / %d", len(events), len(profiles))
+    return events
+
+
+def _compute_user_metrics(uid: str, nickname: str, cards: Dict[str, Any],
+                          weekly_events: List[Dict[str, Any]] | None = None
+                          ) -> Tuple[Dict[str, Any], Dict[str, Any], Dict[str, Any]]:
     """1ユーザー分の各ランキング用メトリクスを算出。
     returns: (weekly_doc, total_doc, mastery_doc)
+    weekly_events があれば週間ポイントは今週のイベントログから計算する。
     
     改善されたランキングシステム:
     - 最低演習数要件の導入
     - 0ptユーザーの除外
     - 習熟度計算の調整
     """
-    print(f"[DEBUG] ユーザー {uid[:8]} ({nickname}) のメトリクス計算開始")
+    logger.debug("ユーザー %s (%s) のメトリクス計算開始", uid[:8], nickname)
     
     # セッション外集計では evaluation_logs は扱わない（カード履歴ベースで十分）
-    weekly_points = calculate_weekly_points(cards, evaluation_logs=None)
+    if weekly_events is not None:
+        weekly_points = calculate_weekly_points_from_events(weekly_events)
+    else:
+        weekly_points = calculate_weekly_points(cards, evaluation_logs=None)
     total_points, total_problems, accuracy_rate = calculate_total_points(cards, evaluation_logs=None)
     mastery_score, expert_cards, advanced_cards, total_cards, avg_ef = calculate_mastery_score(cards)
 
-    print(f"[DEBUG] ユーザー {uid[:8]} 基本結果: 週間={weekly_points}pt, 総合={total_points}pt, 問題数={total_problems}")
+    logger.debug("ユーザー %s 基本結果: 週間=%dpt, 総合=%dpt, 問題数=%d",
+                 uid[:8], weekly_points, total_points, total_problems)
     
     # ===== ランキング参加資格の判定 =====
     
@@ -324,28 +381,30 @@ def _compute_user_metrics(uid: str, nickname: str, cards: Dict[str, Any]) -> Tup
     weekly_eligible = weekly_points > 0 and total_problems >= MIN_WEEKLY_PROBLEMS
     if not weekly_eligible:
         weekly_points = 0  # 資格なしの場合は0に設定
-        print(f"[DEBUG] 週間ランキング資格なし: 問題数{total_problems} < {MIN_WEEKLY_PROBLEMS} または週間ポイント=0")
+        logger.debug("週間ランキング資格なし: 問題数%d < %d または週間ポイント=0", total_problems, MIN_WEEKLY_PROBLEMS)
     
     # 総合ランキング資格判定
     total_eligible = total_points > 0 and total_problems >= MIN_PROBLEMS_FOR_RANKING
     if not total_eligible:
         total_points = 0  # 資格なしの場合は0に設定
-        print(f"[DEBUG] 総合ランキング資格なし: 問題数{total_problems} < {MIN_PROBLEMS_FOR_RANKING} または総合ポイント=0")
+        logger.debug("総合ランキング資格なし: 問題数%d < %d または総合ポイント=0", total_problems, MIN_PROBLEMS_FOR_RANKING)
     
     # 習熟度ランキング資格判定と調整
     mastery_eligible = total_problems >= MIN_PROBLEMS_FOR_MASTERY and total_cards > 0
     if not mastery_eligible:
         mastery_score = 0.0  # 資格なしの場合は0に設定
-        print(f"[DEBUG] 習熟度ランキング資格なし: 問題数{total_problems} < {MIN_PROBLEMS_FOR_MASTERY}")
+        logger.debug("習熟度ランキング資格なし: 問題数%d < %d", total_problems, MIN_PROBLEMS_FOR_MASTERY)
     else:
         # 習熟度スコアを演習量で調整（より多く演習したユーザーを優遇）
         volume_bonus = min(total_problems / 100.0, 1.0)  # 最大100%のボーナス
         adjusted_mastery_score = mastery_score * (0.7 + 0.3 * volume_bonus)  # 基本70% + 演習量ボーナス30%
         
-        print(f"[DEBUG] 習熟度調整: 元スコア={mastery_score:.2f}, 演習量ボーナス={volume_bonus:.2f}, 調整後={adjusted_mastery_score:.2f}")
+        logger.debug("習熟度調整: 元スコア=%.2f, 演習量ボーナス=%.2f, 調整後=%.2f",
+                     mastery_score, volume_bonus, adjusted_mastery_score)
         mastery_score = adjusted_mastery_score
 
-    print(f"[DEBUG] ユーザー {uid[:8]} 最終結果: 週間={weekly_points}pt, 総合={total_points}pt, 習熟度={mastery_score:.2f}")
+    logger.debug("ユーザー %s 最終結果: 週間=%dpt, 総合=%dpt, 習熟度=%.2f",
+                 uid[:8], weekly_points, total_points, mastery_score)
 
     weekly_doc = {
         "uid": uid,
@@ -383,6 +442,7 @@ def _compute_user_metrics(uid: str, nickname: str, cards: Dict[str, Any]) -> Tup
     return weekly_doc, total_doc, mastery_doc
 
 
+@accounted_job("update_all_rankings")
 def update_all_rankings() -> Dict[str, Any]:
     """全ユーザーのランキングを再集計して保存。
 
@@ -397,6 +457,7 @@ def update_all_rankings() -> Dict[str, Any]:
     db = fm.db
 
     profiles = _get_user_profiles(db)
+    weekly_events = _load_weekly_events(db, profiles)
     processed = 0
     errors = 0
 
@@ -405,7 +466,7 @@ def update_all_rankings() -> Dict[str, Any]:
         nickname = p.get("nickname", f"ユーザー{uid[:8]}")
         try:
             cards = _load_user_cards(uid)
-            weekly_doc, total_doc, mastery_doc = _compute_user_metrics(uid, nickname, cards)
+            weekly_doc, total_doc, mastery_doc = _compute_user_metrics(uid, nickname, cards, weekly_events.get(uid))
 
             # 書き込み（ドキュメントIDは uid）
             db.collection("weekly_ranking").document(uid).set(weekly_doc, merge=True)
@@ -520,7 +581,7 @@ def should_update_today() -> bool:
 
 def update_all_rankings_debug():
     """全ユーザーのランキングスコアを更新（デバッグ用・重複除去対応）"""
-    print("\n=== 全ランキング更新開始（デバッグ版・重複除去対応） ===")
+    logger.info("=== 全ランキング更新開始（デバッグ版・重複除去対応） ===")
     
     try:
         fm = get_firestore_manager()
@@ -529,10 +590,10 @@ def update_all_rankings_debug():
         # ユーザープロフィールを取得（重複除去済み）
         profiles = _get_user_profiles(db)
         if not profiles:
-            print("ユーザープロフィールが見つかりません")
+            logger.info("ユーザープロフィールが見つかりません")
             return "処理: 0件, エラー: 0件"
         
-        print(f"対象ユーザー数: {len(profiles)}")
+        logger.info("対象ユーザー数: %d", len(profiles))
         
         # プロフィール辞書を作成（UIDをキーとする）
         profile_dict = {profile["uid"]: profile for profile in profiles}
@@ -554,7 +615,7 @@ def update_all_rankings_debug():
                     "cards": cards
                 }
             except Exception as e:
-                print(f"[ERROR] ユーザー {uid[:8]} のカード読み込みエラー: {e}")
+                logger.error("ユーザー %s のカード読み込みエラー: %s", uid[:8], e)
                 user_card_counts[uid] = {
                     "card_count": 0,
                     "nickname": nickname,
@@ -562,7 +623,7 @@ def update_all_rankings_debug():
                 }
         
         # 2回目のパス: カード数による重複除去
-        print("\n--- カード数による重複チェック ---")
+        logger.debug("--- カード数による重複チェック ---")
         processed_users = set()
         duplicate_users = set()
         
@@ -596,9 +657,8 @@ def update_all_rankings_debug():
                 )
                 
                 if duplicate_condition:
-                    print(f"[DUPLICATE] 重複ユーザー検出:")
-                    print(f"  ユーザー1: {uid1[:8]} - {data1['nickname']} - {profile1.get('email', 'none')} ({data1['card_count']}カード)")
-                    print(f"  ユーザー2: {uid2[:8]} - {data2['nickname']} - {profile2.get('email', 'none')} ({data2['card_count']}カード)")
+                    logger.info("重複ユーザー検出: %s - %s - %s (%dカード) / %s - %s - %s (%dカード)",
+                                uid1[:8], data1['nickname'], profile1.get('email', 'none'), data1['card_count'], uid2[:8], data2['nickname'], profile2.get('email', 'none'), data2['card_count'])
                     
                     # より完全なプロフィールを持つ方を保持
                     profile1_score = _get_profile_completeness_score(profile1, data1["nickname"])
@@ -606,12 +666,14 @@ def update_all_rankings_debug():
                     
                     if profile1_score >= profile2_score:
                         duplicate_users.add(uid2)
-                        print(f"  -> {data1['nickname']} を保持（完全性スコア: {profile1_score} vs {profile2_score}）")
+                        logger.debug("  -> %s を保持（完全性スコア: %d vs %d）",
+                                     data1['nickname'], profile1_score, profile2_score)
                     else:
                         duplicate_users.add(uid1)
-                        print(f"  -> {data2['nickname']} を保持（完全性スコア: {profile2_score} vs {profile1_score}）")
+                        logger.debug("  -> %s を保持（完全性スコア: %d vs %d）",
+                                     data2['nickname'], profile2_score, profile1_score)
         
-        print(f"\n重複除去後の対象ユーザー数: {len(user_card_counts) - len(duplicate_users)}")
+        logger.info("重複除去後の対象ユーザー数: %d", len(user_card_counts) - len(duplicate_users))
         
         # 3回目のパス: 実際のランキング計算
         updated_count = 0
@@ -620,41 +682,34 @@ def update_all_rankings_debug():
         
         for uid, data in user_card_counts.items():
             if uid in duplicate_users:
-                print(f"[SKIP] 重複ユーザーをスキップ: {uid[:8]} - {data['nickname']}")
+                logger.debug("重複ユーザーをスキップ: %s - %s", uid[:8], data['nickname'])
                 continue
             
             nickname = data["nickname"]
             cards = data["cards"]
             
-            print(f"\n--- ユーザー: {nickname} ({uid[:8]}) ---")
-            print(f"  カード数: {len(cards)}")
+            logger.debug("--- ユーザー: %s (%s) カード数: %d ---", nickname, uid[:8], len(cards))
             
             try:
                 # メトリクス計算
                 weekly_doc, total_doc, mastery_doc = _compute_user_metrics(uid, nickname, cards)
                 
-                print(f"  週間ポイント: {weekly_doc.get('weekly_points', 0)}")
-                print(f"  総合ポイント: {total_doc.get('total_points', 0)}")
-                print(f"  マスタリースコア: {mastery_doc.get('mastery_score', 0):.1f}")
-                print(f"  ✓ 計算成功")
+                logger.debug("  週間ポイント: %s, 総合ポイント: %s, マスタリースコア: %.1f",
+                             weekly_doc.get('weekly_points', 0), total_doc.get('total_points', 0), mastery_doc.get('mastery_score', 0))
                 
                 updated_count += 1
                 total_cards += len(cards)
                 
             except Exception as e:
                 error_count += 1
-                print(f"  ✗ エラー: {e}")
-                import traceback
-                traceback.print_exc()
+                logger.exception("ユーザー %s の計算エラー: %s", uid[:8], e)
         
         summary = f"処理: {updated_count}件, エラー: {error_count}件, 重複除去: {len(duplicate_users)}件, 総カード数: {total_cards}件"
-        print(f"\n=== 計算完了: {summary} ===")
+        logger.info("=== 計算完了: %s ===", summary)
         return summary
         
     except Exception as e:
-        print(f"全体計算エラー: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("全体計算エラー: %s", e)
         raise
 
 
@@ -11,6 +11,7 @@
 
 import streamlit as st
 import pandas as pd
+import numpy as np
 import plotly.graph_objects as go
 import plotly.express as px
 import datetime
@@ -72,6 +73,9 @@ try:
         ALL_QUESTIONS, 
         HISSHU_Q_NUMBERS_SET, 
         GAKUSHI_HISSHU_Q_NUMBERS_SET,
+        QUESTION_SORT_RANKS,
+        QUESTION_SEARCH_TEXT,
+        MASTER_DATA_VERSION,
         _gather_images_for_questions,
         _image_block_latex,
         export_questions_to_latex_tcb_jsarticle,
@@ -84,6 +88,9 @@ except ImportError:
             ALL_QUESTIONS, 
             HISSHU_Q_NUMBERS_SET, 
             GAKUSHI_HISSHU_Q_NUMBERS_SET,
+            QUESTION_SORT_RANKS,
+            QUESTION_SEARCH_TEXT,
+            MASTER_DATA_VERSION,
             _gather_images_for_questions,
             _image_block_latex,
             export_questions_to_latex_tcb_jsarticle,
@@ -95,14 +102,23 @@ except ImportError:
         ALL_QUESTIONS = []
         HISSHU_Q_NUMBERS_SET = set()
         GAKUSHI_HISSHU_Q_NUMBERS_SET = set()
+        QUESTION_SORT_RANKS = {}
+        QUESTION_SEARCH_TEXT = {}
+        MASTER_DATA_VERSION = ""
 
 try:
-    from firestore_db import get_firestore_manager
+    from firestore_db import get_firestore_manager, check_gakushi_permission as _check_gakushi_permission_cached
 except ImportError:
     try:
-        from ..firestore_db import get_firestore_manager
+        from ..firestore_db import get_firestore_manager, check_gakushi_permission as _check_gakushi_permission_cached
     except ImportError:
         get_firestore_manager = None
+        _check_gakushi_permission_cached = None
+
+try:
+    from shared_cache import shared_cache
+except ImportError:
+    from ..shared_cache import shared_cache
 
 try:
     from constants import LEVEL_COLORS
@@ -151,7 +167,16 @@ def update_session_evaluation_log(question_id: str, quality: int, timestamp: dat
 # レベル順序定義（0-5レベルシステム）
 LEVEL_ORDER = ["未学習", "レベル0", "レベル1", "レベル2", "レベル3", "レベル4", "レベル5", "習得済み"]
 
+# 問題リストタブのレベル色と1ページあたりの表示件数
+QUESTION_LIST_LEVEL_COLORS = {
+    "未学習": "#757575", "レベル0": "#FF9800", "レベル1": "#FFC107",
+    "レベル2": "#8BC34A", "レベル3": "#9C27B0", "レベル4": "#03A9F4",
+    "レベル5": "#1E88E5", "習得済み": "#4CAF50"
+}
+QUESTION_LIST_PAGE_SIZE = 200
+
 @st.cache_data(ttl=600)  # 10分間キャッシュ
+@shared_cache(ttl=600, version=MASTER_DATA_VERSION)
 def calculate_total_questions():
     """問題数を計算する"""
     total_kokushi = 0
@@ -177,6 +202,7 @@ def prepare_data_for_display(uid: str, cards: dict, analysis_target: str, force_
         st.cache_data.clear()
     
     all_data = []
+    features = []
     
     # 問題データ処理（全問題を処理）
     for question in ALL_QUESTIONS:
@@ -188,9 +214,9 @@ def prepare_data_for_display(uid: str, cards: dict, analysis_target: str, force_
         if analysis_target == "学士試験" and not q_number.startswith('G'):
             continue
         
-        # カードデータの取得とレベル計算
+        # カードデータの取得（レベルは最後に一括判定）
         card = cards.get(q_number, {})
-        level = calculate_card_level(card)
+        features.append(_card_level_features(card))
         
         # 必修問題判定
         if analysis_target == "学士試験":
@@ -201,16 +227,71 @@ def prepare_data_for_display(uid: str, cards: dict, analysis_target: str, force_
         # データ行の作成
         row_data = {
             'id': q_number,
-            'level': level,
             'subject': question.get('subject', '未分類'),
             'is_hisshu': is_hisshu,
+            'sort_rank': QUESTION_SORT_RANKS.get(q_number, len(QUESTION_SORT_RANKS)),
             'card_data': card,
             'history': card.get('history', []) if isinstance(card, dict) else []
         }
         
         all_data.append(row_data)
     
-    return pd.DataFrame(all_data)
+    df = pd.DataFrame(all_data)
+    if df.empty:
+        return df
+    df.insert(1, 'level', classify_card_levels(
+        pd.DataFrame(features, columns=['history_count', 'quality', 'interval', 'ef'])
+    ))
+    return df
+
+def _card_level_features(card: Dict[str, Any]) -> tuple:
+    """レベル判定に使う数値 (学習回数, 最新quality, 最新interval, 最新EF) を取り出す"""
+    if not card or not isinstance(card, dict):
+        return (0, 0, 0, 2.5)
+    history = card.get('history', [])
+    if not history:
+        return (0, 0, 0, 2.5)
+    if not isinstance(history, list):
+        return (1, 0, 0, 2.5)
+    latest = history[-1] if isinstance(history[-1], dict) else {}
+    return (
+        len(history),
+        latest.get('quality', 0),
+        latest.get('interval', 0),
+        latest.get('EF', 2.5),
+    )
+
+def classify_card_levels(features: pd.DataFrame) -> np.ndarray:
+    """
+    calculate_card_level と同じ判定を数値列に対して一括で行う
+
+    features: history_count / quality / interval / ef 列を持つ DataFrame
+    """
+    n = features['history_count'].to_numpy()
+    q = pd.to_numeric(features['quality'], errors='coerce').fillna(0).to_numpy()
+    iv = pd.to_numeric(features['interval'], errors='coerce').fillna(0).to_numpy()
+    ef = pd.to_numeric(features['ef'], errors='coerce').fillna(2.5).to_numpy()
+
+    # calculate_card_level の if 連鎖と同じ順序（先に一致した条件が優先）
+    conditions = [
+        n == 0,
+        (n == 1) | (q < 3),
+        (q == 3) & (iv <= 1),
+        (q == 3) & (iv > 1) & (iv <= 6),
+        (q == 4) & (iv <= 3),
+        (q == 4) & (iv > 3) & (iv <= 15),
+        (q == 5) & (iv <= 7),
+        (q == 5) & (iv > 7) & (iv <= 30),
+        (q == 5) & (iv > 30) & (iv <= 180),
+        (q == 5) & (iv > 180) & (ef >= 2.8),
+        q >= 4,
+        q >= 3,
+    ]
+    choices = [
+        "未学習", "レベル0", "レベル1", "レベル2", "レベル2", "レベル3",
+        "レベル3", "レベル4", "レベル5", "習得済み", "レベル3", "レベル1",
+    ]
+    return np.select(conditions, choices, default="レベル0")
 
 def calculate_card_level(card: Dict[str, Any]) -> str:
     """
@@ -419,19 +500,13 @@ def get_review_priority_cards(cards: dict, target_date: datetime.date = None) ->
     return priority_cards
 
 def check_gakushi_permission(uid: str) -> bool:
-    """学士試験へのアクセス権限をチェック"""
+    """学士試験へのアクセス権限をチェック（user_permissions のキャッシュを共有）"""
+    if not uid or _check_gakushi_permission_cached is None:
+        return False
     try:
-        db = get_firestore_manager()
-        user_ref = db.collection('users').document(uid)
-        user_doc = user_ref.get()
-        
-        if user_doc.exists:
-            user_data = user_doc.to_dict()
-            return user_data.get('has_gakushi_permission', False)
-        
-        return True
+        return _check_gakushi_permission_cached(uid)
     except Exception:
-        return True
+        return False
 
 def calculate_progress_metrics(cards: Dict, base_df: pd.DataFrame, uid: str, analysis_target: str) -> Dict:
     """
@@ -783,6 +858,51 @@ def render_overview_tab_perfect(filtered_df: pd.DataFrame, base_df: pd.DataFrame
             hisshu_retention_rate = (hisshu_correct_reviews / hisshu_total_reviews * 100) if hisshu_total_reviews > 0 else 0
             st.metric(label=hisshu_label, value=f"{hisshu_retention_rate:.1f}%", delta=f"{hisshu_correct_reviews} / {hisshu_total_reviews} 回")
 
+# 学習量グラフの表示期間（日）
+ACTIVITY_CHART_DAYS = 90
+
+
+@st.cache_data(ttl=300, show_spinner=False)
+def _load_review_event_dates(uid: str, start: datetime.date, end: datetime.date, cards_version: int) -> Optional[List[tuple]]:
+    """
+    期間内の自己評価イベントを (問題ID, 日本時間の日付) で返す（対象週のパーティションだけ読む）
+    イベントログが使えないユーザーは None。cards_version は自己評価後にキャッシュを無効化するためのキー
+    """
+    if not uid or get_firestore_manager is None:
+        return None
+    events = get_firestore_manager().load_review_events(uid, start, end)
+    if events is None:
+        return None
+    return [(event["q"], datetime.datetime.fromtimestamp(event["t"] / 1000, tz=JST).date()) for event in events]
+
+
+def _collect_review_dates(filtered_df: pd.DataFrame) -> List[datetime.date]:
+    """表示中の問題の学習日（イベントログがあればそこから、なければカードの history から）"""
+    today = get_japan_today()
+    event_dates = _load_review_event_dates(
+        st.session_state.get("uid", ""),
+        today - datetime.timedelta(days=ACTIVITY_CHART_DAYS), today,
+        st.session_state.get("cards_version", 0),
+    )
+    if event_dates is not None:
+        visible_ids = set(filtered_df["id"])
+        return [date for qid, date in event_dates if qid in visible_ids]
+
+    review_history = []
+    for history_list in filtered_df["history"]:
+        for review in history_list:
+            if isinstance(review, dict) and "timestamp" in review:
+                timestamp = review["timestamp"]
+                try:
+                    # 日本時間に変換してから日付を取得
+                    review_datetime_jst = get_japan_datetime_from_timestamp(timestamp)
+                    review_history.append(review_datetime_jst.date())
+                except (ValueError, TypeError):
+                    # パースに失敗した場合はスキップ
+                    continue
+    return review_history
+
+
 def render_graph_analysis_tab_perfect(filtered_df: pd.DataFrame):
     """
     グラフ分析タブ - 学習データの可視化
@@ -792,25 +912,14 @@ def render_graph_analysis_tab_perfect(filtered_df: pd.DataFrame):
         st.warning("選択された条件に一致する問題がありません。")
     else:
         st.markdown("##### 学習の記録")
-        review_history = []
-        for history_list in filtered_df["history"]:
-            for review in history_list:
-                if isinstance(review, dict) and "timestamp" in review:
-                    timestamp = review["timestamp"]
-                    try:
-                        # 日本時間に変換してから日付を取得
-                        review_datetime_jst = get_japan_datetime_from_timestamp(timestamp)
-                        review_history.append(review_datetime_jst.date())
-                    except (ValueError, TypeError):
-                        # パースに失敗した場合はスキップ
-                        continue
+        review_history = _collect_review_dates(filtered_df)
 
         if review_history:
             from collections import Counter
             import pandas as pd  # ローカルスコープで確実にインポート
             review_counts = Counter(review_history)
-            ninety_days_ago = get_japan_today() - datetime.timedelta(days=90)  # 日本時間ベース
-            dates = [ninety_days_ago + datetime.timedelta(days=i) for i in range(91)]
+            ninety_days_ago = get_japan_today() - datetime.timedelta(days=ACTIVITY_CHART_DAYS)  # 日本時間ベース
+            dates = [ninety_days_ago + datetime.timedelta(days=i) for i in range(ACTIVITY_CHART_DAYS + 1)]
             counts = [review_counts.get(d, 0) for d in dates]
             chart_df = pd.DataFrame({"Date": dates, "Reviews": counts})
 
@@ -873,16 +982,24 @@ def render_graph_analysis_tab_perfect(filtered_df: pd.DataFrame):
         else:
             st.info("学習データがありません。")
 
+def _render_question_list_html(rows: pd.DataFrame) -> str:
+    """問題リスト1ページ分のHTMLを1つの文字列として組み立てる"""
+    parts = []
+    for q_id, level in zip(rows['id'], rows['level']):
+        color = QUESTION_LIST_LEVEL_COLORS.get(level, '#888')
+        parts.append(
+            f"<div style='margin-bottom: 5px; padding: 5px; border-left: 5px solid {color};'>"
+            f"<span style='display:inline-block;width:80px;font-weight:bold;color:{color};'>{level}</span>"
+            f"<span style='font-size:1.1em;'>{q_id}</span>"
+            f"</div>"
+        )
+    return "".join(parts)
+
 def render_question_list_tab_perfect(filtered_df: pd.DataFrame, analysis_target: str = "国試"):
     """
     問題リストタブ - 問題リスト
     """
     st.subheader("問題リスト")
-    level_colors = {
-        "未学習": "#757575", "レベル0": "#FF9800", "レベル1": "#FFC107",
-        "レベル2": "#8BC34A", "レベル3": "#9C27B0", "レベル4": "#03A9F4",
-        "レベル5": "#1E88E5", "習得済み": "#4CAF50"
-    }
 
     # 権限チェック
     has_gakushi_permission = st.session_state.get("has_gakushi_permission", False)
@@ -893,28 +1010,36 @@ def render_question_list_tab_perfect(filtered_df: pd.DataFrame, analysis_target:
 
         st.markdown(f"**{len(filtered_df)}件の問題が見つかりました**")
         if not filtered_df.empty:
-            def sort_key(row_id):
-                m_gakushi = re.match(r'^(G)(\d+)[–\-]([\d–\-再]+)[–\-]([A-Z])[–\-](\d+)$', str(row_id))
-                if m_gakushi: return (m_gakushi.group(1), int(m_gakushi.group(2)), m_gakushi.group(3), m_gakushi.group(4), int(m_gakushi.group(5)))
-                m_normal = re.match(r"(\d+)([A-D])(\d+)", str(row_id))
-                if m_normal: return ('Z', int(m_normal.group(1)), m_normal.group(2), '', int(m_normal.group(3)))
-                return ('Z', 0, '', '', 0)
-
-            detail_filtered_sorted = filtered_df.copy()
-            detail_filtered_sorted['sort_key'] = detail_filtered_sorted['id'].apply(sort_key)
-            detail_filtered_sorted = detail_filtered_sorted.sort_values(by='sort_key').drop(columns=['sort_key'])
-            for _, row in detail_filtered_sorted.iterrows():
-                # 権限チェック：学士試験の問題で権限がない場合はスキップ
-                if str(row.id).startswith("G") and not has_gakushi_permission:
-                    continue
-
-                st.markdown(
-                    f"<div style='margin-bottom: 5px; padding: 5px; border-left: 5px solid {level_colors.get(row.level, '#888')};'>"
-                    f"<span style='display:inline-block;width:80px;font-weight:bold;color:{level_colors.get(row.level, '#888')};'>{row.level}</span>"
-                    f"<span style='font-size:1.1em;'>{row.id}</span>"
-                    f"</div>",
-                    unsafe_allow_html=True
+            visible_df = filtered_df[['id', 'level']]
+            # 権限チェック：学士試験の問題で権限がない場合は除外
+            if not has_gakushi_permission:
+                visible_df = visible_df[~visible_df['id'].astype(str).str.startswith("G")]
+
+            # 事前計算済みの自然順の順位で並べ替え（順位がない問題は末尾）
+            if 'sort_rank' in filtered_df.columns:
+                ranks = filtered_df.loc[visible_df.index, 'sort_rank']
+            else:
+                ranks = visible_df['id'].map(QUESTION_SORT_RANKS).fillna(len(QUESTION_SORT_RANKS))
+            visible_df = visible_df.iloc[np.argsort(ranks.to_numpy(), kind='stable')]
+
+            # ページ単位で1回の st.markdown にまとめて描画
+            total_pages = max(1, -(-len(visible_df) // QUESTION_LIST_PAGE_SIZE))
+            page = 1
+            if total_pages > 1:
+                # 初期値は session_state で与える（value と併用すると警告が出る）。
+                # フィルタ変更で件数が減った場合はページ番号を範囲内に戻す
+                st.session_state.setdefault("question_list_page", 1)
+                if st.session_state["question_list_page"] > total_pages:
+                    st.session_state["question_list_page"] = total_pages
+                page = st.number_input(
+                    f"ページ（全{total_pages}ページ・{QUESTION_LIST_PAGE_SIZE}件ずつ）",
+                    min_value=1, max_value=total_pages, step=1,
+                    key="question_list_page"
                 )
+            start = (int(page) - 1) * QUESTION_LIST_PAGE_SIZE
+            page_df = visible_df.iloc[start:start + QUESTION_LIST_PAGE_SIZE]
+            if not page_df.empty:
+                st.markdown(_render_question_list_html(page_df), unsafe_allow_html=True)
         else:
             st.info("フィルタ条件に一致する問題がありません。")
     else:
@@ -942,7 +1067,7 @@ def render_keyword_search_tab_perfect(analysis_target: str):
     # キーワード検索の実行と結果表示
     if search_btn and search_keyword.strip():
         # キーワード検索を実行
-        search_words = [word.strip() for word in search_keyword.strip().split() if word.strip()]
+        search_words = [word.strip().lower() for word in search_keyword.strip().split() if word.strip()]
 
         keyword_results = []
         for q in ALL_QUESTIONS:
@@ -957,9 +1082,11 @@ def render_keyword_search_tab_perfect(analysis_target: str):
             elif analysis_target == "国試" and question_number.startswith("G"):
                 continue
 
-            # キーワード検索
-            text_to_search = f"{q.get('question', '')} {q.get('subject', '')} {q.get('number', '')}"
-            if any(word.lower() in text_to_search.lower() for word in search_words):
+            # キーワード検索（小文字化済みの検索用テキストはマスターデータのビルド時に作成）
+            text_to_search = QUESTION_SEARCH_TEXT.get(question_number)
+            if text_to_search is None:
+                text_to_search = f"{q.get('question', '')} {q.get('subject', '')} {q.get('number', '')}".lower()
+            if any(word in text_to_search for word in search_words):
                 keyword_results.append(q)
 
         # シャッフル処理
@@ -0,0 +1,358 @@
+"""
+ホットパスの処理時間計測
+
+名前付きスパンごとに処理時間とFirestoreの読み書き件数を記録し、
+再実行（rerun）単位とプロセス全体の両方で集計する。
+
+    @timed("master.load_master_data")
+    def load_master_data(...): ...
+
+    with span("firestore.load_user_cards") as s:
+        ...
+        s.add_reads(len(cards))
+
+- begin_rerun() / end_rerun() で1回のスクリプト実行を区切る（app.main から呼ぶ）
+- 直近 RECENT_RERUNS_MAX 回分の再実行を保持し、管理者パネルで遅いスパンを表示する
+- export_prometheus() / export_json() / dump_metrics() でローカルファイルに出力できる
+"""
+
+import datetime
+import functools
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+# 計測の有効・無効（無効時はスパンを記録しない）
+PERF_METRICS_ENABLED = os.environ.get("PERF_METRICS_ENABLED", "1") != "0"
+
+# 保持する再実行の件数
+RECENT_RERUNS_MAX = 50
+
+# 定期出力先（空なら出力しない。拡張子が .json ならJSON、それ以外はPrometheusテキスト形式）
+PERF_METRICS_PATH = os.environ.get("PERF_METRICS_PATH", "")
+PERF_METRICS_DUMP_INTERVAL = 60
+
+# Prometheus のメトリクス名の接頭辞
+METRIC_PREFIX = "dental_app"
+
+
+class Span:
+    """計測中のスパン（with span(...) as s で読み書き件数を加算できる）"""
+
+    __slots__ = ("name", "duration", "reads", "writes")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.duration = 0.0
+        self.reads = 0
+        self.writes = 0
+
+    def add_reads(self, count: int = 1):
+        self.reads += count
+
+    def add_writes(self, count: int = 1):
+        self.writes += count
+
+
+class SpanStats:
+    """スパン名ごとのプロセス全体の集計値"""
+
+    __slots__ = ("count", "total", "max", "reads", "writes")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.reads = 0
+        self.writes = 0
+
+    def add(self, duration: float, reads: int = 0, writes: int = 0):
+        self.count += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+        self.reads += reads
+        self.writes += writes
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "total_seconds": round(self.total, 6),
+            "avg_seconds": round(self.total / self.count, 6) if self.count else 0.0,
+            "max_seconds": round(self.max, 6),
+            "reads": self.reads,
+            "writes": self.writes,
+        }
+
+
+# スレッドごと（＝Streamlitのセッションごと）の計測状態
+_local = threading.local()
+
+# プロセス全体の集計
+_lock = threading.Lock()
+_span_stats: Dict[str, SpanStats] = {}
+_rerun_stats = SpanStats()
+_recent_reruns: deque = deque(maxlen=RECENT_RERUNS_MAX)
+_last_dump = 0.0
+
+
+def _stack() -> List[Span]:
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def _finish_span(current: Span):
+    """スパン終了時に再実行・プロセスの集計へ反映"""
+    rerun = getattr(_local, "rerun", None)
+    if rerun is not None:
+        rerun["spans"].append((current.name, current.duration, current.reads, current.writes))
+        # 読み書き件数は最も内側のスパンだけが持つため、ここで再実行の合計に加算しても重複しない
+        rerun["reads"] += current.reads
+        rerun["writes"] += current.writes
+
+    with _lock:
+        stats = _span_stats.get(current.name)
+        if stats is None:
+            stats = _span_stats[current.name] = SpanStats()
+        stats.add(current.duration, current.reads, current.writes)
+
+
+class span:
+    """名前付きスパンの処理時間を計測するコンテキストマネージャ"""
+
+    __slots__ = ("_span", "_start")
+
+    def __init__(self, name: str):
+        self._span = Span(name)
+        self._start = 0.0
+
+    def __enter__(self) -> Span:
+        if PERF_METRICS_ENABLED:
+            _stack().append(self._span)
+            self._start = time.perf_counter()
+        return self._span
+
+    def __exit__(self, exc_type, exc, tb):
+        if not PERF_METRICS_ENABLED:
+            return False
+        self._span.duration = time.perf_counter() - self._start
+        stack = _stack()
+        if stack and stack[-1] is self._span:
+            stack.pop()
+        _finish_span(self._span)
+        return False
+
+
+def timed(name: Optional[str] = None) -> Callable:
+    """関数の処理時間を計測するデコレータ（name省略時は module.qualname）"""
+    def decorator(func: Callable) -> Callable:
+        span_name = name or f"{func.__module__}.{func.__qualname__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def current_span_name() -> Optional[str]:
+    """このスレッドで計測中の最も内側のスパン名（スパン外ならNone）"""
+    stack = getattr(_local, "stack", None)
+    return stack[-1].name if stack else None
+
+
+def record_firestore(reads: int = 0, writes: int = 0):
+    """Firestoreの読み書き件数を現在のスパン（スパン外なら再実行）に加算"""
+    if not PERF_METRICS_ENABLED:
+        return
+    stack = _stack()
+    if stack:
+        stack[-1].reads += reads
+        stack[-1].writes += writes
+        return
+    rerun = getattr(_local, "rerun", None)
+    if rerun is not None:
+        rerun["reads"] += reads
+        rerun["writes"] += writes
+
+
+# --- 再実行単位の集計 ---
+def begin_rerun(label: str = ""):
+    """1回のスクリプト実行の計測を開始"""
+    if not PERF_METRICS_ENABLED:
+        return
+    _local.stack = []
+    _local.rerun = {
+        "label": label,
+        "started_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "start": time.perf_counter(),
+        "reads": 0,
+        "writes": 0,
+        "spans": [],
+    }
+
+
+def set_rerun_label(label: str):
+    """計測中の再実行にラベル（ページ名など）を設定"""
+    rerun = getattr(_local, "rerun", None)
+    if rerun is not None:
+        rerun["label"] = label
+
+
+def end_rerun() -> Optional[Dict[str, Any]]:
+    """計測中の再実行を確定し、直近の再実行一覧とプロセス集計に追加"""
+    rerun = getattr(_local, "rerun", None)
+    if rerun is None:
+        return None
+    _local.rerun = None
+
+    record = {
+        "label": rerun["label"],
+        "started_at": rerun["started_at"],
+        "duration": time.perf_counter() - rerun["start"],
+        "reads": rerun["reads"],
+        "writes": rerun["writes"],
+        "spans": [
+            {"name": name, "duration": duration, "reads": reads, "writes": writes}
+            for name, duration, reads, writes in rerun["spans"]
+        ],
+    }
+    with _lock:
+        _recent_reruns.append(record)
+        _rerun_stats.add(record["duration"], record["reads"], record["writes"])
+    return record
+
+
+def recent_reruns(limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """直近の再実行（新しい順）"""
+    with _lock:
+        reruns = list(_recent_reruns)
+    reruns.reverse()
+    return reruns[:limit] if limit else reruns
+
+
+def slowest_spans(last_n: Optional[int] = None, limit: int = 15) -> List[Dict[str, Any]]:
+    """直近 last_n 回の再実行で記録されたスパンを処理時間の長い順に返す"""
+    spans = []
+    for rerun in recent_reruns(last_n):
+        for item in rerun["spans"]:
+            spans.append(dict(item, label=rerun["label"], started_at=rerun["started_at"]))
+    spans.sort(key=lambda item: item["duration"], reverse=True)
+    return spans[:limit]
+
+
+def span_summary() -> Dict[str, Dict[str, Any]]:
+    """プロセス全体のスパン別集計（合計時間の長い順）"""
+    with _lock:
+        items = [(name, stats.as_dict()) for name, stats in _span_stats.items()]
+    items.sort(key=lambda item: item[1]["total_seconds"], reverse=True)
+    return dict(items)
+
+
+def reset():
+    """集計をすべて破棄"""
+    global _last_dump
+    with _lock:
+        _span_stats.clear()
+        _recent_reruns.clear()
+        _rerun_stats.__init__()
+        _last_dump = 0.0
+    _local.stack = []
+    _local.rerun = None
+
+
+# --- 出力 ---
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def export_prometheus() -> str:
+    """プロセス全体の集計をPrometheusテキスト形式で出力"""
+    with _lock:
+        items = sorted((name, stats.as_dict()) for name, stats in _span_stats.items())
+        reruns = _rerun_stats.as_dict()
+
+    metrics = [
+        ("span_calls_total", "counter", "スパンの実行回数", "count"),
+        ("span_seconds_total", "counter", "スパンの合計処理時間（秒）", "total_seconds"),
+        ("span_seconds_max", "gauge", "スパンの最大処理時間（秒）", "max_seconds"),
+        ("span_firestore_reads_total", "counter", "スパン内のFirestore読み取り件数", "reads"),
+        ("span_firestore_writes_total", "counter", "スパン内のFirestore書き込み件数", "writes"),
+    ]
+    lines = []
+    for metric, metric_type, help_text, field in metrics:
+        full_name = f"{METRIC_PREFIX}_{metric}"
+        lines.append(f"# HELP {full_name} {help_text}")
+        lines.append(f"# TYPE {full_name} {metric_type}")
+        for name, stats in items:
+            lines.append(f'{full_name}{{span="{_escape_label(name)}"}} {stats[field]}')
+
+    for metric, help_text, field in [
+        ("reruns_total", "スクリプト再実行の回数", "count"),
+        ("rerun_seconds_total", "スクリプト再実行の合計処理時間（秒）", "total_seconds"),
+        ("rerun_firestore_reads_total", "再実行中のFirestore読み取り件数", "reads"),
+        ("rerun_firestore_writes_total", "再実行中のFirestore書き込み件数", "writes"),
+    ]:
+        full_name = f"{METRIC_PREFIX}_{metric}"
+        lines.append(f"# HELP {full_name} {help_text}")
+        lines.append(f"# TYPE {full_name} counter")
+        lines.append(f"{full_name} {reruns[field]}")
+
+    return "\n".join(lines) + "\n"
+
+
+def export_json(recent: int = 10) -> Dict[str, Any]:
+    """プロセス全体の集計と直近の再実行をJSON互換の辞書で出力"""
+    with _lock:
+        reruns = _rerun_stats.as_dict()
+    return {
+        "generated_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "pid": os.getpid(),
+        "reruns": reruns,
+        "spans": span_summary(),
+        "recent_reruns": recent_reruns(recent),
+    }
+
+
+def dump_metrics(path: Optional[str] = None) -> Optional[str]:
+    """集計をローカルファイルに書き出す（.json ならJSON、それ以外はPrometheus形式）"""
+    path = path or PERF_METRICS_PATH
+    if not path:
+        return None
+
+    if path.endswith(".json"):
+        content = json.dumps(export_json(), ensure_ascii=False, indent=2)
+    else:
+        content = export_prometheus()
+
+    try:
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        # 収集側が書き込み途中のファイルを読まないように一時ファイル経由で置き換え
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+        return path
+    except OSError as e:
+        print(f"[WARNING] 計測データ書き込みエラー: {e}")
+        return None
+
+
+def maybe_dump_metrics(interval: float = PERF_METRICS_DUMP_INTERVAL) -> Optional[str]:
+    """出力先が設定されていれば interval 秒ごとにファイルへ書き出す"""
+    global _last_dump
+    if not PERF_METRICS_PATH:
+        return None
+    now = time.time()
+    with _lock:
+        if now - _last_dump < interval:
+            return None
+        _last_dump = now
+    return dump_metrics()
@@ -0,0 +1,132 @@
+"""
+問題メタデータの事前計算
+
+マスターデータ読み込み時に問題ごとに1回だけ計算し、採点・描画では参照のみ行う。
+- 正答の正規化（選択肢記号のビットマスク。複数正解は許容マスクの集合）
+- 問題形式（single / multi / ordering / numeric）
+- 化学式変換済みの問題文と選択肢ラベル
+"""
+
+import re
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional
+
+QUESTION_TYPE_SINGLE = "single"
+QUESTION_TYPE_MULTI = "multi"
+QUESTION_TYPE_ORDERING = "ordering"
+QUESTION_TYPE_NUMERIC = "numeric"
+
+# 並び替え問題と判定するキーワード
+ORDERING_KEYWORDS = ('順番', '順序', '配列', '並び替え')
+
+# よく使われる化学式パターンの変換
+CHEMICAL_FORMULA_REPLACEMENTS = {
+    'Ca2+': r'$\mathrm{Ca^{2+}}$',
+    'Mg2+': r'$\mathrm{Mg^{2+}}$',
+    'H2O': r'$\mathrm{H_2O}$',
+    'CO2': r'$\mathrm{CO_2}$',
+    'OH-': r'$\mathrm{OH^-}$',
+    'HCO3-': r'$\mathrm{HCO_3^-}$',
+    'PO4-': r'$\mathrm{PO_4^-}$'
+}
+_CHEMICAL_FORMULA_PATTERN = re.compile(
+    "|".join(re.escape(p) for p in sorted(CHEMICAL_FORMULA_REPLACEMENTS, key=len, reverse=True))
+)
+
+# 正答文字列中の区切り（"c,e" や "A、C" など）
+_ANSWER_SEPARATORS = re.compile(r'[\s,、・]+')
+
+
+def format_chemical_formula(text: str) -> str:
+    """化学式をLaTeX形式に変換（全パターンを1回の走査で置換）"""
+    if not text:
+        return text
+    return _CHEMICAL_FORMULA_PATTERN.sub(lambda m: CHEMICAL_FORMULA_REPLACEMENTS[m.group(0)], text)
+
+
+def is_ordering_question(question_text: str, choices: List[str] = None) -> bool:
+    """並び替え問題の判定"""
+    question_text = question_text or ''
+
+    # 明確な並び替えキーワードがある場合
+    if any(keyword in question_text for keyword in ORDERING_KEYWORDS):
+        return True
+
+    # 「手順」キーワードがある場合は選択肢もチェック
+    if '手順' in question_text and choices:
+        # 矢印やカンマで区切られた短い記号パターンの選択肢が大部分の場合のみ並び替え問題
+        choice_pattern_count = sum(
+            1 for choice in choices if ('→' in choice or ',' in choice) and len(choice) < 20
+        )
+        return choice_pattern_count >= len(choices) * 0.8
+
+    return False
+
+
+def normalize_answer(answer: str) -> str:
+    """解答文字列を正規化（大文字化・区切り文字除去）"""
+    return _ANSWER_SEPARATORS.sub('', str(answer or '')).upper()
+
+
+def answer_to_mask(answer: str) -> Optional[int]:
+    """選択肢記号の文字列をビットマスクに変換（A=1, B=2, C=4 ...）。記号以外を含む場合はNone"""
+    normalized = normalize_answer(answer)
+    if not normalized:
+        return None
+    mask = 0
+    for char in normalized:
+        if not 'A' <= char <= 'Z':
+            return None
+        mask |= 1 << (ord(char) - 65)
+    return mask
+
+
+def build_question_meta(question: Dict[str, Any]) -> Dict[str, Any]:
+    """1問分のメタデータを作成"""
+    choices = question.get('choices', []) or []
+    correct_answer = str(question.get('answer', '') or '').strip()
+    alternatives = [alt for alt in (a.strip() for a in correct_answer.split('/')) if alt]
+
+    if not choices:
+        question_type = QUESTION_TYPE_NUMERIC
+    elif is_ordering_question(question.get('question', ''), choices):
+        question_type = QUESTION_TYPE_ORDERING
+    elif all(len(normalize_answer(alt)) == 1 for alt in alternatives):
+        question_type = QUESTION_TYPE_SINGLE
+    else:
+        question_type = QUESTION_TYPE_MULTI
+
+    masks = [answer_to_mask(alt) for alt in alternatives]
+    answer_masks: FrozenSet[int] = frozenset(masks) if masks and None not in masks else frozenset()
+
+    return {
+        'type': question_type,
+        'answer_masks': answer_masks,
+        'answer_strings': frozenset(normalize_answer(alt) for alt in alternatives),
+        'question_text': format_chemical_formula(question.get('question', '')),
+        'choice_labels': [chr(65 + i) for i in range(len(choices))],
+    }
+
+
+def build_question_metadata(all_questions: Iterable[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """全問題のメタデータを作成（問題番号 → メタデータ）"""
+    return {q['number']: build_question_meta(q) for q in all_questions if q.get('number')}
+
+
+def grade(meta: Dict[str, Any], user_answer: str) -> bool:
+    """事前計算済みメタデータで採点"""
+    if not user_answer or not meta['answer_strings']:
+        return False
+
+    # 並び替え・数値問題は順序を含めた文字列で比較
+    if meta['type'] in (QUESTION_TYPE_ORDERING, QUESTION_TYPE_NUMERIC) or not meta['answer_masks']:
+        return normalize_answer(user_answer) in meta['answer_strings']
+
+    return answer_to_mask(user_answer) in meta['answer_masks']
+
+
+def grade_many(metadata: Dict[str, Dict[str, Any]], answers: Dict[str, str]) -> Dict[str, bool]:
+    """問題グループをまとめて採点（問題番号 → 正誤）。メタデータのない問題は False"""
+    return {
+        qid: grade(metadata[qid], answer) if qid in metadata else False
+        for qid, answer in answers.items()
+    }
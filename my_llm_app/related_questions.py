@@ -0,0 +1,194 @@
+"""
+関連問題インデックス
+
+問題バンク全体の問題文ベクトル（埋め込み または TF-IDF+SVD）と、問題ごとの
+近傍リストを事前に作成しておき、アプリでは参照のみ行う。
+
+- run_related_index_build.py でオフライン作成（ベクトル化はスクリプト側で行う）
+- アプリは numpy だけで読み込み、近傍リストの参照（O(1)）で関連問題を返す。
+  フィルタで候補が足りない場合だけ全問題との内積（1回の行列ベクトル積）を計算する
+
+保存形式（RELATED_INDEX_DIR/）:
+- vectors.npy: 問題数 × 次元 の float16 行列（L2正規化済み）
+- neighbors.npy / neighbor_scores.npy: 問題ごとの類似度上位 k 件（自分自身は除く）
+- meta.json: 問題番号の並び・作成方法・モデル名など
+"""
+
+import datetime
+import json
+import os
+import tempfile
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+RELATED_INDEX_DIR = os.environ.get(
+    "RELATED_INDEX_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "related_questions")
+)
+
+# 事前計算する近傍の件数
+DEFAULT_NEIGHBORS = 20
+
+# 近傍計算時に一度に処理する行数（メモリ使用量の上限）
+_BLOCK_SIZE = 512
+
+
+def question_text(question: Dict) -> str:
+    """ベクトル化に使うテキスト（問題文＋選択肢）"""
+    choices = question.get('choices') or []
+    return " ".join([str(question.get('question', '') or '')] + [str(c) for c in choices])
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """各行をL2正規化（ゼロベクトルはそのまま）"""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def compute_neighbors(vectors: np.ndarray, k: int = DEFAULT_NEIGHBORS) -> Tuple[np.ndarray, np.ndarray]:
+    """全問題の類似度上位 k 件（ブロックごとに行列積を計算）"""
+    count = len(vectors)
+    k = max(0, min(k, count - 1))
+    neighbors = np.zeros((count, k), dtype=np.int32)
+    scores = np.zeros((count, k), dtype=np.float16)
+    if k == 0:
+        return neighbors, scores
+
+    for start in range(0, count, _BLOCK_SIZE):
+        block = vectors[start:start + _BLOCK_SIZE] @ vectors.T
+        rows = np.arange(len(block))
+        block[rows, rows + start] = -np.inf  # 自分自身は除く
+        top = np.argpartition(-block, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(block, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind='stable')
+        neighbors[start:start + len(block)] = np.take_along_axis(top, order, axis=1)
+        scores[start:start + len(block)] = np.take_along_axis(top_scores, order, axis=1)
+    return neighbors, scores
+
+
+def _atomic_save(path: str, writer: Callable):
+    directory = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        writer(f)
+    os.replace(tmp_path, path)
+
+
+def save_index(directory: str, ids: Sequence[str], vectors: np.ndarray,
+               method: str, model: str = "", k: int = DEFAULT_NEIGHBORS) -> Dict:
+    """ベクトルから近傍リストを作成してインデックスを保存"""
+    vectors = normalize_rows(vectors)
+    neighbors, scores = compute_neighbors(vectors, k)
+    meta = {
+        "ids": list(ids),
+        "method": method,
+        "model": model,
+        "dim": int(vectors.shape[1]) if vectors.ndim == 2 else 0,
+        "k": int(neighbors.shape[1]),
+        "built_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+    }
+
+    os.makedirs(directory, exist_ok=True)
+    _atomic_save(os.path.join(directory, "vectors.npy"), lambda f: np.save(f, vectors.astype(np.float16)))
+    _atomic_save(os.path.join(directory, "neighbors.npy"), lambda f: np.save(f, neighbors))
+    _atomic_save(os.path.join(directory, "neighbor_scores.npy"), lambda f: np.save(f, scores))
+    # meta.json は最後に置き換える（読み込み側は meta の問題数と行列の行数を照合する）
+    _atomic_save(os.path.join(directory, "meta.json"),
+                 lambda f: f.write(json.dumps(meta, ensure_ascii=False).encode('utf-8')))
+    return meta
+
+
+class RelatedQuestionIndex:
+    """事前作成した関連問題インデックス（読み取り専用）"""
+
+    def __init__(self, ids: List[str], vectors: np.ndarray, neighbors: np.ndarray,
+                 neighbor_scores: np.ndarray, meta: Optional[Dict] = None):
+        self.ids = ids
+        self.positions = {qid: i for i, qid in enumerate(ids)}
+        self.vectors = vectors
+        self.neighbors = neighbors
+        self.neighbor_scores = neighbor_scores
+        self.meta = meta or {}
+
+    @classmethod
+    def load(cls, directory: str = RELATED_INDEX_DIR) -> Optional["RelatedQuestionIndex"]:
+        """インデックスを読み込む（未作成・不整合ならNone）"""
+        try:
+            with open(os.path.join(directory, "meta.json"), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            vectors = np.load(os.path.join(directory, "vectors.npy"), mmap_mode='r')
+            neighbors = np.load(os.path.join(directory, "neighbors.npy"))
+            scores = np.load(os.path.join(directory, "neighbor_scores.npy"))
+        except (OSError, ValueError) as e:
+            print(f"[WARNING] 関連問題インデックスを読み込めません: {e}")
+            return None
+
+        ids = meta.get("ids", [])
+        if not (len(ids) == len(vectors) == len(neighbors) == len(scores)):
+            print("[WARNING] 関連問題インデックスが不整合です（再作成してください）")
+            return None
+        return cls(ids, vectors, neighbors, scores, meta)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, question_id: str) -> bool:
+        return question_id in self.positions
+
+    def related(self, question_id: str, k: int = 5, exclude: Iterable[str] = (),
+                allow: Optional[Callable[[str], bool]] = None) -> List[Tuple[str, float]]:
+        """問題に類似した問題を (問題番号, 類似度) の類似度順リストで返す"""
+        position = self.positions.get(question_id)
+        if position is None or k <= 0:
+            return []
+        excluded = set(exclude)
+        excluded.add(question_id)
+
+        results = self._filter(self.neighbors[position], self.neighbor_scores[position], k, excluded, allow)
+        if len(results) < k and len(results) < len(self.ids) - len(excluded):
+            # 事前計算した近傍がフィルタで足りない場合は全問題から探す
+            scores = np.asarray(self.vectors, dtype=np.float32) @ np.asarray(self.vectors[position], dtype=np.float32)
+            order = np.argsort(-scores, kind='stable')
+            results = self._filter(order, scores[order], k, excluded, allow)
+        return results
+
+    def _filter(self, positions: np.ndarray, scores: np.ndarray, k: int,
+                excluded: set, allow: Optional[Callable[[str], bool]]) -> List[Tuple[str, float]]:
+        results = []
+        for position, score in zip(positions, scores):
+            qid = self.ids[int(position)]
+            if qid in excluded or (allow is not None and not allow(qid)):
+                continue
+            results.append((qid, float(score)))
+            if len(results) >= k:
+                break
+        return results
+
+
+_index: Optional[RelatedQuestionIndex] = None
+_index_loaded = False
+_index_lock = threading.Lock()
+
+
+def get_related_index() -> Optional[RelatedQuestionIndex]:
+    """プロセス共通の関連問題インデックス（未作成ならNone）"""
+    global _index, _index_loaded
+    if not _index_loaded:
+        with _index_lock:
+            if not _index_loaded:
+                _index = RelatedQuestionIndex.load()
+                _index_loaded = True
+    return _index
+
+
+def related_question_ids(question_id: str, k: int = 5, exclude: Iterable[str] = (),
+                         allow: Optional[Callable[[str], bool]] = None) -> List[str]:
+    """関連問題の問題番号のみを返す（問題選択ロジックからの利用向け）"""
+    index = get_related_index()
+    if index is None:
+        return []
+    return [qid for qid, _ in index.related(question_id, k, exclude, allow)]
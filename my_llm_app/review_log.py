@@ -0,0 +1,156 @@
+"""
+自己評価イベントログ（uid × ISO週 のパーティション）
+
+自己評価1回を1イベントとして、カードの history とは別に review_events コレクションへ追記する。
+1ドキュメント = 1ユーザーの1週間分（ID: {uid}_{YYYY-Www}、週は日本時間）で、
+イベントは短いキーの配列にまとめて保存する。
+
+    {"uid": ..., "week": "2025-W34", "events": [{"q": 問題ID, "t": エポックミリ秒, "g": 品質}, ...]}
+
+- 書き込みは ArrayUnion のため、同じイベント（同じ history エントリ）を何度書いても1件になる
+- 週間ランキング・過去90日の学習量・期間指定の抽出は、対象週のドキュメントだけを読む
+- 導入前の履歴は run_review_log_backfill.py でカードの history から作成し、
+  ユーザードキュメントに review_log_complete を立てる。読み取り側はこのフラグがある
+  ユーザーだけイベントログを使い、ない場合は従来どおりカードの history を走査する
+
+1週間のイベント数が 1MiB（およそ1.5万件）を超えるとドキュメントに収まらない点に注意。
+"""
+
+import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+from google.cloud import firestore as gcp_firestore
+
+REVIEW_EVENTS_COLLECTION = "review_events"
+# ユーザードキュメント（users/{uid}）のフラグ。過去の履歴の取り込みが完了していれば True
+REVIEW_LOG_COMPLETE_FIELD = "review_log_complete"
+
+JST = datetime.timezone(datetime.timedelta(hours=9))
+
+# 1回のバッチ書き込みの上限（Firestore の制限は500件）
+_BATCH_LIMIT = 400
+
+
+def iso_week_id(date: datetime.date) -> str:
+    """日付 → ISO週ID（例: 2025-W34）"""
+    year, week, _ = date.isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+def week_ids_between(start: datetime.date, end: datetime.date) -> List[str]:
+    """start〜end（両端を含む）にかかる週IDのリスト"""
+    if end < start:
+        return []
+    monday = start - datetime.timedelta(days=start.weekday())
+    weeks = []
+    while monday <= end:
+        weeks.append(iso_week_id(monday))
+        monday += datetime.timedelta(days=7)
+    return weeks
+
+
+def partition_id(uid: str, week_id: str) -> str:
+    return f"{uid}_{week_id}"
+
+
+def _to_epoch_ms(timestamp: Any) -> Optional[int]:
+    if isinstance(timestamp, str):
+        try:
+            timestamp = datetime.datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    if not isinstance(timestamp, datetime.datetime):
+        return None
+    if timestamp.tzinfo is None:
+        # タイムゾーンなしの履歴はUTCとして扱う（sm2_update は UTC で記録）
+        timestamp = timestamp.replace(tzinfo=datetime.timezone.utc)
+    return int(timestamp.timestamp() * 1000)
+
+
+def event_from_history(question_id: str, entry: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """カードの history エントリ → イベント（時刻・品質のないエントリは None）"""
+    if not isinstance(entry, dict) or entry.get("quality") is None:
+        return None
+    epoch_ms = _to_epoch_ms(entry.get("timestamp"))
+    if epoch_ms is None:
+        return None
+    return {"q": question_id, "t": epoch_ms, "g": int(entry["quality"])}
+
+
+def events_from_cards(cards: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """全カードの history からイベントを作成（バックフィル用）"""
+    events = []
+    for question_id, card in cards.items():
+        if not isinstance(card, dict):
+            continue
+        for entry in card.get("history", []) or []:
+            event = event_from_history(question_id, entry)
+            if event:
+                events.append(event)
+    return events
+
+
+def event_datetime(event: Dict[str, Any]) -> datetime.datetime:
+    """イベント時刻（日本時間）"""
+    return datetime.datetime.fromtimestamp(event["t"] / 1000, tz=JST)
+
+
+def group_by_week(events: Iterable[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+    weeks: Dict[str, List[Dict[str, Any]]] = {}
+    for event in events:
+        weeks.setdefault(iso_week_id(event_datetime(event).date()), []).append(event)
+    return weeks
+
+
+def partition_writes(db, uid: str, events: Iterable[Dict[str, Any]]) -> List[tuple]:
+    """イベントを週ごとにまとめた (ドキュメント参照, 書き込み内容) のリスト（set(merge=True) 用）"""
+    writes = []
+    for week_id, week_events in group_by_week(events).items():
+        ref = db.collection(REVIEW_EVENTS_COLLECTION).document(partition_id(uid, week_id))
+        writes.append((ref, {
+            "uid": uid,
+            "week": week_id,
+            "events": gcp_firestore.ArrayUnion(week_events),
+            "updated_at": gcp_firestore.SERVER_TIMESTAMP,
+        }))
+    return writes
+
+
+def append_events(db, uid: str, events: List[Dict[str, Any]]):
+    """イベントを追記（週ごとに1書き込み、複数週はバッチで1回）"""
+    writes = partition_writes(db, uid, events)
+    for start in range(0, len(writes), _BATCH_LIMIT):
+        batch = db.batch()
+        for ref, data in writes[start:start + _BATCH_LIMIT]:
+            batch.set(ref, data, merge=True)
+        batch.commit()
+
+
+def load_events(db, uid: str, start: datetime.date, end: datetime.date) -> List[Dict[str, Any]]:
+    """期間内（日本時間の日付で start〜end）のイベントを時刻順に返す（対象週のドキュメントだけ読む）"""
+    refs = [
+        db.collection(REVIEW_EVENTS_COLLECTION).document(partition_id(uid, week_id))
+        for week_id in week_ids_between(start, end)
+    ]
+    events = []
+    for snapshot in db.get_all(refs):
+        if not snapshot.exists:
+            continue
+        for event in (snapshot.to_dict() or {}).get("events", []):
+            if start <= event_datetime(event).date() <= end:
+                events.append(event)
+    events.sort(key=lambda e: e["t"])
+    return events
+
+
+def is_complete(profile: Optional[Dict[str, Any]]) -> bool:
+    """ユーザードキュメントから、イベントログだけで全履歴を参照できるか判定"""
+    return bool(profile and profile.get(REVIEW_LOG_COMPLETE_FIELD))
+
+
+def backfill_user(db, uid: str, cards: Dict[str, Any]) -> int:
+    """カードの history からイベントログを作成し、完了フラグを立てる（何度実行しても同じ結果）"""
+    events = events_from_cards(cards)
+    append_events(db, uid, events)
+    db.collection("users").document(uid).set({REVIEW_LOG_COMPLETE_FIELD: True}, merge=True)
+    return len(events)
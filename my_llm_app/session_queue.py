@@ -0,0 +1,345 @@
+"""
+演習セッションの出題キュー
+
+- メインキュー: collections.deque（先頭からの取り出しをO(1)で行う）
+- 短期復習キュー: 復習可能時刻をキーにした最小ヒープ＋準備完了分のdeque
+
+Firestoreはネストした配列を保存できないため、キューは区切り文字で連結した
+1つの文字列に圧縮して保存する（グループ毎のJSON変換は行わない）。
+    メインキュー:   "qid,qid;qid,qid"
+    短期復習キュー: "1735000000@qid,qid;1735000300@qid"
+
+セッション保存時はメインキューと短期復習キューを "main|stq" の1フィールドにまとめ、
+メインキューを先頭から消化しただけの場合は先頭位置（queue_head）のみを更新する。
+"""
+
+import datetime
+import heapq
+import itertools
+import json
+from collections import deque
+from typing import Any, Deque, Iterable, List, Union
+
+_GROUP_SEP = ";"
+_QID_SEP = ","
+_READY_SEP = "@"
+_SECTION_SEP = "|"
+
+# result_log の上限件数（超えたら古い記録から KEEP 件まで間引く）
+RESULT_LOG_MAX_ENTRIES = 500
+RESULT_LOG_KEEP_ENTRIES = 300
+
+
+def encode_group(group: Iterable[str]) -> str:
+    """問題グループを1つの文字列に圧縮"""
+    return _QID_SEP.join(group)
+
+
+def decode_group(encoded: str) -> List[str]:
+    """encode_group で圧縮した文字列を問題グループに復元"""
+    return encoded.split(_QID_SEP) if encoded else []
+
+
+def encode_queue(queue: Iterable[List[str]]) -> str:
+    """キュー（グループのリスト）を1つの文字列に圧縮"""
+    return _GROUP_SEP.join(encode_group(group) for group in queue if group)
+
+
+def decode_queue(encoded: str) -> List[List[str]]:
+    """encode_queue で圧縮した文字列をキューに復元"""
+    if not encoded:
+        return []
+    return [decode_group(group) for group in encoded.split(_GROUP_SEP) if group]
+
+
+def _to_timestamp(ready_at: Any) -> float:
+    """ready_at（datetime / ISO文字列 / 数値）をUNIX秒に変換"""
+    if isinstance(ready_at, (int, float)):
+        return float(ready_at)
+    if isinstance(ready_at, str):
+        try:
+            ready_at = datetime.datetime.fromisoformat(ready_at.replace("Z", "+00:00"))
+        except ValueError:
+            return 0.0
+    if isinstance(ready_at, datetime.datetime):
+        if ready_at.tzinfo is None:
+            ready_at = ready_at.replace(tzinfo=datetime.timezone.utc)
+        return ready_at.timestamp()
+    # 不明な形式は即時復習可能として扱う
+    return 0.0
+
+
+class ShortTermReviewQueue:
+    """復習可能時刻順に取り出す短期復習キュー"""
+
+    def __init__(self):
+        self._heap: List[tuple] = []
+        self._ready: Deque[tuple] = deque()
+        self._seq = itertools.count()
+
+    def push(self, group: List[str], ready_at: Any):
+        """グループを復習可能時刻つきで追加"""
+        heapq.heappush(self._heap, (_to_timestamp(ready_at), next(self._seq), list(group)))
+
+    def _promote(self, now_ts: float):
+        """復習可能時刻を過ぎたグループを準備完了dequeへ移す"""
+        heap = self._heap
+        while heap and heap[0][0] <= now_ts:
+            ts, _, group = heapq.heappop(heap)
+            self._ready.append((ts, group))
+
+    def ready_count(self, now: Any = None) -> int:
+        """準備完了のグループ数"""
+        self._promote(_to_timestamp(now) if now is not None else datetime.datetime.now(datetime.timezone.utc).timestamp())
+        return len(self._ready)
+
+    def pop_ready(self) -> List[str]:
+        """準備完了のグループを最も早いものから取り出す（ready_count の後に呼ぶ）"""
+        return self._ready.popleft()[1] if self._ready else []
+
+    def __len__(self) -> int:
+        return len(self._heap) + len(self._ready)
+
+    def __iter__(self):
+        for _, group in self._ready:
+            yield group
+        for _, _, group in sorted(self._heap):
+            yield group
+
+    def encode(self) -> str:
+        """Firestore保存用の圧縮文字列に変換"""
+        items = [f"{int(ts)}{_READY_SEP}{encode_group(group)}" for ts, group in self._ready]
+        items.extend(
+            f"{int(ts)}{_READY_SEP}{encode_group(group)}" for ts, _, group in sorted(self._heap)
+        )
+        return _GROUP_SEP.join(items)
+
+    @classmethod
+    def decode(cls, encoded: str) -> "ShortTermReviewQueue":
+        """encode で圧縮した文字列から復元"""
+        queue = cls()
+        for item in (encoded or "").split(_GROUP_SEP):
+            if not item:
+                continue
+            ts, _, group = item.partition(_READY_SEP)
+            try:
+                queue.push(decode_group(group), float(ts))
+            except ValueError:
+                queue.push(decode_group(group), 0.0)
+        return queue
+
+    @classmethod
+    def from_legacy(cls, items: Iterable[Any]) -> "ShortTermReviewQueue":
+        """旧形式（{"group", "ready_at"} の辞書リスト）から変換"""
+        queue = cls()
+        for item in items or []:
+            if isinstance(item, dict):
+                group = item.get("group", [])
+                if isinstance(group, str):
+                    try:
+                        group = json.loads(group)
+                    except (json.JSONDecodeError, TypeError):
+                        group = decode_group(group)
+                if group:
+                    queue.push(group, item.get("ready_at"))
+        return queue
+
+
+def coerce_main_queue(value: Any) -> Deque[List[str]]:
+    """セッション状態のメインキューをdequeに正規化（list・圧縮文字列も受け付ける）"""
+    if isinstance(value, deque):
+        return value
+    if isinstance(value, str):
+        return deque(decode_queue(value))
+    return deque(value or [])
+
+
+def coerce_review_queue(value: Any) -> ShortTermReviewQueue:
+    """セッション状態の短期復習キューを ShortTermReviewQueue に正規化"""
+    if isinstance(value, ShortTermReviewQueue):
+        return value
+    if isinstance(value, str):
+        return ShortTermReviewQueue.decode(value)
+    return ShortTermReviewQueue.from_legacy(value)
+
+
+def serialize_main_queue(value: Any) -> str:
+    """メインキューをFirestore保存用の文字列に変換"""
+    if isinstance(value, str):
+        return value
+    return encode_queue(value or [])
+
+
+def serialize_review_queue(value: Any) -> str:
+    """短期復習キューをFirestore保存用の文字列に変換"""
+    if isinstance(value, str):
+        return value
+    return coerce_review_queue(value).encode()
+
+
+def deserialize_group_list(value: Union[str, List[Any], None]) -> List[List[str]]:
+    """保存済みキューを復元（圧縮文字列・旧形式のJSON文字列リストの両方に対応）"""
+    if isinstance(value, str):
+        return decode_queue(value)
+
+    deserialized = []
+    for item in value or []:
+        try:
+            if isinstance(item, str):
+                deserialized.append(json.loads(item))
+            elif isinstance(item, list):
+                deserialized.append(item)
+        except (json.JSONDecodeError, TypeError):
+            continue
+    return deserialized
+
+
+def encode_session_queues(main_queue: Any, short_term_review_queue: Any) -> str:
+    """メインキューと短期復習キューを1つの圧縮文字列にまとめる"""
+    return f"{serialize_main_queue(main_queue)}{_SECTION_SEP}{serialize_review_queue(short_term_review_queue)}"
+
+
+def decode_session_queues(encoded: str, head: int = 0):
+    """encode_session_queues の文字列を (メインキュー, 短期復習キュー) に復元
+
+    head はメインキューの先頭から消化済みのグループ数
+    """
+    main_part, _, review_part = (encoded or "").partition(_SECTION_SEP)
+    main_queue = decode_queue(main_part)[max(head, 0):]
+    return main_queue, ShortTermReviewQueue.decode(review_part)
+
+
+def split_queue_groups(main_queue: Any) -> List[str]:
+    """メインキューをグループ単位の圧縮文字列リストに変換（差分判定用）"""
+    if isinstance(main_queue, str):
+        return [group for group in main_queue.split(_GROUP_SEP) if group]
+    return [encode_group(group) for group in (main_queue or []) if group]
+
+
+def compact_result_log(result_log: dict, max_entries: int = RESULT_LOG_MAX_ENTRIES,
+                       keep_entries: int = RESULT_LOG_KEEP_ENTRIES) -> int:
+    """result_log が上限を超えたら古い記録（timestamp順）を間引く。削除件数を返す"""
+    if result_log is None or len(result_log) <= max_entries:
+        return 0
+
+    ordered = sorted(result_log.items(), key=lambda item: str((item[1] or {}).get("timestamp", "")))
+    removed = len(ordered) - keep_entries
+    for qid, _ in ordered[:removed]:
+        del result_log[qid]
+    return removed
+
+
+def _snapshot_from_session(session_data: Any, results: dict) -> dict:
+    """保存済み状態の比較用スナップショットを作成"""
+    return {
+        "current": encode_group(session_data.get("current_q_group", []) or []),
+        "groups": split_queue_groups(session_data.get("main_queue", [])),
+        "head": 0,
+        "review": serialize_review_queue(session_data.get("short_term_review_queue", [])),
+        "results": results,
+    }
+
+
+def session_document(snapshot: dict) -> dict:
+    """スナップショットからFirestoreに保存する全体ドキュメントを作成"""
+    return {
+        "current_q_group": snapshot["current"],
+        "queues": f"{_GROUP_SEP.join(snapshot['groups'])}{_SECTION_SEP}{snapshot['review']}",
+        "queue_head": snapshot["head"],
+        "result_log": snapshot["results"],
+    }
+
+
+def diff_session_state(previous: Any, session_data: Any):
+    """前回保存時のスナップショットと比較し、変更のあったフィールドのみを返す
+
+    Returns:
+        (updates, snapshot)
+        updates: 変更フィールド。result_log の個別追加はキーが ("result_log", qid) のタプルになる
+        snapshot: 今回保存後の比較用スナップショット（previous が None の場合は全体保存）
+    """
+    session_results = session_data.get("result_log")
+    if session_results is None:
+        session_results = {}
+
+    # 保存済みの記録と合わせて上限を超えた分を間引く（セッション側からも除く）
+    merged = dict(previous["results"]) if previous else {}
+    merged.update({qid: dict(record or {}) for qid, record in session_results.items()})
+    compacted = compact_result_log(merged) > 0
+    if compacted:
+        for qid in [qid for qid in session_results if qid not in merged]:
+            del session_results[qid]
+
+    snapshot = _snapshot_from_session(session_data, merged)
+    if previous is None:
+        return session_document(snapshot), snapshot
+
+    updates = {}
+    if snapshot["current"] != previous["current"]:
+        updates["current_q_group"] = snapshot["current"]
+
+    # メインキューを先頭から消化しただけなら先頭位置のみ更新
+    base, head = previous["groups"], previous["head"]
+    groups = snapshot["groups"]
+    consumed = len(base) - len(groups)
+    if snapshot["review"] == previous["review"] and consumed >= head and base[consumed:] == groups:
+        snapshot["groups"], snapshot["head"] = base, consumed
+        if consumed != head:
+            updates["queue_head"] = consumed
+    else:
+        document = session_document(snapshot)
+        updates["queues"] = document["queues"]
+        updates["queue_head"] = 0
+
+    if compacted:
+        updates["result_log"] = merged
+    else:
+        previous_results = previous["results"]
+        for qid, record in merged.items():
+            if previous_results.get(qid) != record:
+                updates[("result_log", qid)] = record
+
+    return updates, snapshot
+
+
+def decode_session_document(data: dict):
+    """保存済みドキュメントからセッション状態を復元
+
+    新形式（queues + queue_head）・圧縮文字列形式・旧形式（JSON文字列リスト）に対応。
+
+    Returns:
+        (session, snapshot) 旧形式の場合 snapshot は None（次回保存時に新形式で全体保存）
+    """
+    data = data or {}
+
+    current_q_group = data.get("current_q_group", [])
+    if isinstance(current_q_group, str):
+        current_q_group = decode_group(current_q_group)
+    else:
+        current_q_group = deserialize_group_list(current_q_group)
+
+    result_log = dict(data.get("result_log") or {})
+
+    if "queues" in data:
+        head = int(data.get("queue_head") or 0)
+        main_queue, review_queue = decode_session_queues(data["queues"], head)
+        main_part, _, review_part = data["queues"].partition(_SECTION_SEP)
+        snapshot = {
+            "current": encode_group(current_q_group),
+            "groups": [group for group in main_part.split(_GROUP_SEP) if group],
+            "head": head,
+            "review": review_part,
+            "results": {qid: dict(record or {}) for qid, record in result_log.items()},
+        }
+    else:
+        main_queue = deserialize_group_list(data.get("main_queue", []))
+        review_queue = coerce_review_queue(data.get("short_term_review_queue", []))
+        snapshot = None
+
+    session = {
+        "current_q_group": current_q_group,
+        "main_queue": main_queue,
+        "short_term_review_queue": review_queue,
+        "result_log": result_log,
+    }
+    return session, snapshot
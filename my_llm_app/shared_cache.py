@@ -0,0 +1,293 @@
+"""
+プロセス間で共有する計算結果キャッシュ
+
+st.cache_data はプロセスごとのため、レプリカの追加や再起動のたびにマスターデータの読み込み・
+派生データの計算をやり直し、同じデータをプロセスごとにメモリに持つ。
+shared_cache で包んだ関数は、st.cache_data にない場合にまず共有キャッシュを確認し、
+なければ計算して保存する。新しいレプリカも共有キャッシュから起動できる。
+
+    @st.cache_data(ttl=3600)
+    @shared_cache(ttl=3600)
+    @timed("master.load_master_data")
+    def load_master_data(version: str = "") -> tuple: ...
+
+- disk（既定）: SHARED_CACHE_DIR に1エントリ1ファイルの pickle を保存する（読み込んだ値は
+  プロセスごとのコピーで、メモリは共有しない）。
+  合計が SHARED_CACHE_MAX_BYTES を超えたら最終アクセスの古いものから削除する（LRU）
+- redis: SHARED_CACHE_REDIS_URL の Redis 互換サーバー（redis パッケージが必要）。
+  サイズ上限と LRU はサーバーの maxmemory / maxmemory-policy=allkeys-lru で設定する。
+  読み込んだ値は pickle で復元するため、ローカル（localhost・UNIX ソケット）以外のサーバーは
+  アプリ専用の非公開サーバーであることを確認して SHARED_CACHE_REDIS_TRUSTED=1 を設定した場合のみ使う
+- none: 共有しない（st.cache_data のみ）
+
+キーは関数名・関数のバイトコード（内包表記などの入れ子のコードも含む）・version・引数の pickle のハッシュ。コードを変更して
+デプロイすると別のキーになる。引数は pickle で同じバイト列になるもの（set を含まない等）に限る。
+キャッシュの読み書きに失敗した場合は通常どおり計算する。
+"""
+
+import functools
+import hashlib
+import inspect
+import os
+import pickle
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+from urllib.parse import urlparse
+
+try:
+    import redis
+except ImportError:  # pragma: no cover - optional dependency
+    redis = None
+
+_APP_DIR = os.path.dirname(os.path.abspath(__file__))
+SHARED_CACHE_BACKEND = os.environ.get("SHARED_CACHE_BACKEND", "disk")
+SHARED_CACHE_DIR = os.environ.get("SHARED_CACHE_DIR", os.path.join(_APP_DIR, "cache", "shared"))
+SHARED_CACHE_MAX_BYTES = int(os.environ.get("SHARED_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+# これより大きい値は保存しない
+SHARED_CACHE_MAX_ENTRY_BYTES = int(os.environ.get("SHARED_CACHE_MAX_ENTRY_BYTES", 128 * 1024 * 1024))
+SHARED_CACHE_REDIS_URL = os.environ.get("SHARED_CACHE_REDIS_URL", "redis://localhost:6379/0")
+# ローカル以外の Redis を信頼する（他者が書き込めない非公開サーバーの場合のみ 1）
+SHARED_CACHE_REDIS_TRUSTED = os.environ.get("SHARED_CACHE_REDIS_TRUSTED", "") == "1"
+_LOCAL_HOSTS = ("localhost", "127.0.0.1", "::1")
+
+_KEY_PREFIX = "dental_app:cache:"
+_SUFFIX = ".pkl"
+_MISS = object()
+
+
+class DiskBackend:
+    """ローカルディスクの pickle ファイル（同じホストのプロセス間で共有）"""
+
+    def __init__(self, directory: str = SHARED_CACHE_DIR, max_bytes: int = SHARED_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._evict_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(key.encode("utf-8")).hexdigest() + _SUFFIX)
+
+    def get(self, key: str) -> Any:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                stored_key, expires_at, value = pickle.load(f)
+        except FileNotFoundError:
+            return _MISS
+        if stored_key != key:
+            return _MISS
+        if expires_at and expires_at < time.time():
+            self._remove(path)
+            return _MISS
+        try:
+            # 最終アクセス時刻として更新時刻を使う（LRU）
+            os.utime(path)
+        except OSError:
+            pass
+        return value
+
+    def set(self, key: str, value: Any, ttl: Optional[int] = None):
+        data = pickle.dumps((key, time.time() + ttl if ttl else 0, value), protocol=pickle.HIGHEST_PROTOCOL)
+        if len(data) > SHARED_CACHE_MAX_ENTRY_BYTES:
+            return
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(key))
+        except Exception:
+            self._remove(tmp_path)
+            raise
+        self.evict()
+
+    def evict(self) -> int:
+        """合計サイズが上限を超えていれば古いものから削除し、削除した件数を返す"""
+        with self._evict_lock:
+            entries = []
+            total = 0
+            for entry in os.scandir(self.directory):
+                if not entry.name.endswith(_SUFFIX):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+            removed = 0
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                self._remove(path)
+                total -= size
+                removed += 1
+            return removed
+
+    def clear(self):
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(_SUFFIX):
+                self._remove(entry.path)
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def is_local_url(url: str) -> bool:
+    """Redis の URL が同じホスト（localhost・UNIX ソケット）を指すか"""
+    parsed = urlparse(url)
+    if parsed.scheme == "unix":
+        return True
+    return parsed.hostname in _LOCAL_HOSTS
+
+
+class RedisBackend:
+    """Redis 互換サーバー（ホストをまたいで共有）"""
+
+    def __init__(self, url: str = SHARED_CACHE_REDIS_URL, trusted: bool = SHARED_CACHE_REDIS_TRUSTED):
+        if redis is None:
+            raise RuntimeError("redis パッケージがインストールされていません")
+        if not trusted and not is_local_url(url):
+            # サーバー上の値をそのまま pickle.loads するため、第三者が書き込めるサーバーは使わない
+            raise RuntimeError("ローカル以外の Redis は SHARED_CACHE_REDIS_TRUSTED=1 の場合のみ使用できます")
+        self.client = redis.Redis.from_url(url)
+        self.client.ping()
+
+    def get(self, key: str) -> Any:
+        data = self.client.get(_KEY_PREFIX + key)
+        return _MISS if data is None else pickle.loads(data)
+
+    def set(self, key: str, value: Any, ttl: Optional[int] = None):
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(data) > SHARED_CACHE_MAX_ENTRY_BYTES:
+            return
+        self.client.set(_KEY_PREFIX + key, data, ex=ttl or None)
+
+    def clear(self):
+        for key in self.client.scan_iter(match=_KEY_PREFIX + "*"):
+            self.client.delete(key)
+
+
+_backend = None
+_backend_ready = False
+_backend_lock = threading.Lock()
+_stats: Dict[str, Dict[str, int]] = {}
+_stats_lock = threading.Lock()
+
+
+def get_backend():
+    """設定されたバックエンド（none・初期化失敗時は None）"""
+    global _backend, _backend_ready
+    if not _backend_ready:
+        with _backend_lock:
+            if not _backend_ready:
+                try:
+                    if SHARED_CACHE_BACKEND == "disk":
+                        _backend = DiskBackend()
+                    elif SHARED_CACHE_BACKEND == "redis":
+                        _backend = RedisBackend()
+                    elif SHARED_CACHE_BACKEND != "none":
+                        print(f"[WARNING] 不明な共有キャッシュバックエンド: {SHARED_CACHE_BACKEND}")
+                except Exception as e:
+                    print(f"[WARNING] 共有キャッシュを使用できません（{SHARED_CACHE_BACKEND}）: {e}")
+                    _backend = None
+                _backend_ready = True
+    return _backend
+
+
+def _count(name: str, field: str):
+    with _stats_lock:
+        stats = _stats.setdefault(name, {"hits": 0, "misses": 0, "errors": 0})
+        stats[field] += 1
+
+
+def cache_stats() -> Dict[str, Dict[str, int]]:
+    """関数ごとのヒット・ミス・エラー件数（このプロセス分）"""
+    with _stats_lock:
+        return {name: dict(stats) for name, stats in _stats.items()}
+
+
+def _hash_const(const, digest):
+    """定数をハッシュに追加（repr がプロセスごとに変わるものは展開する）"""
+    if inspect.iscode(const):
+        # 内包表記などの入れ子のコードは repr にメモリアドレスが含まれる
+        digest.update(const.co_code)
+        digest.update(repr(const.co_names).encode("utf-8"))
+        for item in const.co_consts:
+            _hash_const(item, digest)
+    elif isinstance(const, tuple):
+        digest.update(b"(")
+        for item in const:
+            _hash_const(item, digest)
+        digest.update(b")")
+    elif isinstance(const, frozenset):
+        # `x in {"a", "b"}` の定数。要素の順序は文字列のハッシュシードで変わる
+        digest.update(repr(sorted(repr(item) for item in const)).encode("utf-8"))
+    else:
+        digest.update(repr(const).encode("utf-8"))
+
+
+def _code_digest(func: Callable) -> str:
+    """関数のコードのダイジェスト（プロセスをまたいで同じ値になる）"""
+    digest = hashlib.blake2b(digest_size=8)
+    _hash_const(inspect.unwrap(func).__code__, digest)
+    return digest.hexdigest()
+
+
+def make_key(name: str, code_digest: str, version: str, args: tuple, kwargs: dict) -> str:
+    payload = pickle.dumps((args, sorted(kwargs.items())), protocol=4)
+    return f"{name}:{code_digest}:{version}:{hashlib.blake2b(payload, digest_size=16).hexdigest()}"
+
+
+def shared_cache(ttl: Optional[int] = None, version: str = "", name: Optional[str] = None) -> Callable:
+    """
+    関数の結果を共有キャッシュに保存するデコレータ（st.cache_data の内側に付ける）
+
+    Args:
+        ttl: 有効期間（秒）。None なら無期限（サイズ上限による削除のみ）
+        version: キーに含める文字列（引数に現れない入力、例えばマスターデータのバージョン）
+        name: キャッシュ名（省略時はパッケージを除いたモジュール名.qualname）
+    """
+    def decorator(func: Callable) -> Callable:
+        # アプリ（utils）とバッチ（my_llm_app.utils）でインポート名が違っても同じキーにする
+        cache_name = name or f"{func.__module__.rsplit('.', 1)[-1]}.{func.__qualname__}"
+        code_digest = _code_digest(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            backend = get_backend()
+            if backend is None:
+                return func(*args, **kwargs)
+            try:
+                key = make_key(cache_name, code_digest, version, args, kwargs)
+                value = backend.get(key)
+            except Exception as e:
+                print(f"[WARNING] 共有キャッシュ読み込みエラー ({cache_name}): {e}")
+                _count(cache_name, "errors")
+                return func(*args, **kwargs)
+            if value is not _MISS:
+                _count(cache_name, "hits")
+                return value
+
+            _count(cache_name, "misses")
+            value = func(*args, **kwargs)
+            try:
+                backend.set(key, value, ttl)
+            except Exception as e:
+                print(f"[WARNING] 共有キャッシュ書き込みエラー ({cache_name}): {e}")
+                _count(cache_name, "errors")
+            return value
+        return wrapper
+    return decorator
+
+
+def clear():
+    """共有キャッシュを全削除"""
+    backend = get_backend()
+    if backend is not None:
+        backend.clear()
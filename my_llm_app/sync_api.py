@@ -0,0 +1,284 @@
+"""
+ネイティブアプリ向けの同期API（ローカルREST）
+
+問題バンクはバージョン付きで配信し、ETag（= マスターデータのバージョン）と
+gzip / zstd 圧縮で一度だけダウンロードさせる。学習カードは前回同期以降の差分だけを返す。
+
+- GET /v1/health
+- GET /v1/questions/version   問題バンクのバージョンと問題数
+- GET /v1/questions           問題バンク全体（If-None-Match が一致すれば 304）
+- GET /v1/cards?cursor=...    カードの差分（cursor なしは全件）
+
+/v1/health 以外は Authorization: Bearer <Firebase IDトークン> が必要。
+学士試験の権限がないユーザーには学士問題（G で始まる番号）とその症例を除いた問題バンクを返す。
+問題バンクは学士あり（g）・なし（k）の2種類で、ETag は "<バージョン>-g" / "<バージョン>-k"。
+
+圧縮済みの問題バンクはバージョン・種類ごとに1回だけ作成してメモリに保持する。
+zstd は zstandard パッケージがある場合のみ使用する。
+
+    python run_sync_api.py --port 8765
+"""
+
+import datetime
+import gzip
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+try:
+    import master_data
+except ImportError:
+    from . import master_data
+
+API_PREFIX = "/v1"
+# マスターデータのバージョンを確認し直す間隔（秒）
+VERSION_CHECK_INTERVAL = 60
+# この大きさ未満のレスポンスは圧縮しない
+MIN_COMPRESS_BYTES = 1024
+# 認証付きのため共有キャッシュ（CDN など）には保存させない
+QUESTIONS_CACHE_CONTROL = "private, max-age=300"
+
+
+def _json_default(obj):
+    if isinstance(obj, (datetime.datetime, datetime.date)):
+        return obj.isoformat()
+    return str(obj)
+
+
+def _dumps(payload: Any) -> bytes:
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":"), default=_json_default).encode("utf-8")
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=10).compress(body)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=6)
+    return body
+
+
+def choose_encoding(accept_encoding: str) -> str:
+    """Accept-Encoding から使う圧縮方式を選ぶ（zstd > gzip > なし）"""
+    accepted = set()
+    for item in (accept_encoding or "").split(","):
+        name, _, params = item.strip().partition(";")
+        if params.strip().replace(" ", "") in ("q=0", "q=0.0"):
+            continue
+        accepted.add(name.strip().lower())
+    if zstandard is not None and "zstd" in accepted:
+        return "zstd"
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip"
+    return "identity"
+
+
+def encode_cursor(value: Optional[datetime.datetime]) -> Optional[str]:
+    return value.astimezone(datetime.timezone.utc).isoformat() if value else None
+
+
+def decode_cursor(value: Optional[str]) -> Optional[datetime.datetime]:
+    """カーソル文字列を日時に変換（不正な値は ValueError）"""
+    if not value:
+        return None
+    parsed = datetime.datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    return parsed
+
+
+def filter_gakushi(data: Dict[str, Any]) -> Tuple[Dict[str, Any], list]:
+    """学士問題とそれだけが参照する症例を除いた (cases, questions)"""
+    questions = [q for q in data["questions"] if not str(q.get("number", "")).startswith("G")]
+    case_ids = {q.get("case_id") for q in questions if q.get("case_id")}
+    cases = {case_id: case for case_id, case in data["cases"].items() if case_id in case_ids}
+    return cases, questions
+
+
+class QuestionBankCache:
+    """問題バンクのレスポンス（種類・圧縮方式ごと）をバージョン単位で保持"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version: Optional[str] = None
+        self._checked_at = 0.0
+        self._counts: Dict[str, int] = {}
+        self._bodies: Dict[Tuple[str, str], bytes] = {}
+
+    def version(self) -> str:
+        with self._lock:
+            if self._version is None or time.monotonic() - self._checked_at > VERSION_CHECK_INTERVAL:
+                version = master_data.current_version()
+                if version != self._version:
+                    self._version = version
+                    self._counts = {}
+                    self._bodies = {}
+                self._checked_at = time.monotonic()
+            return self._version
+
+    @staticmethod
+    def tag(version: str, gakushi: bool) -> str:
+        """ETag・レスポンスに使うバージョン（学士あり: -g / なし: -k）"""
+        return f"{version}-{'g' if gakushi else 'k'}"
+
+    def body(self, encoding: str, gakushi: bool = False) -> Tuple[str, int, bytes]:
+        """(種類付きバージョン, 問題数, レスポンス本文)"""
+        version = self.version()
+        variant = "g" if gakushi else "k"
+        tag = self.tag(version, gakushi)
+        with self._lock:
+            if (variant, "identity") not in self._bodies:
+                data = master_data.load_master(version)
+                if gakushi:
+                    cases, questions = data["cases"], data["questions"]
+                else:
+                    cases, questions = filter_gakushi(data)
+                self._counts[variant] = len(questions)
+                self._bodies[(variant, "identity")] = _dumps({
+                    "version": tag,
+                    "cases": cases,
+                    "questions": questions,
+                })
+            if (variant, encoding) not in self._bodies:
+                self._bodies[(variant, encoding)] = compress(self._bodies[(variant, "identity")], encoding)
+            return tag, self._counts[variant], self._bodies[(variant, encoding)]
+
+
+class SyncAPIHandler(BaseHTTPRequestHandler):
+    """同期APIのリクエスト処理"""
+
+    server_version = "DentalSyncAPI/1.0"
+    protocol_version = "HTTP/1.1"
+    question_bank = QuestionBankCache()
+
+    def log_message(self, format, *args):
+        print(f"[sync_api] {self.address_string()} {format % args}")
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        try:
+            if parsed.path == f"{API_PREFIX}/health":
+                self._send_json(200, {"status": "ok"})
+            elif parsed.path == f"{API_PREFIX}/questions/version":
+                self._send_questions_version()
+            elif parsed.path == f"{API_PREFIX}/questions":
+                self._send_questions()
+            elif parsed.path == f"{API_PREFIX}/cards":
+                self._send_cards(parse_qs(parsed.query))
+            else:
+                self._send_json(404, {"status": "error", "message": "not found"})
+        except Exception as e:
+            print(f"[ERROR] 同期APIエラー: {parsed.path}: {e}")
+            self._send_json(500, {"status": "error", "message": "internal error"})
+
+    def _send_questions_version(self):
+        uid = self._require_uid()
+        if not uid:
+            return
+        version, count, _ = self.question_bank.body("identity", self._can_access_gakushi(uid))
+        self._send_json(200, {"version": version, "count": count}, headers={"Cache-Control": "private, no-store"})
+
+    def _send_questions(self):
+        uid = self._require_uid()
+        if not uid:
+            return
+        gakushi = self._can_access_gakushi(uid)
+        etag = f'"{self.question_bank.tag(self.question_bank.version(), gakushi)}"'
+        if etag in [tag.strip() for tag in self.headers.get("If-None-Match", "").split(",")]:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", QUESTIONS_CACHE_CONTROL)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        encoding = choose_encoding(self.headers.get("Accept-Encoding", ""))
+        version, _, body = self.question_bank.body(encoding, gakushi)
+        self._send_body(200, body, encoding, {
+            "ETag": f'"{version}"',
+            "Cache-Control": QUESTIONS_CACHE_CONTROL,
+        })
+
+    def _authenticated_uid(self) -> Optional[str]:
+        header = self.headers.get("Authorization", "")
+        if not header.startswith("Bearer "):
+            return None
+        from firebase_admin import auth
+        try:
+            return auth.verify_id_token(header[len("Bearer "):].strip())["uid"]
+        except Exception as e:
+            print(f"[WARNING] IDトークンの検証に失敗: {e}")
+            return None
+
+    def _require_uid(self) -> Optional[str]:
+        """IDトークンを検証して uid を返す（無効なら 401 を送信して None）"""
+        # Firebase の初期化（トークン検証にも必要）
+        self._firestore_manager()
+        uid = self._authenticated_uid()
+        if not uid:
+            self._send_json(401, {"status": "error", "message": "invalid or missing ID token"})
+        return uid
+
+    @staticmethod
+    def _firestore_manager():
+        try:
+            from firestore_db import get_firestore_manager
+        except ImportError:
+            from .firestore_db import get_firestore_manager
+        return get_firestore_manager()
+
+    @staticmethod
+    def _can_access_gakushi(uid: str) -> bool:
+        try:
+            from firestore_db import check_gakushi_permission
+        except ImportError:
+            from .firestore_db import check_gakushi_permission
+        return bool(check_gakushi_permission(uid))
+
+    def _send_cards(self, query: Dict[str, list]):
+        uid = self._require_uid()
+        if not uid:
+            return
+        try:
+            since = decode_cursor((query.get("cursor") or [None])[0])
+        except ValueError:
+            self._send_json(400, {"status": "error", "message": "invalid cursor"})
+            return
+
+        cards, cursor = self._firestore_manager().get_user_cards_since(uid, since)
+        self._send_json(200, {
+            "status": "success",
+            "full": since is None,
+            "cards": cards,
+            "cursor": encode_cursor(cursor),
+        }, headers={"Cache-Control": "private, no-store"})
+
+    def _send_json(self, status: int, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+        body = _dumps(payload)
+        encoding = "identity"
+        if len(body) >= MIN_COMPRESS_BYTES:
+            encoding = choose_encoding(self.headers.get("Accept-Encoding", ""))
+        self._send_body(status, compress(body, encoding), encoding, headers)
+
+    def _send_body(self, status: int, body: bytes, encoding: str, headers: Optional[Dict[str, str]] = None):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Vary", "Accept-Encoding")
+        if encoding != "identity":
+            self.send_header("Content-Encoding", encoding)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def create_server(host: str = "127.0.0.1", port: int = 8765) -> ThreadingHTTPServer:
+    return ThreadingHTTPServer((host, port), SyncAPIHandler)
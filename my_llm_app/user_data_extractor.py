@@ -6,7 +6,7 @@
 
 import sys
 import os
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from collections import defaultdict, Counter
 import json
 
@@ -14,6 +14,11 @@ import json
 import firebase_admin
 from firebase_admin import credentials, firestore
 
+try:
+    import review_log
+except ImportError:
+    from . import review_log
+
 class UserDataExtractor:
     """ユーザー学習データ抽出クラス"""
     
@@ -408,11 +413,61 @@ class UserDataExtractor:
             print(f"今日の学習数計算エラー: {e}")
             return 0
 
+    def _extract_logs_from_review_log(self, uid, start_date, end_date=None):
+        """期間指定の自己評価ログを週パーティションから抽出（イベントログが使えないユーザーは None）"""
+        user_doc = self.db.collection('users').document(uid).get()
+        if not review_log.is_complete(user_doc.to_dict() if user_doc.exists else None):
+            return None
+        
+        end_date = end_date or datetime.now()
+        # パーティションは日本時間の週。前後1日広めに読み、時刻で絞り込む
+        events = review_log.load_events(
+            self.db, uid,
+            (start_date - timedelta(days=1)).date(),
+            (end_date + timedelta(days=1)).date()
+        )
+        
+        entries = []
+        for event in events:
+            # カード履歴と同じくタイムゾーンなしのUTC時刻で比較
+            dt = datetime.fromtimestamp(event['t'] / 1000, tz=timezone.utc).replace(tzinfo=None)
+            if start_date <= dt <= end_date:
+                entries.append((event, dt))
+        
+        # 科目・難易度は該当する問題のカードだけ読み込む
+        question_ids = sorted({event['q'] for event, _ in entries})
+        refs = [self.db.collection('study_cards').document(f"{uid}_{qid}") for qid in question_ids]
+        metadata = {}
+        for snapshot in self.db.get_all(refs, field_paths=['metadata']) if refs else []:
+            if snapshot.exists:
+                metadata[snapshot.id.split('_', 1)[1]] = (snapshot.to_dict() or {}).get('metadata', {}) or {}
+        
+        evaluation_logs = []
+        for event, dt in entries:
+            quality = event['g']
+            card_metadata = metadata.get(event['q'], {})
+            evaluation_logs.append({
+                'question_id': event['q'],
+                'timestamp': dt,
+                'quality': quality,
+                'quality_text': self._quality_to_text(quality),
+                'is_correct': quality >= 3,  # 3以上を正解とみなす
+                'subject': card_metadata.get('subject', '不明'),
+                'difficulty': card_metadata.get('difficulty', 'normal')
+            })
+        return evaluation_logs
+    
     def extract_self_evaluation_logs(self, uid, start_date=None, end_date=None):
-        """自己評価ログを抽出"""
+        """自己評価ログを抽出（期間指定があれば対象週のイベントログだけを読む）"""
         try:
             print(f"📊 {uid} の自己評価ログを抽出中...")
             
+            if start_date:
+                evaluation_logs = self._extract_logs_from_review_log(uid, start_date, end_date)
+                if evaluation_logs is not None:
+                    print(f"✅ {len(evaluation_logs)}件の自己評価ログを抽出（イベントログ）")
+                    return evaluation_logs
+            
             # ユーザーのカードデータを取得
             cards_ref = self.db.collection('study_cards')
             query = cards_ref.where('uid', '==', uid)
@@ -19,9 +19,11 @@ import subprocess
 import tempfile
 import base64
 import hashlib
+import random
 import requests
 from typing import Dict, Any, List, Optional, Union
 from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
 import pytz
 import streamlit.components.v1 as components
 
@@ -75,12 +77,61 @@ except ImportError:
     def get_standardized_subject(subject):
         return subject or "未分類"
 
+# 問題メタデータ（正答マスク・問題形式・整形済み問題文）
+try:
+    import question_meta
+except ImportError:
+    from . import question_meta
+
+# マスターデータの増分ビルド（ファイル単位のシャードとマニフェスト）
+try:
+    import master_data
+except ImportError:
+    from . import master_data
+
+# ホットパスの処理時間計測
+try:
+    from perf_metrics import timed
+except ImportError:
+    from .perf_metrics import timed
+
+try:
+    from shared_cache import shared_cache
+except ImportError:
+    from .shared_cache import shared_cache
+
 # Google Analytics設定
 try:
     GA_MEASUREMENT_ID = st.secrets.get("google_analytics_id", "G-XXXXXXXXXX")
 except:
     GA_MEASUREMENT_ID = "G-XXXXXXXXXX"  # フォールバック値
 
+# Measurement Protocol用のAPIシークレット（設定時はサーバー側から一括送信）
+try:
+    GA_API_SECRET = st.secrets.get("google_analytics_api_secret", "")
+except:
+    GA_API_SECRET = ""
+
+GA_MP_ENDPOINT = "https://www.google-analytics.com/mp/collect"
+# Measurement Protocolの1リクエストあたりの最大イベント数
+GA_MP_MAX_EVENTS = 25
+# Measurement Protocolの送信はバックグラウンドで行う（スクリプトの再実行を待たせない）
+_GA_MP_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ga-mp")
+
+# イベントバッファの自動フラッシュ件数
+ANALYTICS_FLUSH_EVERY = 20
+ANALYTICS_BUFFER_KEY = "_ga_event_buffer"
+
+# イベント種別ごとのサンプリング率（未指定は1.0 = 全件送信）
+ANALYTICS_SAMPLE_RATES = {
+    "user_active": 0.2,
+    "page_change": 0.5,
+}
+try:
+    ANALYTICS_SAMPLE_RATES.update(dict(st.secrets.get("analytics_sample_rates", {})))
+except:
+    pass
+
 
 class AnalyticsUtils:
     """Google Analytics統合のためのユーティリティクラス"""
@@ -105,27 +156,99 @@ class AnalyticsUtils:
     
     @staticmethod
     def track_event(event_name: str, parameters: Dict[str, Any] = None):
-        """Google Analyticsイベントを追跡"""
-        if parameters is None:
-            parameters = {}
+        """Google Analyticsイベントをバッファに追加（送信は flush_events でまとめて実行）"""
+        sample_rate = float(ANALYTICS_SAMPLE_RATES.get(event_name, 1.0))
+        if sample_rate <= 0 or (sample_rate < 1.0 and random.random() >= sample_rate):
+            return
+        
+        parameters = dict(parameters or {})
         
         # ユーザーIDを取得（セッション状態から）
-        user_id = st.session_state.get('user_id', 'anonymous')
-        parameters['user_id'] = user_id
+        parameters.setdefault('user_id', st.session_state.get('user_id', 'anonymous'))
         
         # タイムスタンプを追加
         parameters['timestamp'] = datetime.datetime.now(JST).isoformat()
+        if sample_rate < 1.0:
+            parameters['sample_rate'] = sample_rate
         
-        # JavaScriptでGoogle Analytics イベントを送信
+        buffer = st.session_state.setdefault(ANALYTICS_BUFFER_KEY, [])
+        buffer.append({'name': event_name, 'params': parameters})
+        
+        # 一定件数たまったら途中でも送信
+        if len(buffer) >= ANALYTICS_FLUSH_EVERY:
+            AnalyticsUtils.flush_events()
+    
+    @staticmethod
+    def flush_events():
+        """バッファ内のイベントを1回の送信でまとめてGoogle Analyticsへ送る"""
+        buffer = st.session_state.get(ANALYTICS_BUFFER_KEY)
+        if not buffer:
+            return
+        
+        events = list(buffer)
+        buffer.clear()
+        
+        try:
+            if GA_API_SECRET:
+                AnalyticsUtils._send_measurement_protocol(events)
+            else:
+                AnalyticsUtils._render_gtag_batch(events)
+        except Exception as e:
+            print(f"[WARNING] Analyticsイベント送信エラー: {e}")
+    
+    @staticmethod
+    def _render_gtag_batch(events: List[Dict[str, Any]]):
+        """複数イベントを1つのコンポーネントでgtagへ送信"""
+        calls = "\n".join(
+            f"gtag('event', {json.dumps(event['name'])}, {json.dumps(event['params'], default=str)});"
+            for event in events
+        )
         ga_js = f"""
         <script>
+        var gtag = window.gtag || (window.parent && window.parent.gtag);
         if (typeof gtag !== 'undefined') {{
-            gtag('event', '{event_name}', {json.dumps(parameters)});
+            {calls}
         }}
         </script>
         """
         components.html(ga_js, height=0)
     
+    @staticmethod
+    def _send_measurement_protocol(events: List[Dict[str, Any]]):
+        """Measurement Protocolでサーバー側から一括送信（送信はバックグラウンドのワーカーで実行）"""
+        client_id = st.session_state.setdefault('_ga_client_id', str(uuid.uuid4()))
+        url = f"{GA_MP_ENDPOINT}?measurement_id={GA_MEASUREMENT_ID}&api_secret={GA_API_SECRET}"
+        
+        # ユーザーごとにまとめ、1リクエストあたりの上限件数で分割
+        by_user = defaultdict(list)
+        for event in events:
+            params = dict(event['params'])
+            user_id = params.pop('user_id', 'anonymous')
+            by_user[user_id].append({'name': event['name'], 'params': params})
+        
+        payloads = []
+        for user_id, user_events in by_user.items():
+            for i in range(0, len(user_events), GA_MP_MAX_EVENTS):
+                payload = {
+                    'client_id': client_id,
+                    'events': user_events[i:i + GA_MP_MAX_EVENTS]
+                }
+                if user_id and user_id != 'anonymous':
+                    payload['user_id'] = user_id
+                payloads.append(json.dumps(payload, default=str))
+        
+        _GA_MP_EXECUTOR.submit(AnalyticsUtils._post_measurement_protocol, url, payloads)
+    
+    @staticmethod
+    def _post_measurement_protocol(url: str, payloads: List[str]):
+        """ワーカースレッドでの送信（共有HTTPセッションを使用）"""
+        session = get_http_session()
+        for data in payloads:
+            try:
+                session.post(url, data=data, timeout=5)
+            except Exception as e:
+                print(f"[WARNING] Analyticsイベント送信エラー: {e}")
+    
     @staticmethod
     def track_study_session_start(session_type: str, question_count: int = 0):
         """学習セッション開始を追跡"""
@@ -268,6 +391,20 @@ class QuestionUtils:
         # 単一正解の場合
         return user_choice.upper() == correct_answer.upper()
     
+    @staticmethod
+    def get_meta(question: Dict[str, Any]) -> Dict[str, Any]:
+        """事前計算済みの問題メタデータを取得（マスターデータにない問題はその場で計算）"""
+        meta = QUESTION_META.get(question.get('number', ''))
+        if meta is None:
+            meta = question_meta.build_question_meta(question)
+        return meta
+    
+    @staticmethod
+    def grade_many(questions: List[Dict[str, Any]], answers: Dict[str, str]) -> Dict[str, bool]:
+        """問題グループをまとめて採点（問題番号 → 正誤）"""
+        metadata = {q.get('number', ''): QuestionUtils.get_meta(q) for q in questions}
+        return question_meta.grade_many(metadata, answers)
+    
     @staticmethod
     def format_answer_display(correct_answer: str) -> str:
         """
@@ -605,80 +742,24 @@ class CardSelectionUtils:
 
 
 @st.cache_data(ttl=3600)  # 1時間キャッシュ
-def load_master_data(version: str = "v2025-08-22-all-gakushi-files") -> tuple:
-    """マスターデータを読み込む（キャッシュ付き）"""
-    start = time.time()
-    
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    master_dir = os.path.join(script_dir, 'data')
-    
-    # 読み込むファイルを直接指定
-    files_to_load = [
-        'master_questions_final.json', 
-        'gakushi-2022-1-1.json', 
-        'gakushi-2022-1-2.json', 
-        'gakushi-2022-1-3.json', 
-        'gakushi-2022-1再.json',  
-        'gakushi-2022-2.json', 
-        'gakushi-2023-1-1.json',
-        'gakushi-2023-1-2.json',
-        'gakushi-2023-1-3.json',
-        'gakushi-2023-1再.json', 
-        'gakushi-2023-2.json',
-        'gakushi-2023-2再.json',
-        'gakushi-2024-1-1.json', 
-        'gakushi-2024-2.json', 
-        'gakushi-2025-1-1.json'
-    ]
-    target_files = [os.path.join(master_dir, f) for f in files_to_load]
-
-    all_cases = {}
-    all_questions = []
-    seen_numbers = set()
-    
-    for file_path in target_files:
-        if not os.path.exists(file_path):
-            continue
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
-            if isinstance(data, dict):
-                cases = data.get('cases', {})
-                if isinstance(cases, dict):
-                    all_cases.update(cases)
-                
-                questions = data.get('questions', [])
-                if isinstance(questions, list):
-                    for q in questions:
-                        num = q.get('number')
-                        if num and num not in seen_numbers:
-                            all_questions.append(q)
-                            seen_numbers.add(num)
-            
-            elif isinstance(data, list):
-                for q in data:
-                    num = q.get('number')
-                    if num and num not in seen_numbers:
-                        all_questions.append(q)
-                        seen_numbers.add(num)
+@shared_cache(ttl=3600)
+@timed("master.load_master_data")
+def load_master_data(version: str = "") -> tuple:
+    """
+    マスターデータを読み込む（キャッシュ付き）
 
-        except Exception as e:
-            print(f"{file_path} の読み込みでエラー: {e}")
-    
-    total_time = time.time() - start
-    gakushi_count = sum(1 for q in all_questions if q.get('number', '').startswith('G'))
-    kokushi_count = len(all_questions) - gakushi_count
-    
-    
-    return all_cases, all_questions
+    問題ファイルは data/ から自動検出し、ファイル単位のシャード（master_data）から組み立てる。
+    version はキャッシュキー（master_data.current_version()。ファイルの内容が変われば変わる）
+    """
+    data = master_data.load_master(version or None)
+    return data['cases'], data['questions']
 
 
 @st.cache_data(ttl=3600)
+@shared_cache(ttl=3600)
+@timed("master.get_derived_data")
 def get_derived_data(all_questions: List[Dict[str, Any]]):
     """派生データを別途キャッシュして計算コストを分散"""
-    start = time.time()
-    
     questions_dict = {q['number']: q for q in all_questions}
     subjects = sorted(list(set(q['subject'] for q in all_questions if q.get('subject') and q.get('subject') != '（未分類）')))
     exam_numbers = sorted(list(set(re.match(r'(\d+)', q['number']).group(1) for q in all_questions if re.match(r'(\d+)', q['number']))), key=int, reverse=True)
@@ -686,11 +767,25 @@ def get_derived_data(all_questions: List[Dict[str, Any]]):
     hisshu_numbers = {q['number'] for q in all_questions if QuestionUtils.is_hisshu(q['number'])}
     gakushi_hisshu_numbers = {q['number'] for q in all_questions if QuestionUtils.is_gakushi_hisshu(q['number'])}
     
-    derived_time = time.time() - start
-    
     return questions_dict, subjects, exam_numbers, exam_sessions, hisshu_numbers, gakushi_hisshu_numbers
 
 
+@st.cache_data(ttl=3600)
+@timed("master.get_master_artifacts")
+def get_master_artifacts(version: str) -> tuple:
+    """シャードで事前計算済みの (問題メタデータ, 検索用テキスト)"""
+    data = master_data.load_master(version or None)
+    return data['meta'], data['search']
+
+
+@st.cache_data(ttl=3600)
+@timed("master.get_natural_sort_ranks")
+def get_natural_sort_ranks(all_questions: List[Dict[str, Any]]) -> Dict[str, int]:
+    """問題番号 → 自然順の順位（get_natural_sort_key の順序を1回だけ計算して整数化）"""
+    ordered = sorted((q for q in all_questions if q.get('number')), key=get_natural_sort_key)
+    return {q['number']: rank for rank, q in enumerate(ordered)}
+
+
 def log_to_ga(event_name: str, user_id: str, params: Dict[str, Any]):
     """Google Analytics GA4にイベントを送信"""
     try:
@@ -749,8 +844,11 @@ def get_theme_css() -> str:
 
 
 # 初期データ読み込み（モジュール読み込み時に実行）
-CASES, ALL_QUESTIONS = load_master_data()
+MASTER_DATA_VERSION = master_data.current_version()
+CASES, ALL_QUESTIONS = load_master_data(MASTER_DATA_VERSION)
 ALL_QUESTIONS_DICT, ALL_SUBJECTS, ALL_EXAM_NUMBERS, ALL_EXAM_SESSIONS, HISSHU_Q_NUMBERS_SET, GAKUSHI_HISSHU_Q_NUMBERS_SET = get_derived_data(ALL_QUESTIONS)
+QUESTION_META, QUESTION_SEARCH_TEXT = get_master_artifacts(MASTER_DATA_VERSION)
+QUESTION_SORT_RANKS = get_natural_sort_ranks(ALL_QUESTIONS)
 
 
 # ===== PDF生成関連の関数群 =====
@@ -1028,6 +1126,21 @@ def get_secure_image_url(path: str) -> Optional[str]:
     return get_http_session._session
 
 
+def resolve_explanation_image_url(question: Dict[str, Any]) -> Optional[str]:
+    """
+    AI解説の生成に渡す画像URLを取得（画面表示と事前生成バッチで共通）
+
+    image_urls → image_paths の順に最初の画像を使い、Storage のパスは署名付きURLに変換する。
+    """
+    raw_image_source = (question.get('image_urls') or question.get('image_paths') or [None])[0]
+    if not raw_image_source:
+        return None
+    try:
+        return get_secure_image_url(raw_image_source) or raw_image_source
+    except Exception:
+        return raw_image_source  # 失敗した場合は元のURLをそのまま使用
+
+
 def create_simple_fallback_template(questions: List[Dict]) -> str:
     """シンプルなフォールバックテンプレート"""
     content = []
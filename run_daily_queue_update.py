@@ -0,0 +1,24 @@
+#!/usr/bin/env python3
+"""
+おまかせ学習の日次キュー事前計算スクリプト（夜間バッチ用）
+
+JST 3:00 以降に実行すると、全ユーザーの当日分キューを daily_queues に保存します。
+Firestore 認証はアプリ側の secrets に依存している点は run_ranking_update.py と同様です。
+"""
+
+import sys
+
+
+def main() -> int:
+    try:
+        from my_llm_app.modules.daily_queue import precompute_daily_queues
+        summary = precompute_daily_queues()
+        print(f"Daily queue update completed: {summary}")
+        return 0
+    except Exception as e:
+        print(f"Daily queue update failed: {e}", file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+AI解説の事前生成スクリプト（手動/バッチ実行用）
+
+問題バンク全体の解説を生成して解説キャッシュ（ディスク＋llm_feedback）に保存します。
+生成済みの問題はスキップされるため、途中で中断しても再実行で続きから処理できます。
+"""
+
+import argparse
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="AI解説の事前生成")
+    parser.add_argument("--workers", type=int, default=4, help="同時生成数（デフォルト: 4）")
+    parser.add_argument("--limit", type=int, default=0, help="処理する問題数の上限（0 は全件）")
+    parser.add_argument("--no-firestore", action="store_true", help="ディスクキャッシュのみに保存する")
+    args = parser.parse_args()
+
+    try:
+        from my_llm_app.utils import ALL_QUESTIONS, resolve_explanation_image_url
+        from my_llm_app import llm
+        from my_llm_app.explanation_cache import get_explanation_store
+
+        store = get_explanation_store()
+        store.use_firestore = not args.no_firestore
+
+        questions = [q for q in ALL_QUESTIONS if q.get("number")]
+        if args.limit:
+            questions = questions[:args.limit]
+
+        generated = cached = errors = 0
+        pending = []
+        for q in questions:
+            if store.get(q["number"], llm.PROMPT_TEMPLATE_VERSION, llm.EXPLANATION_MODEL) is not None:
+                cached += 1
+            else:
+                pending.append(q)
+
+        def generate(q):
+            # 画像問題は画面と同じ画像URLで生成する（署名付きURLは期限があるため生成の直前に取得）
+            return llm.get_cached_explanation(q, image_url=resolve_explanation_image_url(q))
+
+        # 同時実行数を制限したワーカープールで生成
+        with ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+            futures = {executor.submit(generate, q): q["number"] for q in pending}
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                    generated += 1
+                except Exception as e:
+                    errors += 1
+                    print(f"Explanation generation failed for {futures[future]}: {e}", file=sys.stderr)
+
+        print(f"Explanation pregeneration completed: generated={generated}, cached={cached}, errors={errors}")
+        return 0 if errors == 0 else 1
+    except Exception as e:
+        print(f"Explanation pregeneration failed: {e}", file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Firestore使用量レポート（容量計画用）
+
+アプリ・バッチが FIRESTORE_USAGE_LOG に追記した集計（JSON Lines）を読み込み、
+スコープ（session / rerun / job:名前）ごとと論理操作ごとの読み書き件数を表示します。
+
+例:
+    python run_firestore_usage_report.py
+    python run_firestore_usage_report.py --scope session --top 20
+    python run_firestore_usage_report.py --log path/to/firestore_usage.jsonl --json
+"""
+
+import argparse
+import json
+import sys
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Firestore使用量レポート")
+    parser.add_argument("--log", default=None, help="集計ログのパス（省略時は FIRESTORE_USAGE_LOG）")
+    parser.add_argument("--scope", default=None, choices=["session", "rerun", "job"], help="対象スコープ")
+    parser.add_argument("--top", type=int, default=15, help="表示する論理操作の件数")
+    parser.add_argument("--json", action="store_true", help="JSONで出力")
+    args = parser.parse_args()
+
+    try:
+        from my_llm_app.firestore_usage import load_usage_log, summarize_usage_log
+    except Exception as e:
+        print(f"Firestore usage report failed: {e}", file=sys.stderr)
+        return 1
+
+    records = load_usage_log(args.log)
+    if not records:
+        print("No usage records found.")
+        return 0
+
+    report = summarize_usage_log(records, args.scope)
+    report["operations"] = report["operations"][:args.top]
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return 0
+
+    print("=== スコープ別 ===")
+    for scope, entry in sorted(report["scopes"].items()):
+        print(f"{scope:32s} 件数 {entry['count']:6d}  読み取り {entry['reads']:9d} "
+              f"(平均 {entry['avg_reads']}, 最大 {entry['max_reads']})  "
+              f"書き込み {entry['writes']:7d}  削除 {entry['deletes']:6d}")
+
+    print(f"\n=== 読み取りの多い論理操作（上位{args.top}件） ===")
+    for row in report["operations"]:
+        print(f"{row['operation']:40s} {row['collection']:20s} 読み取り {row['reads']:9d} "
+              f"書き込み {row['writes']:7d}  削除 {row['deletes']:6d}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+マスターデータのビルド（手動/バッチ実行用）
+
+my_llm_app/data/ の問題ファイルを検出し、内容が変わったファイルのシャードだけを作り直して
+マニフェスト（data/master_manifest.json）を更新します。問題ファイルを追加した後に実行してください。
+スキーマ・番号の重複を検証し、エラーがあれば終了コード 1 を返します。
+
+例:
+    python run_master_data_build.py
+    python run_master_data_build.py --check   # 検証のみ（保存しない）
+    python run_master_data_build.py --force   # 全ファイルを再ビルド
+"""
+
+import argparse
+import sys
+import time
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="マスターデータのビルド")
+    parser.add_argument("--data-dir", default=None, help="問題ファイルのディレクトリ（省略時は my_llm_app/data）")
+    parser.add_argument("--force", action="store_true", help="キャッシュ済みシャードを使わず全ファイルを再ビルド")
+    parser.add_argument("--check", action="store_true", help="検証のみ（シャード・マニフェストを保存しない）")
+    parser.add_argument("--show-warnings", action="store_true", help="警告（問題文・解答の欠落など）も表示")
+    args = parser.parse_args()
+
+    try:
+        from my_llm_app import master_data
+
+        start = time.perf_counter()
+        manifest, _ = master_data.build(
+            args.data_dir or master_data.MASTER_DATA_DIR,
+            force=args.force,
+            save_shards=not args.check,
+            save_manifest=not args.check,
+        )
+        elapsed = time.perf_counter() - start
+
+        error_count = 0
+        warning_count = 0
+        for entry in manifest["files"]:
+            error_count += len(entry["errors"])
+            warning_count += len(entry["warnings"])
+            for error in entry["errors"]:
+                print(f"[ERROR] {entry['name']}: {error}", file=sys.stderr)
+            if args.show_warnings:
+                for warning in entry["warnings"]:
+                    print(f"[WARNING] {entry['name']}: {warning}", file=sys.stderr)
+        duplicate_count = 0
+        for duplicate in manifest["duplicates"]:
+            numbers = duplicate["numbers"]
+            duplicate_count += len(numbers)
+            print(f"[WARNING] {duplicate['file']}: {len(numbers)}問が {duplicate['kept']} と番号重複"
+                  f"（{duplicate['kept']} を使用。例: {', '.join(numbers[:3])}）", file=sys.stderr)
+
+        print(f"Master data build completed: files={len(manifest['files'])}, rebuilt={len(manifest['rebuilt'])}, "
+              f"questions={manifest['question_count']}, duplicates={duplicate_count}, "
+              f"errors={error_count}, warnings={warning_count}, version={manifest['version']}, "
+              f"elapsed={elapsed:.2f}s")
+        return 1 if error_count else 0
+    except Exception as e:
+        print(f"Master data build failed: {e}", file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
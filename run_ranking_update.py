@@ -5,13 +5,30 @@
 Streamlitアプリ外でも起動できるようにしていますが、
 Firestore 認証はアプリ側の secrets に依存しているため、
 ローカル単体実行では認証がない環境だと失敗する点に注意してください。
+
+ユーザー・カード単位の詳細ログは DEBUG レベルのため既定では出力しません。
+    python run_ranking_update.py --log-level DEBUG
+    python run_ranking_update.py --module-level ranking_calculator=DEBUG --log-jsonl logs/ranking.jsonl
 """
 
+import argparse
 import sys
 
 
 def main() -> int:
+    parser = argparse.ArgumentParser(description="ランキング更新")
+    parser.add_argument("--log-level", default="INFO", help="ログレベル（DEBUG / INFO / WARNING / ERROR）")
+    parser.add_argument("--module-level", action="append", default=[], metavar="MODULE=LEVEL",
+                        help="モジュール別のログレベル（複数指定可）")
+    parser.add_argument("--log-jsonl", default=None, help="JSON Lines 形式のログ出力先")
+    args = parser.parse_args()
+
     try:
+        # 各モジュールがロガーを取得する前に設定する
+        from my_llm_app.app_logging import configure_logging
+        module_levels = dict(item.split("=", 1) for item in args.module_level if "=" in item)
+        configure_logging(level=args.log_level, module_levels=module_levels, jsonl_path=args.log_jsonl)
+
         # アプリ内の実装をそのまま呼び出し
         from my_llm_app.modules.ranking_updater import update_all_rankings
         summary = update_all_rankings()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+関連問題インデックスの作成（手動/バッチ実行用）
+
+問題バンク全体をベクトル化し、関連問題インデックス（RELATED_INDEX_DIR）を作成します。
+- --method tfidf（既定）: 文字 n-gram の TF-IDF を SVD で圧縮（モデルのダウンロード不要。scikit-learn が必要）
+- --method embedding: sentence-transformers のモデルでベクトル化（scripts/embedding_service のキャッシュを利用）
+
+例:
+    python run_related_index_build.py
+    python run_related_index_build.py --method embedding --model models/dental-bert-v1
+"""
+
+import argparse
+import sys
+import time
+
+DEFAULT_EMBEDDING_MODEL = "cl-tohoku/bert-base-japanese-whole-word-masking"
+
+
+def _tfidf_vectors(texts, dim):
+    from sklearn.decomposition import TruncatedSVD
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    # 日本語は分かち書きせず文字 n-gram で扱う
+    vectorizer = TfidfVectorizer(analyzer="char_wb", ngram_range=(2, 3), sublinear_tf=True,
+                                 min_df=2, max_features=100000)
+    matrix = vectorizer.fit_transform(texts)
+    components = max(1, min(dim, matrix.shape[1] - 1, len(texts) - 1))
+    return TruncatedSVD(n_components=components, random_state=0).fit_transform(matrix)
+
+
+def _embedding_vectors(texts, model_name, batch_size):
+    from scripts.embedding_service import EmbeddingService
+
+    return EmbeddingService(model_name, batch_size=batch_size).encode(texts)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="関連問題インデックスの作成")
+    parser.add_argument("--method", choices=["tfidf", "embedding"], default="tfidf", help="ベクトル化の方法")
+    parser.add_argument("--model", default=DEFAULT_EMBEDDING_MODEL, help="embedding で使うモデル名またはパス")
+    parser.add_argument("--dim", type=int, default=256, help="tfidf の圧縮後の次元数")
+    parser.add_argument("--batch-size", type=int, default=64, help="embedding のバッチサイズ")
+    parser.add_argument("--neighbors", type=int, default=None, help="問題ごとに保存する近傍の件数")
+    parser.add_argument("--output", default=None, help="出力先（省略時は RELATED_INDEX_DIR）")
+    args = parser.parse_args()
+
+    try:
+        from my_llm_app.utils import ALL_QUESTIONS
+        from my_llm_app import related_questions
+
+        questions = [q for q in ALL_QUESTIONS if q.get("number")]
+        ids = [q["number"] for q in questions]
+        texts = [related_questions.question_text(q) for q in questions]
+
+        start = time.perf_counter()
+        if args.method == "embedding":
+            vectors = _embedding_vectors(texts, args.model, args.batch_size)
+            model = args.model
+        else:
+            vectors = _tfidf_vectors(texts, args.dim)
+            model = ""
+
+        meta = related_questions.save_index(
+            args.output or related_questions.RELATED_INDEX_DIR, ids, vectors,
+            method=args.method, model=model,
+            k=args.neighbors or related_questions.DEFAULT_NEIGHBORS,
+        )
+        elapsed = time.perf_counter() - start
+        print(f"Related question index built: questions={len(ids)}, method={meta['method']}, "
+              f"dim={meta['dim']}, neighbors={meta['k']}, elapsed={elapsed:.1f}s")
+        return 0
+    except Exception as e:
+        print(f"Related question index build failed: {e}", file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+自己評価イベントログのバックフィル（手動/バッチ実行用）
+
+各ユーザーのカードの history から週パーティション（review_events）を作成し、
+ユーザードキュメントに review_log_complete を立てます。以降、週間ランキング・学習量グラフ・
+期間指定の抽出はそのユーザーについてイベントログだけを読みます。
+書き込みは重複しないため、何度実行しても結果は同じです。
+
+イベントログへの追記（保存処理）をデプロイした後に実行してください。
+Firestore 認証はアプリ側の secrets / ADC に依存します。
+
+例:
+    python run_review_log_backfill.py
+    python run_review_log_backfill.py --uid <uid> --dry-run
+"""
+
+import argparse
+import sys
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="自己評価イベントログのバックフィル")
+    parser.add_argument("--uid", action="append", default=[], help="対象ユーザー（複数指定可。省略時は全ユーザー）")
+    parser.add_argument("--dry-run", action="store_true", help="イベント数の確認のみ（書き込まない）")
+    args = parser.parse_args()
+
+    try:
+        from my_llm_app import review_log
+        from my_llm_app.firestore_db import get_firestore_manager
+
+        fm = get_firestore_manager()
+        uids = args.uid or [doc.id for doc in fm.db.collection("users").select([]).stream()]
+
+        users = 0
+        events = 0
+        failed = 0
+        for uid in uids:
+            try:
+                # 読み込みエラーを空のカードとして扱わないよう、直接クエリする
+                cards = {}
+                for doc in fm.db.collection("study_cards").where("uid", "==", uid).get(timeout=30):
+                    data = doc.to_dict() or {}
+                    question_id = data.get("question_id") or doc.id.split("_", 1)[-1]
+                    cards[question_id] = {"history": data.get("history", [])}
+                if args.dry_run:
+                    count = len(review_log.events_from_cards(cards))
+                else:
+                    count = review_log.backfill_user(fm.db, uid, cards)
+                    fm.invalidate_user_cache(uid, "profile")
+                users += 1
+                events += count
+            except Exception as e:
+                failed += 1
+                print(f"[ERROR] {uid}: {e}", file=sys.stderr)
+
+        print(f"Review log backfill completed: users={users}, events={events}, failed={failed}, dry_run={args.dry_run}")
+        return 1 if failed else 0
+    except Exception as e:
+        print(f"Review log backfill failed: {e}", file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
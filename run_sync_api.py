@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+ネイティブアプリ向け同期APIの起動（ローカル実行用）
+
+問題バンク（ETag・圧縮付き）とカードの差分同期を提供します（my_llm_app/sync_api.py）。
+問題バンク・カードの取得には Firebase の IDトークンが必要で、Firestore 認証はアプリと同じ設定を使います。
+
+例:
+    python run_sync_api.py
+    python run_sync_api.py --host 0.0.0.0 --port 8765 --warm
+"""
+
+import argparse
+import sys
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="同期APIの起動")
+    parser.add_argument("--host", default="127.0.0.1", help="待ち受けアドレス")
+    parser.add_argument("--port", type=int, default=8765, help="待ち受けポート")
+    parser.add_argument("--warm", action="store_true", help="起動時に問題バンクのレスポンスを作成しておく")
+    args = parser.parse_args()
+
+    try:
+        from my_llm_app.sync_api import SyncAPIHandler, create_server
+
+        if args.warm:
+            version, count, _ = SyncAPIHandler.question_bank.body("gzip", gakushi=True)
+            SyncAPIHandler.question_bank.body("gzip", gakushi=False)
+            print(f"Question bank ready: version={version}, questions={count}")
+        server = create_server(args.host, args.port)
+    except Exception as e:
+        print(f"Sync API failed to start: {e}", file=sys.stderr)
+        return 1
+
+    print(f"Sync API listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+コンテナ起動時のウォームアップ（Streamlit の起動前に実行）
+
+デプロイ直後の最初のユーザーが、問題バンクの読み込み・派生データの計算・Firebase の初期化・
+pandas / plotly の初回インポートを待たないよう、プロセスをまたいで残る準備を済ませます。
+
+1. アプリのバイトコードを作成（__pycache__）
+2. 重いモジュール（pandas / plotly など）をインポートしてディスクキャッシュに載せる
+3. マスターデータのシャード・マニフェストを作成（変更のあったファイルのみ）
+4. 共有キャッシュ（shared_cache）に問題データ・派生データ・問題数を保存
+5. カードキャッシュ（SQLite）を作成し、古いユーザーの行を削除
+6. Firestore クライアントを初期化し、1件読んで接続を確認（--skip-firestore で省略）
+
+各ステップの処理時間を表示します。失敗したステップがあれば終了コード 1 を返しますが、
+起動スクリプトはその場合も Streamlit を起動します（ウォームアップなしで動作するため）。
+
+例:
+    python run_warmup.py
+    python run_warmup.py --skip-firestore
+"""
+
+import argparse
+import compileall
+import importlib
+import os
+import re
+import sys
+import time
+
+HEAVY_MODULES = ("numpy", "pandas", "plotly.express", "plotly.graph_objects")
+
+
+def _compile_app():
+    app_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "my_llm_app")
+    # archive/ は実行しない旧コード（構文エラーを含む）のため対象外
+    if not compileall.compile_dir(app_dir, quiet=1, rx=re.compile(r"[/\\]archive[/\\]"), workers=0):
+        raise RuntimeError("コンパイルできないファイルがあります")
+    return "my_llm_app"
+
+
+def _import_heavy_modules():
+    for name in HEAVY_MODULES:
+        importlib.import_module(name)
+    return ", ".join(HEAVY_MODULES)
+
+
+def _build_master_data():
+    from my_llm_app import master_data
+
+    manifest, _ = master_data.build()
+    return f"questions={manifest['question_count']}, rebuilt={len(manifest['rebuilt'])}, version={manifest['version']}"
+
+
+def _populate_shared_cache():
+    from my_llm_app import shared_cache
+    # インポート時に load_master_data / get_derived_data が実行される
+    from my_llm_app import utils
+    from my_llm_app.modules import search_page
+
+    search_page.calculate_total_questions()
+    stats = shared_cache.cache_stats()
+    hits = sum(s["hits"] for s in stats.values())
+    misses = sum(s["misses"] for s in stats.values())
+    return f"backend={shared_cache.SHARED_CACHE_BACKEND}, questions={len(utils.ALL_QUESTIONS)}, hits={hits}, misses={misses}"
+
+
+def _open_card_cache():
+    from my_llm_app import card_cache
+
+    if card_cache.get_card_cache() is None:
+        raise RuntimeError("カードキャッシュを作成できません")
+    return card_cache.CARD_CACHE_PATH
+
+
+def _connect_firestore():
+    from my_llm_app.firestore_db import get_firestore_manager
+
+    manager = get_firestore_manager()
+    if manager.db is None:
+        raise RuntimeError("Firestore クライアントを初期化できません")
+    manager.db.collection("users").select([]).limit(1).get(timeout=10)
+    return "connected"
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="コンテナ起動時のウォームアップ")
+    parser.add_argument("--skip-firestore", action="store_true", help="Firestore の初期化・接続確認を省略")
+    args = parser.parse_args()
+
+    steps = [
+        ("compile", _compile_app),
+        ("imports", _import_heavy_modules),
+        ("master_data", _build_master_data),
+        ("shared_cache", _populate_shared_cache),
+        ("card_cache", _open_card_cache),
+    ]
+    if not args.skip_firestore:
+        steps.append(("firestore", _connect_firestore))
+
+    start = time.perf_counter()
+    failed = 0
+    for name, step in steps:
+        step_start = time.perf_counter()
+        try:
+            detail = step()
+            print(f"[warmup] {name}: {time.perf_counter() - step_start:.2f}s ({detail})")
+        except Exception as e:
+            failed += 1
+            print(f"[warmup] {name}: failed after {time.perf_counter() - step_start:.2f}s: {e}", file=sys.stderr)
+
+    print(f"Warm-up completed: steps={len(steps)}, failed={failed}, elapsed={time.perf_counter() - start:.2f}s")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
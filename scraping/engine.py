@@ -0,0 +1,341 @@
+# scraping/engine.py
+"""
+並列・再開可能なスクレイピングエンジン
+
+- 取得: まず requests で静的HTMLを取得し、解答がマークアップに含まれていればそのまま使う。
+  含まれていない場合だけ、使い回すヘッドレスブラウザのプールで解答ボタンを開いて取得する
+- ページキャッシュ: HTMLは内容のSHA-256をファイル名として保存（内容アドレス方式）し、
+  URL → ハッシュの対応を索引に記録する。再解析はキャッシュから行い、再取得しない
+- マニフェスト: URLごとの処理結果を JSON Lines で追記し、中断後は未完了のURLだけ処理する
+- レート制限: ホストごとに最小リクエスト間隔を守る（ワーカー数に関係なく）
+
+    engine = ScrapeEngine(cache_dir="scraping/cache", workers=4)
+    questions = engine.run(urls, job="kuraburi")
+"""
+
+import datetime
+import gzip
+import hashlib
+import json
+import os
+import queue
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional
+from urllib.parse import urlparse
+
+try:
+    from scraping.scrape_dentalyouth import (
+        USER_AGENT, create_driver, extract_answers,
+        fetch_rendered_html, parse_questions
+    )
+except ImportError:  # pragma: no cover - fallback
+    from scrape_dentalyouth import (  # type: ignore
+        USER_AGENT, create_driver, extract_answers,
+        fetch_rendered_html, parse_questions
+    )
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache")
+
+# 同じホストへのリクエスト間隔（秒）
+DEFAULT_MIN_INTERVAL = 2.0
+MAX_RETRY = 3
+RETRY_BACKOFF = 3.0
+
+
+def _now_iso() -> str:
+    return datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+
+def _atomic_write(path: str, data: bytes):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+class PageCache:
+    """内容アドレス方式のHTMLキャッシュ（pages/<sha256>.html.gz と urls.json）"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.pages_dir = os.path.join(directory, "pages")
+        self.index_path = os.path.join(directory, "urls.json")
+        self._lock = threading.Lock()
+        self._urls: Dict[str, Dict] = {}
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, "r", encoding="utf-8") as f:
+                    self._urls = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"  ページキャッシュの索引を読み込めません（空として扱います）: {e}")
+
+    def _page_path(self, content_hash: str) -> str:
+        return os.path.join(self.pages_dir, content_hash[:2], f"{content_hash}.html.gz")
+
+    def get(self, url: str) -> Optional[str]:
+        """URLのキャッシュ済みHTML（なければNone）"""
+        entry = self._urls.get(url)
+        if not entry:
+            return None
+        try:
+            with gzip.open(self._page_path(entry["hash"]), "rt", encoding="utf-8") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def put(self, url: str, html: str, mode: str) -> str:
+        """HTMLを保存して内容ハッシュを返す（同じ内容は1回だけ保存）"""
+        data = html.encode("utf-8")
+        content_hash = hashlib.sha256(data).hexdigest()
+        path = self._page_path(content_hash)
+        if not os.path.exists(path):
+            _atomic_write(path, gzip.compress(data))
+        with self._lock:
+            self._urls[url] = {"hash": content_hash, "mode": mode, "fetched_at": _now_iso()}
+            _atomic_write(self.index_path, json.dumps(self._urls, ensure_ascii=False, indent=1).encode("utf-8"))
+        return content_hash
+
+    def content_hash(self, url: str) -> Optional[str]:
+        return self._urls.get(url, {}).get("hash")
+
+    def urls(self) -> List[str]:
+        return list(self._urls)
+
+
+class JobManifest:
+    """URLごとの処理結果（JSON Lines 追記。同じURLは最後の記録が有効）"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.entries: Dict[str, Dict] = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # 書き込み途中で止まった行
+                    self.entries[entry["url"]] = entry
+
+    def is_done(self, url: str) -> bool:
+        return self.entries.get(url, {}).get("status") == "done"
+
+    def record(self, url: str, status: str, **fields):
+        entry = {"url": url, "status": status, "at": _now_iso(), **fields}
+        with self._lock:
+            self.entries[url] = entry
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+class HostRateLimiter:
+    """ホストごとに min_interval 秒以上の間隔を空ける"""
+
+    def __init__(self, min_interval: float = DEFAULT_MIN_INTERVAL):
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._next_allowed: Dict[str, float] = {}
+
+    def wait(self, url: str):
+        host = urlparse(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_allowed.get(host, 0.0))
+            self._next_allowed[host] = slot + self.min_interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class BrowserPool:
+    """ヘッドレスブラウザを必要になった分だけ起動し、URL間で使い回す"""
+
+    def __init__(self, size: int, headless: bool = True, factory: Optional[Callable] = None):
+        self.size = size
+        self.headless = headless
+        self._factory = factory or (lambda: create_driver(headless=self.headless))
+        self._idle: "queue.Queue" = queue.Queue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._all: List = []
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            create = self._created < self.size
+            if create:
+                self._created += 1
+        if not create:
+            return self._idle.get()
+        # 起動に数秒かかるためロックの外で作成する
+        try:
+            driver = self._factory()
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+        with self._lock:
+            self._all.append(driver)
+        return driver
+
+    def release(self, driver, broken: bool = False):
+        if broken:
+            # 異常終了したブラウザは捨てて、次回必要なら作り直す
+            with self._lock:
+                self._created -= 1
+                if driver in self._all:
+                    self._all.remove(driver)
+            try:
+                driver.quit()
+            except Exception:
+                pass
+            return
+        self._idle.put(driver)
+
+    def close(self):
+        """全ブラウザを終了（プールは空に戻り、次の acquire で作り直す）"""
+        with self._lock:
+            drivers, self._all = self._all, []
+            self._idle = queue.Queue()
+            self._created = 0
+        for driver in drivers:
+            try:
+                driver.quit()
+            except Exception:
+                pass
+
+
+def has_static_answers(html: str) -> bool:
+    """静的HTMLに解答がすべて含まれているか（ボタンを開く必要がないか）"""
+    if "text-button" not in html:
+        return False
+    from bs4 import BeautifulSoup
+    answers = extract_answers(BeautifulSoup(html, "html.parser"))
+    return bool(answers) and all(answers)
+
+
+class ScrapeEngine:
+    """ページ取得（キャッシュ・レート制限・ブラウザプール）と解析をまとめて実行"""
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, workers: int = 4,
+                 min_interval: float = DEFAULT_MIN_INTERVAL, headless: bool = True,
+                 static_first: bool = True):
+        self.cache = PageCache(cache_dir)
+        self.cache_dir = cache_dir
+        self.workers = max(1, workers)
+        self.rate_limiter = HostRateLimiter(min_interval)
+        self.browsers = BrowserPool(self.workers, headless=headless)
+        self.static_first = static_first
+        self._session = None
+
+    def _http(self):
+        if self._session is None:
+            import requests
+            self._session = requests.Session()
+            self._session.headers["User-Agent"] = USER_AGENT
+        return self._session
+
+    def fetch(self, url: str, refresh: bool = False) -> str:
+        """HTMLを取得（キャッシュがあれば再取得しない）"""
+        if not refresh:
+            html = self.cache.get(url)
+            if html is not None:
+                return html
+
+        if self.static_first:
+            self.rate_limiter.wait(url)
+            try:
+                response = self._http().get(url, timeout=30)
+                response.raise_for_status()
+                response.encoding = response.apparent_encoding or response.encoding
+                if has_static_answers(response.text):
+                    self.cache.put(url, response.text, "static")
+                    return response.text
+            except Exception as e:
+                print(f"  静的取得に失敗したためブラウザで取得します: {url}: {e}")
+
+        self.rate_limiter.wait(url)
+        driver = self.browsers.acquire()
+        broken = False
+        try:
+            html = fetch_rendered_html(url, driver=driver)
+        except Exception:
+            broken = True
+            raise
+        finally:
+            self.browsers.release(driver, broken=broken)
+        self.cache.put(url, html, "browser")
+        return html
+
+    def _process(self, url: str, manifest: JobManifest, refresh: bool) -> List[dict]:
+        last_error = None
+        for attempt in range(1, MAX_RETRY + 1):
+            try:
+                html = self.fetch(url, refresh=refresh and attempt == 1)
+                questions = parse_questions(html, url)
+                for q in questions:
+                    q["source_url"] = url
+                manifest.record(url, "done", questions=len(questions), attempts=attempt,
+                                hash=self.cache.content_hash(url))
+                return questions
+            except Exception as e:
+                last_error = e
+                print(f"  エラー発生 (試行{attempt}/{MAX_RETRY}): {url}: {e}")
+                if attempt < MAX_RETRY:
+                    time.sleep(RETRY_BACKOFF * attempt)
+        manifest.record(url, "failed", error=str(last_error), attempts=MAX_RETRY)
+        return []
+
+    def run(self, urls: List[str], job: str, refresh: bool = False) -> List[dict]:
+        """
+        URLを並列に処理し、URLの順に問題をまとめて返す
+
+        完了済みのURL（マニフェストに done）は取得せず、キャッシュから再解析する
+        """
+        manifest = JobManifest(os.path.join(self.cache_dir, "jobs", f"{job}.jsonl"))
+        results: Dict[str, List[dict]] = {}
+        pending = []
+        for url in dict.fromkeys(urls):
+            html = None if refresh or not manifest.is_done(url) else self.cache.get(url)
+            if html is not None:
+                questions = parse_questions(html, url)
+                for q in questions:
+                    q["source_url"] = url
+                results[url] = questions
+            else:
+                pending.append(url)
+
+        print(f"  {job}: 全{len(results) + len(pending)}件（完了済み {len(results)}件, 取得 {len(pending)}件）")
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                futures = {executor.submit(self._process, url, manifest, refresh): url for url in pending}
+                for future in as_completed(futures):
+                    results[futures[future]] = future.result()
+        finally:
+            self.browsers.close()
+
+        failed = [url for url in pending if manifest.entries.get(url, {}).get("status") == "failed"]
+        if failed:
+            print(f"  失敗 {len(failed)}件（再実行すると失敗分のみ処理します）")
+        return [q for url in dict.fromkeys(urls) for q in results.get(url, [])]
+
+    def reparse(self, urls: Optional[List[str]] = None) -> List[dict]:
+        """キャッシュ済みHTMLだけを再解析（ネットワークには接続しない）"""
+        questions = []
+        for url in urls if urls is not None else self.cache.urls():
+            html = self.cache.get(url)
+            if html is None:
+                continue
+            for q in parse_questions(html, url):
+                q["source_url"] = url
+                questions.append(q)
+        return questions
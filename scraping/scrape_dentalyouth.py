@@ -5,17 +5,10 @@ import time
 import os
 import json
 import sys
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
 from bs4 import BeautifulSoup
 from urllib.parse import urljoin
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-from scraping.kyousei_urls import kyousei_urls
-from scraping.shouni_urls import shouni_urls
-from scraping.targets import kuraburi_urls
 
 # 「回数は2～3桁の数字」「領域はA～D」「あとは連番」をキャッチする正規表現
 HEADER_PAT = re.compile(r"^(\d{2,3}[A-D]\d+)\s*(.*)", re.DOTALL)
@@ -23,6 +16,17 @@ HEADER_PAT = re.compile(r"^(\d{2,3}[A-D]\d+)\s*(.*)", re.DOTALL)
 # 選択肢行をキャッチするパターン（ａ～ｅ／A～E + 任意の区切り記号）
 CHOICE_PAT = re.compile(r"^[ａ-ｅa-eＡ-ＥA-E][\s　\.\)．、,]*(.+)")
 
+# 解答ボタン（クリック前は「解答：表示」、クリック後は「解答：A」など）
+ANSWER_BUTTON_SELECTOR = "div[id^='text-button']"
+ANSWER_HIDDEN_TEXT = "解答：表示"
+ANSWER_PAT = re.compile(r"解答[:：]?\s*(.*)")
+
+USER_AGENT = (
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) "
+    "AppleWebKit/537.36 (KHTML, like Gecko) "
+    "Chrome/114.0.0.0 Safari/537.36"
+)
+
 def to_fullsize_url(url):
     # サムネイル除去
     url = re.sub(r'(-\d+x\d+)(\.\w+)$', r'\2', url)
@@ -32,6 +36,61 @@ def to_fullsize_url(url):
     url = re.sub(r'\.png\?.*$', '.png', url, flags=re.IGNORECASE)
     return url
 
+def create_driver(headless: bool = True):
+    """Chrome WebDriver を作成（エンジンのワーカーは1つを複数URLで使い回す）"""
+    from selenium import webdriver
+    options = webdriver.ChromeOptions()
+    if headless:
+        options.add_argument('--headless=new')
+    options.add_argument(f"user-agent={USER_AGENT}")
+    return webdriver.Chrome(options=options)
+
+def fetch_rendered_html(url: str, driver=None) -> str:
+    """Selenium で全ての「解答」ボタンを開いた状態のHTMLを取得"""
+    # 保存済みHTMLの解析だけならSeleniumは不要なので、ここで読み込む
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+
+    own_driver = driver is None
+    if own_driver:
+        driver = create_driver()
+    try:
+        driver.get(url)
+        WebDriverWait(driver, 10).until(
+            EC.presence_of_element_located((By.CSS_SELECTOR, ANSWER_BUTTON_SELECTOR))
+        )
+        # ボタンごとに待たず、まとめてクリックしてから全ボタンの表示切替を1回だけ待つ
+        driver.execute_script(
+            "document.querySelectorAll(arguments[0]).forEach(function (b) { b.click(); });",
+            ANSWER_BUTTON_SELECTOR
+        )
+        try:
+            WebDriverWait(driver, 10).until(
+                lambda d: all(
+                    b.text.strip() != ANSWER_HIDDEN_TEXT
+                    for b in d.find_elements(By.CSS_SELECTOR, ANSWER_BUTTON_SELECTOR)
+                )
+            )
+        except Exception:
+            pass  # 開かなかったボタンの解答は空文字になる
+        return driver.page_source
+    finally:
+        if own_driver:
+            driver.quit()
+
+def extract_answers(soup) -> list[str]:
+    """解答ボタンのテキストから解答を取り出す（未表示のボタンは空文字）"""
+    answers = []
+    for btn in soup.select(ANSWER_BUTTON_SELECTOR):
+        text = btn.get_text(strip=True)
+        if not text or text == ANSWER_HIDDEN_TEXT:
+            answers.append("")
+            continue
+        m = ANSWER_PAT.search(text)
+        answers.append(m.group(1).strip() if m else text)
+    return answers
+
 def scrape_questions_from(url: str) -> list[dict]:
     """
     指定 URL の dentalyouth.blog 記事から
@@ -44,43 +103,14 @@ def scrape_questions_from(url: str) -> list[dict]:
         "answer": "A"
     } の形式。
     """
+    return parse_questions(fetch_rendered_html(url), url)
 
-    # --- 1. Selenium で「解答」ボタンをクリックして全文取得 ---
-    # (このセクションは変更なし)
-    options = webdriver.ChromeOptions()
-    # options.add_argument('--headless')
-    options.add_argument(
-        "user-agent=Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) "
-        "AppleWebKit/537.36 (KHTML, like Gecko) "
-        "Chrome/114.0.0.0 Safari/537.36"
-    )
-    driver = webdriver.Chrome(options=options)
-    try:
-        driver.get(url)
-        WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, "div[id^='text-button']"))
-        )
-        buttons = driver.find_elements(By.CSS_SELECTOR, "div[id^='text-button']")
-        answers = []
-        for btn in buttons:
-            try:
-                WebDriverWait(driver, 10).until(EC.element_to_be_clickable(btn))
-                btn.click()
-                WebDriverWait(driver, 5).until(
-                    lambda d: btn.text.strip() != "解答：表示"
-                )
-                text = btn.text.strip()
-                m = re.search(r"解答[:：]?\s*(.*)", text)
-                answers.append(m.group(1).strip() if m else text)
-            except Exception:
-                answers.append("")
-        html = driver.page_source
-    finally:
-        driver.quit()
-
-    # --- 2. BeautifulSoup で問題文と選択肢をパース ---
-    # (このセクションは変更なし)
+def parse_questions(html: str, url: str) -> list[dict]:
+    """取得済みのHTMLから問題リストを作成（ネットワーク不要。キャッシュしたHTMLの再解析に使う）"""
     soup = BeautifulSoup(html, "html.parser")
+    answers = extract_answers(soup)
+
+    # --- BeautifulSoup で問題文と選択肢をパース ---
     content = (
         soup.select_one(".entry-content")
         or soup.select_one(".post-content")
@@ -207,6 +237,7 @@ def save_questions_to_json(questions, filename):
     print(f"保存しました: {file_path}")
 
 def scrape_and_save_shouni():
+    from scraping.shouni_urls import shouni_urls
     MAX_RETRY = 3
     all_questions = []
     for url in shouni_urls:
@@ -226,6 +257,7 @@ def scrape_and_save_shouni():
     save_questions_to_json(all_questions, "dental_shouni.json")
 
 def scrape_and_save_kuraburi():
+    from scraping.targets import kuraburi_urls
     MAX_RETRY = 3
     all_questions = []
     for url in kuraburi_urls:
@@ -1,8 +1,7 @@
 import os
 import pandas as pd
-import unicodedata
-from sentence_transformers import SentenceTransformer, util
-import torch
+
+from embedding_service import EmbeddingService, top_k_cosine
 
 print("--- スクリプトを開始します ---")
 
@@ -24,11 +23,11 @@ except FileNotFoundError as e:
     print(f"❌エラー: ファイルが見つかりません。 {e}")
     exit()
 
-# --- 3. AIモデルの読み込み ---
-print("--- AI言語モデルを読み込み中（初回はダウンロードに時間がかかります） ---")
+# --- 3. 埋め込みサービスの準備 ---
 # 日本語に強く、意味の類似度検索に適したモデルを選択
-model = SentenceTransformer('cl-tohoku/bert-base-japanese-whole-word-masking')
-print("✅ AIモデルの読み込み完了。")
+# 計算済みのベクトルはキャッシュから読み込み、モデルは未計算のテキストがあるときだけ読み込む
+embedding_service = EmbeddingService('cl-tohoku/bert-base-japanese-whole-word-masking')
+print(f"✅ 埋め込みキャッシュ: {len(embedding_service.store)}件")
 
 # --- 4. 基準項目の「意味ベクトル」を作成 ---
 print("--- 基準項目の文脈を意味ベクトルに変換中 ---")
@@ -40,22 +39,20 @@ guidelines_df['context_text'] = guidelines_df.apply(
     ])).replace('nan', ''), # nan（欠損値）を空文字に置換
     axis=1
 )
-# 全ての文脈テキストを一度にベクトル化（高速）
-guideline_embeddings = model.encode(guidelines_df['context_text'].tolist(), convert_to_tensor=True)
-print("✅ 意味ベクトルの作成完了。")
+# 全ての文脈テキストをバッチでベクトル化（キャッシュ済みのものは再計算しない）
+guideline_embeddings = embedding_service.encode(guidelines_df['context_text'].tolist())
+keyword_embeddings = embedding_service.encode(expert_keywords)
+print(f"✅ 意味ベクトルの作成完了。（新規計算 {embedding_service.encoded_count}件）")
+
+# 全ての専門用語と全ての基準項目の類似度（コサイン類似度）を1回の行列積で計算し、
+# 最も類似度が高い項目のインデックスを取得
+best_match_indices, _ = top_k_cosine(keyword_embeddings, guideline_embeddings, k=1)
 
 # --- 5. 専門用語の分類とキーワード追加 ---
 print("--- 専門用語の分類を開始します ---")
 classified_count = 0
-for keyword in expert_keywords:
-    # 専門用語をベクトル化
-    keyword_embedding = model.encode(keyword, convert_to_tensor=True)
-    
-    # 全ての基準項目との類似度（コサイン類似度）を計算
-    cosine_scores = util.cos_sim(keyword_embedding, guideline_embeddings)
-    
-    # 最も類似度が高い項目のIDを取得
-    best_match_index = torch.argmax(cosine_scores).item()
+for keyword, best_match in zip(expert_keywords, best_match_indices):
+    best_match_index = guidelines_df.index[int(best_match[0])]
     
     # 該当する基準項目の既存キーワードを取得
     existing_keywords_str = guidelines_df.loc[best_match_index, 'keywords']
@@ -1,7 +1,10 @@
-import pandas as pd
+import csv
 import json
 import os
 import random
+from itertools import combinations
+
+import pandas as pd
 
 print("--- ファインチューニング用データセットの作成を開始します ---")
 
@@ -12,6 +15,63 @@ QUESTIONS_PATH = os.path.join(BASE_DIR, '..', 'my_llm_app', 'data', 'master_ques
 MAPPING_PATH = os.path.join(BASE_DIR, '..', 'my_llm_app', 'data', 'mapping_result_v2.json') # 最新のマッピング結果
 OUTPUT_PATH = os.path.join(BASE_DIR, '..', 'my_llm_app', 'data', 'finetune_dataset.csv')
 
+# --- 生成パラメータ ---
+# 1つのガイドラインから作るペア数の上限（問題数が多くても O(n²) にしない）
+MAX_PAIRS_PER_GUIDELINE = int(os.environ.get('FINETUNE_MAX_PAIRS_PER_GUIDELINE', '200'))
+# ハードネガティブを探す近隣ガイドライン（同じ章・大項目の前後 N 件）
+NEIGHBOR_WINDOW = 5
+RANDOM_SEED = 42
+
+
+# --- 関数定義 ---
+def question_full_text(question):
+    """問題文＋選択肢"""
+    return str(question.get('question', '')) + ' ' + ' '.join(map(str, question.get('choices', []) or []))
+
+
+def sample_pairs(count, cap, rng):
+    """0..count-1 の組み合わせから最大 cap 個の (i, j) を重複なく返す"""
+    total = count * (count - 1) // 2
+    if total <= cap:
+        yield from combinations(range(count), 2)
+        return
+    seen = set()
+    while len(seen) < cap:
+        i, j = sorted(rng.sample(range(count), 2))
+        if (i, j) not in seen:
+            seen.add((i, j))
+            yield i, j
+
+
+def build_neighbor_guidelines(guidelines, guideline_ids):
+    """ガイドラインごとの近隣ガイドライン（同じ章・大項目で表の並びが近いもの）"""
+    neighbors = {}
+    group_columns = [c for c in ('chapter', 'daikoumoku') if c in guidelines.columns]
+    groups = guidelines.groupby(group_columns, sort=False).groups if group_columns else {None: guidelines.index}
+    for rows in groups.values():
+        members = [int(r) for r in rows if int(r) in guideline_ids]
+        for pos, g_id in enumerate(members):
+            window = members[max(0, pos - NEIGHBOR_WINDOW):pos] + members[pos + 1:pos + 1 + NEIGHBOR_WINDOW]
+            neighbors[g_id] = window
+    return neighbors
+
+
+def iter_training_rows(guideline_to_questions, question_texts, neighbors, rng):
+    """(anchor, positive, negative) を1行ずつ生成（メモリに全ペアを持たない）"""
+    all_guidelines = list(guideline_to_questions)
+    for g_id, q_nums in guideline_to_questions.items():
+        if len(q_nums) < 2:
+            continue
+        candidates = neighbors.get(g_id) or [g for g in all_guidelines if g != g_id]
+        for i, j in sample_pairs(len(q_nums), MAX_PAIRS_PER_GUIDELINE, rng):
+            # ハードネガティブ: 近隣ガイドラインの問題（なければ他のガイドラインから）
+            negative = ''
+            if candidates:
+                negative_q = rng.choice(guideline_to_questions[rng.choice(candidates)])
+                negative = question_texts[negative_q]
+            yield question_texts[q_nums[i]], question_texts[q_nums[j]], negative
+
+
 # --- データの読み込み ---
 guidelines_df = pd.read_csv(GUIDELINES_PATH)
 with open(QUESTIONS_PATH, 'r', encoding='utf-8') as f:
@@ -19,36 +79,35 @@ with open(QUESTIONS_PATH, 'r', encoding='utf-8') as f:
 with open(MAPPING_PATH, 'r', encoding='utf-8') as f:
     mapping_data = json.load(f)
 
-questions_df = pd.DataFrame(q_data.get('questions', []))
-questions_df['full_text'] = questions_df.apply(
-    lambda row: str(row.get('question', '')) + ' ' + ' '.join(map(str, row.get('choices', []) or [])),
-    axis=1
-)
+# 問題番号 → 問題テキスト の辞書（検索ごとにDataFrameを走査しない）
+question_texts = {
+    q['number']: question_full_text(q) for q in q_data.get('questions', []) if q.get('number')
+}
+del q_data
 
 # --- 学習ペアの作成 ---
-# ガイドラインIDをキーとし、問題テキストのリストを値とする辞書を作成
+# ガイドラインIDをキーとし、問題番号のリストを値とする辞書を作成
 guideline_to_questions = {}
 for q_num, g_id in mapping_data.items():
-    if g_id != -1:
-        if g_id not in guideline_to_questions:
-            guideline_to_questions[g_id] = []
-        # 問題番号から問題テキストを検索
-        question_text = questions_df[questions_df['number'] == q_num]['full_text'].iloc[0]
-        guideline_to_questions[g_id].append(question_text)
-
-# 学習ペア（anchor, positive）を作成
-training_pairs = []
-for g_id, texts in guideline_to_questions.items():
-    if len(texts) > 1:
-        # 同じグループ内のテキスト同士でペアを作成
-        for i in range(len(texts)):
-            for j in range(i + 1, len(texts)):
-                training_pairs.append({'anchor': texts[i], 'positive': texts[j]})
-
-if not training_pairs:
+    if g_id != -1 and q_num in question_texts:
+        guideline_to_questions.setdefault(int(g_id), []).append(q_num)
+
+rng = random.Random(RANDOM_SEED)
+neighbors = build_neighbor_guidelines(guidelines_df, set(guideline_to_questions))
+
+# 1行ずつCSVに書き出す
+pair_count = 0
+tmp_path = OUTPUT_PATH + '.tmp'
+with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+    writer = csv.writer(f)
+    writer.writerow(['anchor', 'positive', 'negative'])
+    for row in iter_training_rows(guideline_to_questions, question_texts, neighbors, rng):
+        writer.writerow(row)
+        pair_count += 1
+
+if not pair_count:
+    os.remove(tmp_path)
     print("❌ マッピング結果から学習ペアを作成できませんでした。マッピングデータを確認してください。")
 else:
-    # DataFrameに変換して保存
-    finetune_df = pd.DataFrame(training_pairs)
-    finetune_df.to_csv(OUTPUT_PATH, index=False)
-    print(f"✅ {len(finetune_df)}ペアの学習データを作成し、'{OUTPUT_PATH}'に保存しました。")
\ No newline at end of file
+    os.replace(tmp_path, OUTPUT_PATH)
+    print(f"✅ {pair_count}ペアの学習データを作成し、'{OUTPUT_PATH}'に保存しました。")
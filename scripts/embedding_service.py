@@ -0,0 +1,199 @@
+"""
+埋め込みベクトルの計算・キャッシュ
+
+- テキストをまとめてバッチでベクトル化（CPU向けに batch_size を指定可能）
+- 計算済みのベクトルはテキストのハッシュをキーに、float16 のメモリマップ行列として保存し、
+  次回以降は未計算のテキストだけをベクトル化する（モデルも必要になるまで読み込まない）
+- 全クエリと全候補のコサイン類似度を1回の行列積で計算し、上位k件を返す
+
+    service = EmbeddingService('cl-tohoku/bert-base-japanese-whole-word-masking')
+    keyword_vecs = service.encode(keywords)
+    guideline_vecs = service.encode(context_texts)
+    indices, scores = top_k_cosine(keyword_vecs, guideline_vecs, k=1)
+
+保存形式（cache_dir/<モデル名>/）:
+- embeddings.f16: 行 = テキスト、列 = 次元 の float16 行列（L2正規化済み）
+- index.json: {"dim": 次元数, "rows": {テキストのSHA-1: 行番号}}
+"""
+
+import hashlib
+import json
+import os
+import re
+import tempfile
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CACHE_DIR = os.path.join(BASE_DIR, '..', 'my_llm_app', 'cache', 'embeddings')
+
+# 1回の model.encode に渡すテキスト数
+DEFAULT_BATCH_SIZE = int(os.environ.get('EMBEDDING_BATCH_SIZE', '64'))
+DEFAULT_DEVICE = os.environ.get('EMBEDDING_DEVICE', 'cpu')
+
+
+def text_key(text: str) -> str:
+    """キャッシュのキー（テキストのSHA-1）"""
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """各行をL2正規化（ゼロベクトルはそのまま）"""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class EmbeddingStore:
+    """テキストハッシュ → 埋め込みベクトルの永続キャッシュ（float16 メモリマップ）"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.data_path = os.path.join(directory, 'embeddings.f16')
+        self.index_path = os.path.join(directory, 'index.json')
+        self.dim: Optional[int] = None
+        self.rows: Dict[str, int] = {}
+        self._matrix: Optional[np.memmap] = None
+        self._load_index()
+
+    def _load_index(self):
+        if not os.path.exists(self.index_path):
+            return
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            dim, rows = index.get('dim'), index.get('rows', {})
+            # 行列ファイルが途中までしか書かれていない場合は不整合として破棄
+            expected = len(rows) * dim * 2 if dim else 0
+            if dim and os.path.exists(self.data_path) and os.path.getsize(self.data_path) >= expected:
+                self.dim, self.rows = dim, rows
+        except (OSError, ValueError) as e:
+            print(f"⚠️ 埋め込みキャッシュの読み込みに失敗しました（再計算します）: {e}")
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.rows
+
+    def _matrix_view(self) -> np.memmap:
+        if self._matrix is None or self._matrix.shape[0] != len(self.rows):
+            self._matrix = np.memmap(self.data_path, dtype=np.float16, mode='r',
+                                     shape=(len(self.rows), self.dim))
+        return self._matrix
+
+    def get(self, keys: Sequence[str]) -> np.ndarray:
+        """キーの順に float32 の行列で返す（すべて保存済みであること）"""
+        if not keys:
+            return np.zeros((0, self.dim or 0), dtype=np.float32)
+        matrix = self._matrix_view()
+        return np.asarray(matrix[[self.rows[key] for key in keys]], dtype=np.float32)
+
+    def add(self, keys: Sequence[str], vectors: np.ndarray):
+        """新しいベクトルを行列ファイルの末尾に追記し、索引を更新"""
+        if not keys:
+            return
+        vectors = np.asarray(vectors, dtype=np.float16)
+        if self.dim is None:
+            if self.rows:
+                raise ValueError("埋め込みキャッシュの次元数が不明です")
+            self.dim = int(vectors.shape[1])
+            # 索引が失われた場合は行列ファイルも作り直す
+            if os.path.exists(self.data_path):
+                os.remove(self.data_path)
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"次元数が一致しません: {vectors.shape[1]} != {self.dim}")
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._matrix = None
+        mode = 'r+b' if os.path.exists(self.data_path) else 'wb'
+        with open(self.data_path, mode) as f:
+            # 前回途中で止まった追記分は切り捨てる
+            f.seek(len(self.rows) * self.dim * 2)
+            f.truncate()
+            f.write(np.ascontiguousarray(vectors).tobytes())
+        for key in keys:
+            self.rows[key] = len(self.rows)
+        self._save_index()
+
+    def _save_index(self):
+        # 行列の追記が終わってから索引を置き換える（途中で止まっても行列の方が長いだけ）
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({'dim': self.dim, 'rows': self.rows}, f)
+        os.replace(tmp_path, self.index_path)
+
+
+class EmbeddingService:
+    """キャッシュ付きのバッチ埋め込み計算"""
+
+    def __init__(self, model_name: str, cache_dir: str = DEFAULT_CACHE_DIR,
+                 batch_size: int = DEFAULT_BATCH_SIZE, device: str = DEFAULT_DEVICE,
+                 model_factory: Optional[Callable[[], object]] = None):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.device = device
+        self.store = EmbeddingStore(os.path.join(cache_dir, re.sub(r'[^\w.-]+', '_', model_name)))
+        self._model_factory = model_factory
+        self._model = None
+        self.encoded_count = 0
+
+    @property
+    def model(self):
+        """モデルは未計算のテキストがあるときだけ読み込む"""
+        if self._model is None:
+            if self._model_factory is not None:
+                self._model = self._model_factory()
+            else:
+                from sentence_transformers import SentenceTransformer
+                print(f"--- モデル '{self.model_name}' を読み込み中 ---")
+                self._model = SentenceTransformer(self.model_name, device=self.device)
+        return self._model
+
+    def encode(self, texts: Sequence[str]) -> np.ndarray:
+        """テキストの埋め込み（L2正規化済み float32、入力と同じ順）"""
+        keys = [text_key(text) for text in texts]
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in self.store and key not in missing:
+                missing[key] = text
+
+        if missing:
+            print(f"--- {len(missing)}件のテキストをベクトル化中（キャッシュ済み {len(texts) - len(missing)}件） ---")
+            missing_keys = list(missing)
+            for start in range(0, len(missing_keys), self.batch_size):
+                batch_keys = missing_keys[start:start + self.batch_size]
+                vectors = self.model.encode(
+                    [missing[key] for key in batch_keys],
+                    batch_size=self.batch_size,
+                    convert_to_numpy=True,
+                    show_progress_bar=False,
+                )
+                self.store.add(batch_keys, normalize_rows(vectors))
+                self.encoded_count += len(batch_keys)
+
+        return self.store.get(keys)
+
+
+def top_k_cosine(queries: np.ndarray, candidates: np.ndarray, k: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    正規化済みベクトル同士のコサイン類似度の上位k件
+
+    戻り値: (候補のインデックス, 類似度)。どちらも shape = (クエリ数, k) で類似度の高い順
+    """
+    if len(queries) == 0 or len(candidates) == 0:
+        empty = np.zeros((len(queries), 0))
+        return empty.astype(np.int64), empty.astype(np.float32)
+    scores = queries @ candidates.T
+    k = min(k, scores.shape[1])
+    if k < scores.shape[1]:
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        top = np.tile(np.arange(scores.shape[1]), (scores.shape[0], 1))
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    # 同点は候補のインデックス順（torch.argmax と同じく先頭を優先）
+    order = np.lexsort((top, -top_scores), axis=1)
+    return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
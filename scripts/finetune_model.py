@@ -1,7 +1,19 @@
+import hashlib
+import os
+
 import pandas as pd
-from sentence_transformers import SentenceTransformer, InputExample, losses
+import sentence_transformers
+import torch
+from sentence_transformers import SentenceTransformer, losses
 from torch.utils.data import DataLoader
-import os
+
+# 3.x の fit() は独自の collate を設定し、各要素の example.texts を読むため
+# トークン化済みキャッシュ（make_collate）が使えない（scripts/requirements.txt で固定）
+if int(sentence_transformers.__version__.split('.')[0]) >= 3:
+    raise SystemExit(
+        f"sentence-transformers {sentence_transformers.__version__} は未対応です。"
+        "pip install -r scripts/requirements.txt で 3.x 未満をインストールしてください。"
+    )
 
 print("--- AIモデルのファインチューニングを開始します ---")
 
@@ -10,22 +22,92 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DATASET_PATH = os.path.join(BASE_DIR, '..', 'my_llm_app', 'data', 'finetune_dataset.csv')
 BASE_MODEL = 'cl-tohoku/bert-base-japanese-whole-word-masking'
 OUTPUT_MODEL_PATH = os.path.join(BASE_DIR, '..', 'models', 'dental-bert-v1') # モデルの保存先
+# トークン化済みデータのキャッシュ（データセット・モデル・最大長が同じなら再利用）
+TOKEN_CACHE_DIR = os.path.join(BASE_DIR, '..', 'my_llm_app', 'cache', 'finetune_tokens')
 
 # 学習パラメータ
 EPOCHS = 1
 BATCH_SIZE = 16
 
-# --- データの読み込みと準備 ---
-print(f"--- 学習データ '{DATASET_PATH}' を読み込み中 ---")
-df = pd.read_csv(DATASET_PATH)
-train_examples = []
-for index, row in df.iterrows():
-    train_examples.append(InputExample(texts=[row['anchor'], row['positive']]))
+
+# --- 関数定義 ---
+def token_cache_path(dataset_path, model_name, max_seq_length):
+    """データセットの内容・モデル・最大長から決まるキャッシュファイルのパス"""
+    digest = hashlib.sha1()
+    with open(dataset_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    digest.update(f"\0{model_name}\0{max_seq_length}".encode('utf-8'))
+    return os.path.join(TOKEN_CACHE_DIR, f"{digest.hexdigest()}.pt")
+
+
+def build_token_cache(dataset_path, model):
+    """
+    データセットの各テキストを1回だけトークン化して保存
+    - texts: 重複を除いたテキストごとのトークン列（パディングなし）
+    - rows: 学習例ごとのテキスト番号（anchor, positive[, negative]）
+    """
+    df = pd.read_csv(dataset_path, keep_default_na=False)
+    columns = [c for c in ('anchor', 'positive', 'negative') if c in df.columns]
+    # negative 列が空の行がある場合は (anchor, positive) のみで学習
+    if 'negative' in columns and (df['negative'] == '').any():
+        columns.remove('negative')
+
+    text_ids = {}
+    rows = []
+    for values in zip(*(df[c] for c in columns)):
+        rows.append(tuple(text_ids.setdefault(str(v), len(text_ids)) for v in values))
+
+    texts = list(text_ids)
+    encoded = []
+    for start in range(0, len(texts), 1024):
+        batch = model.tokenizer(texts[start:start + 1024], truncation='longest_first',
+                                max_length=model.max_seq_length)
+        keys = list(batch.keys())
+        encoded.extend({key: batch[key][i] for key in keys} for i in range(len(batch['input_ids'])))
+    return {'columns': columns, 'texts': encoded, 'rows': rows}
+
+
+def load_token_cache(dataset_path, model):
+    """キャッシュがあれば読み込み、なければ作成して保存"""
+    path = token_cache_path(dataset_path, BASE_MODEL, model.max_seq_length)
+    if os.path.exists(path):
+        print(f"--- トークン化済みデータ '{path}' を読み込み中 ---")
+        return torch.load(path)
+    print("--- 学習データをトークン化中（次回からはキャッシュを使用） ---")
+    cache = build_token_cache(dataset_path, model)
+    os.makedirs(TOKEN_CACHE_DIR, exist_ok=True)
+    torch.save(cache, path + '.tmp')
+    os.replace(path + '.tmp', path)
+    return cache
+
+
+def make_collate(model, token_texts):
+    """トークン化済みの列をパディングするだけの collate（model.smart_batching_collate の代わり）"""
+    def collate(batch):
+        sentence_features = [
+            model.tokenizer.pad([token_texts[i] for i in column], return_tensors='pt')
+            for column in zip(*batch)
+        ]
+        labels = torch.zeros(len(batch), dtype=torch.long)
+        return sentence_features, labels
+    return collate
+
 
 # --- モデルの読み込みと学習設定 ---
 print(f"--- ベースモデル '{BASE_MODEL}' を読み込み中 ---")
 model = SentenceTransformer(BASE_MODEL)
-train_dataloader = DataLoader(train_examples, shuffle=True, batch_size=BATCH_SIZE)
+
+# --- データの読み込みと準備 ---
+print(f"--- 学習データ '{DATASET_PATH}' を読み込み中 ---")
+token_cache = load_token_cache(DATASET_PATH, model)
+print(f"✅ 学習例 {len(token_cache['rows'])}件（テキスト {len(token_cache['texts'])}種類, 列: {token_cache['columns']}）")
+
+# model.fit は DataLoader の collate_fn を model.smart_batching_collate で上書きするため、
+# インスタンス側を差し替えて再トークン化を省く
+model.smart_batching_collate = make_collate(model, token_cache['texts'])
+train_dataloader = DataLoader(token_cache['rows'], shuffle=True, batch_size=BATCH_SIZE)
+# (anchor, positive, negative) の場合はハードネガティブも損失に使われる
 train_loss = losses.MultipleNegativesRankingLoss(model=model)
 
 # --- 学習の実行 ---
@@ -36,4 +118,4 @@ model.fit(train_objectives=[(train_dataloader, train_loss)],
           output_path=OUTPUT_MODEL_PATH,
           show_progress_bar=True)
 
-print(f"🎉 ファインチューニング完了！ 賢くなったモデルを'{OUTPUT_MODEL_PATH}'に保存しました。")
\ No newline at end of file
+print(f"🎉 ファインチューニング完了！ 賢くなったモデルを'{OUTPUT_MODEL_PATH}'に保存しました。")
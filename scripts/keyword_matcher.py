@@ -0,0 +1,129 @@
+"""
+キーワード照合エンジン（Aho-Corasick法）
+
+ガイドラインごとのキーワードを1つのオートマトンにまとめ、
+問題文を1回走査するだけで全ガイドラインのヒット数を求める。
+
+    matcher = KeywordMatcher(normalize=normalize_text)
+    for guideline_id, keywords in ...:
+        matcher.add_group(guideline_id, keywords)
+    matcher.build()
+    matcher.count_hits(text)   # {guideline_id: ヒットしたキーワード数}
+    matcher.best_group(text)   # 最もヒット数の多いガイドライン（なければ -1）
+
+ヒット数は従来の `sum(1 for kw in keywords if kw and normalize(kw) in text)` と同じ
+（同じキーワードは本文中に何回出現しても1回、キーワード一覧の重複はその分加算）。
+"""
+
+from collections import deque
+from functools import lru_cache
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Set
+
+
+class KeywordMatcher:
+    """複数グループのキーワードを一括照合するAho-Corasickオートマトン"""
+
+    def __init__(self, normalize: Optional[Callable[[str], str]] = None):
+        self.normalize = normalize or (lambda text: text)
+        self._pattern_ids: Dict[str, int] = {}
+        # パターンID → そのキーワードを含むグループ（キーワード一覧の重複分も並べる）
+        self._pattern_groups: List[List[Hashable]] = []
+        self._group_order: Dict[Hashable, int] = {}
+        # 空文字列に正規化されたキーワード（どの本文にも含まれる扱い）
+        self._always_hit: List[Hashable] = []
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._outputs: List[List[int]] = [[]]
+        self._built = False
+
+    def add_group(self, group: Hashable, keywords: Iterable[str]):
+        """グループ（ガイドラインなど）とそのキーワードを登録"""
+        self._group_order.setdefault(group, len(self._group_order))
+        for keyword in keywords:
+            if not keyword:
+                continue
+            pattern = self.normalize(keyword)
+            if not pattern:
+                self._always_hit.append(group)
+                continue
+            pattern_id = self._pattern_ids.get(pattern)
+            if pattern_id is None:
+                pattern_id = self._pattern_ids[pattern] = len(self._pattern_groups)
+                self._pattern_groups.append([])
+                self._insert(pattern, pattern_id)
+            self._pattern_groups[pattern_id].append(group)
+        self._built = False
+
+    def _insert(self, pattern: str, pattern_id: int):
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._outputs.append([])
+            state = next_state
+        self._outputs[state].append(pattern_id)
+
+    def build(self) -> "KeywordMatcher":
+        """失敗遷移を計算（幅優先で浅い状態から順に）"""
+        queue = deque()
+        for state in self._goto[0].values():
+            self._fail[state] = 0
+            queue.append(state)
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                # 失敗遷移先で終わるパターンもこの状態で一致する
+                self._outputs[next_state].extend(self._outputs[self._fail[next_state]])
+        self._built = True
+        return self
+
+    @property
+    def pattern_count(self) -> int:
+        return len(self._pattern_groups)
+
+    def find_patterns(self, text: str) -> Set[int]:
+        """本文に含まれるパターンIDの集合（正規化済みの本文を渡す）"""
+        if not self._built:
+            self.build()
+        goto, fail, outputs = self._goto, self._fail, self._outputs
+        found: Set[int] = set()
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if outputs[state]:
+                found.update(outputs[state])
+        return found
+
+    def count_hits(self, text: str) -> Dict[Hashable, int]:
+        """グループごとのヒットしたキーワード数（ヒットのないグループは含まない）"""
+        counts: Dict[Hashable, int] = {}
+        for group in self._always_hit:
+            counts[group] = counts.get(group, 0) + 1
+        for pattern_id in self.find_patterns(text):
+            for group in self._pattern_groups[pattern_id]:
+                counts[group] = counts.get(group, 0) + 1
+        return counts
+
+    def best_group(self, text: str, default: Any = -1) -> Any:
+        """ヒット数が最大のグループ（同数なら先に登録したもの。ヒットなしは default）"""
+        counts = self.count_hits(text)
+        if not counts:
+            return default
+        order = self._group_order
+        return min(counts, key=lambda group: (-counts[group], order[group]))
+
+
+def memoize_tokenizer(tokenize: Callable[[str], str], maxsize: Optional[int] = None) -> Callable[[str], str]:
+    """形態素解析の結果を入力文字列ごとにキャッシュする"""
+    return lru_cache(maxsize=maxsize)(tokenize)
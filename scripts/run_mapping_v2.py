@@ -6,6 +6,8 @@ import unicodedata
 import subprocess
 from sklearn.feature_extraction.text import TfidfVectorizer
 
+from keyword_matcher import KeywordMatcher, memoize_tokenizer
+
 # --- MeCabの初期化（辞書の場所を自動で探すロバストな方法） ---
 print("--- MeCabの初期化を試みます ---")
 try:
@@ -60,6 +62,25 @@ def tokenize(text):
         node = node.next
     return " ".join(words)
 
+# 同じ文書の形態素解析を繰り返さない
+tokenize = memoize_tokenizer(tokenize)
+
+def build_keyword_matcher(guidelines):
+    """全ガイドラインのキーワードを1つのオートマトンにまとめる"""
+    matcher = KeywordMatcher(normalize=normalize_text)
+    for guideline_id, keywords in zip(guidelines['id'], guidelines['keywords']):
+        matcher.add_group(int(guideline_id), str(keywords).split(';'))
+    return matcher.build()
+
+def map_questions(questions, guidelines):
+    """各問題を、キーワードのヒット数が最も多いガイドラインに割り当てる（該当なしは -1）"""
+    matcher = build_keyword_matcher(guidelines)
+    print(f"  キーワード {matcher.pattern_count}語 / ガイドライン {len(guidelines)}件")
+    return {
+        number: matcher.best_group(search_text, default=-1)
+        for number, search_text in zip(questions['number'], questions['full_text'])
+    }
+
 
 # --- データの読み込み ---
 print("--- データの読み込み中 ---")
@@ -84,16 +105,7 @@ questions_df['full_text'] = questions_df.apply(
 
 # --- 初期マッピング ---
 print("--- フェーズ1a: 初期マッピングを実行中 ---")
-question_to_guideline_map_initial = {}
-for _, question in questions_df.iterrows():
-    search_text = question['full_text']
-    best_score, best_guideline_id = 0, -1
-    for _, guideline in guidelines_df.iterrows():
-        keywords = str(guideline['keywords']).split(';')
-        score = sum(1 for kw in keywords if kw and normalize_text(kw) in search_text)
-        if score > best_score:
-            best_score, best_guideline_id = score, int(guideline['id'])
-    question_to_guideline_map_initial[question['number']] = best_guideline_id
+question_to_guideline_map_initial = map_questions(questions_df, guidelines_df)
 
 # --- TF-IDFによるキーワード拡張 ---
 print("--- フェーズ1b: TF-IDFでキーワードを自動拡張中 ---")
@@ -129,16 +141,7 @@ print(f"✅ 強化版DBを '{UPDATED_GUIDELINES_PATH}' に保存しました。"
 
 # --- 強化済みDBで再マッピング ---
 print("--- フェーズ2: 強化済みDBで再マッピングを実行中 ---")
-question_to_guideline_map_final = {}
-for _, question in questions_df.iterrows():
-    search_text = question['full_text']
-    best_score, best_guideline_id = 0, -1
-    for _, guideline in guidelines_df.iterrows():
-        keywords = str(guideline['keywords']).split(';')
-        score = sum(1 for kw in keywords if kw and normalize_text(kw) in search_text)
-        if score > best_score:
-            best_score, best_guideline_id = score, int(guideline['id'])
-    question_to_guideline_map_final[question['number']] = best_guideline_id
+question_to_guideline_map_final = map_questions(questions_df, guidelines_df)
 
 # --- 最終結果の保存 ---
 with open(OUTPUT_PATH, 'w', encoding='utf-8') as f:
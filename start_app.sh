@@ -42,6 +42,10 @@ if lsof -ti:8501 >/dev/null 2>&1; then
     sleep 2
 fi
 
+# ウォームアップ（問題データ・共有キャッシュ・重いモジュールの準備）
+echo "🔥 ウォームアップ中..."
+python run_warmup.py || echo "⚠️  ウォームアップに失敗したステップがあります（アプリは起動します）"
+
 # Streamlitアプリ起動
 echo "🎯 Streamlitアプリを起動中..."
 echo "   URL: http://localhost:8501"
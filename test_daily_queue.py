@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+おまかせ学習の日次キューのテスト
+JST 3時基準の日付境界・新規/復習カードの選択とグループ化・当日回答済みカードの除外を検証
+"""
+
+import sys
+import os
+import random
+import datetime
+
+import pytest
+
+pytest.importorskip("pytz")
+pytest.importorskip("streamlit")
+pytest.importorskip("firebase_admin")
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'my_llm_app'))
+
+from modules.daily_queue import (
+    JST, _effective_date, build_daily_queue, drop_reviewed_today, reviewed_on, select_due_cards
+)
+
+# 2025-09-02 12:00 JST
+NOW = datetime.datetime(2025, 9, 2, 3, 0, tzinfo=datetime.timezone.utc)
+
+
+def _questions(count, subject="歯周"):
+    return [{"number": f"112A{i}", "subject": subject, "question": "正しいのはどれか。"} for i in range(1, count + 1)]
+
+
+def _card(timestamp=None, due_date=None):
+    card = {"n": 1, "history": [{"quality": 4, "timestamp": timestamp}] if timestamp else []}
+    if due_date:
+        card["sm2"] = {"due_date": due_date}
+    return card
+
+
+def test_effective_date_boundary():
+    """JST 3:00 未満は前日、3:00 以降は当日として扱うこと"""
+    assert _effective_date(JST.localize(datetime.datetime(2025, 9, 2, 2, 59))) == datetime.date(2025, 9, 1)
+    assert _effective_date(JST.localize(datetime.datetime(2025, 9, 2, 3, 0))) == datetime.date(2025, 9, 2)
+    assert _effective_date(JST.localize(datetime.datetime(2025, 9, 2, 23, 59))) == datetime.date(2025, 9, 2)
+
+
+def test_select_due_cards_orders_by_due_date():
+    """期限を過ぎたカードだけを期限の古い順に返すこと"""
+    cards = {
+        "112A1": _card(due_date="2025-09-02T01:00:00+00:00"),
+        "112A2": _card(due_date="2025-08-30T00:00:00+09:00"),
+        "112A3": _card(due_date="2025-09-03T00:00:00+00:00"),
+        "112A4": {"sm2_data": {"due_date": datetime.datetime(2025, 9, 1, 0, 0)}},
+        "112A5": {"n": 0, "history": []},
+    }
+    assert select_due_cards(cards, NOW) == ["112A2", "112A4", "112A1"]
+
+
+def test_build_daily_queue_selects_new_and_due_cards():
+    """新規カードは未学習から上限まで選び、復習カードと合わせて group_size ごとに分けること"""
+    questions = _questions(12)
+    cards = {
+        "112A1": _card("2025-08-20T10:00:00+09:00", "2025-09-01T00:00:00+09:00"),
+        "112A2": _card("2025-08-21T10:00:00+09:00", "2025-09-01T12:00:00+09:00"),
+        "112A3": _card("2025-08-22T10:00:00+09:00", "2025-09-10T00:00:00+09:00"),
+    }
+    result = build_daily_queue(questions, cards, new_cards_per_day=4, now=NOW,
+                               group_size=3, rng=random.Random(0))
+
+    assert result["review_qids"] == ["112A1", "112A2"]
+    assert len(result["new_qids"]) == 4
+    assert not set(result["new_qids"]) & set(cards)
+    assert [len(group) for group in result["main_queue"]] == [3, 3]
+    flattened = [qid for group in result["main_queue"] for qid in group]
+    assert sorted(flattened) == sorted(result["new_qids"] + result["review_qids"])
+
+
+def test_build_daily_queue_limits_new_cards_to_unstudied():
+    """未学習の問題が上限より少なければその分だけ選ぶこと"""
+    questions = _questions(3)
+    cards = {"112A1": _card("2025-08-20T10:00:00+09:00")}
+    result = build_daily_queue(questions, cards, new_cards_per_day=10, now=NOW, rng=random.Random(0))
+    assert sorted(result["new_qids"]) == ["112A2", "112A3"]
+    assert result["review_qids"] == []
+    assert [len(group) for group in result["main_queue"]] == [2]
+
+
+def test_reviewed_on_with_aware_and_naive_timestamps():
+    """JST付きの時刻はそのまま、タイムゾーンなしの時刻はUTCとして3時基準の日付を判定すること"""
+    today = datetime.date(2025, 9, 2)
+    # JST 付き（アプリが記録する形式）
+    assert reviewed_on(_card("2025-09-02T03:00:00+09:00"), today)
+    assert not reviewed_on(_card("2025-09-02T02:59:00+09:00"), today)
+    # タイムゾーンなしは UTC（2025-09-01T18:00Z = 2025-09-02 03:00 JST）
+    assert reviewed_on(_card("2025-09-01T18:00:00"), today)
+    assert not reviewed_on(_card("2025-09-01T17:59:00"), today)
+    assert reviewed_on(_card(datetime.datetime(2025, 9, 2, 5, 0)), today)
+    # 履歴なし・時刻なし
+    assert not reviewed_on({"history": []}, today)
+    assert not reviewed_on({"history": [{"quality": 4}]}, today)
+
+
+def test_drop_reviewed_today():
+    """当日回答済みのカードを除き、空になったグループも除くこと"""
+    today = datetime.date(2025, 9, 2)
+    cards = {
+        "112A1": _card("2025-09-02T08:00:00+09:00"),
+        "112A2": _card("2025-09-01T20:00:00"),
+        "112A3": _card("2025-09-01T10:00:00+09:00"),
+        "112A4": _card("2025-09-02T01:00:00+09:00"),
+    }
+    queue = [["112A1", "112A2"], ["112A3", "112A5"], ["112A4"]]
+    assert drop_reviewed_today(queue, cards, today) == [["112A3", "112A5"], ["112A4"]]
+
+    # 回答済みがなければそのまま返す
+    assert drop_reviewed_today([["112A3"]], {"112A3": cards["112A3"]}, today) == [["112A3"]]
+
+
+if __name__ == "__main__":
+    print("=== 日次キュー テスト ===")
+    test_effective_date_boundary()
+    test_select_due_cards_orders_by_due_date()
+    test_build_daily_queue_selects_new_and_due_cards()
+    test_build_daily_queue_limits_new_cards_to_unstudied()
+    test_reviewed_on_with_aware_and_naive_timestamps()
+    test_drop_reviewed_today()
+    print("✅ 全テスト成功")
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+問題メタデータによる採点のテスト
+単一・複数（順不同・別解）・並び替え・数値問題の grade と、メタデータのない問題の grade_many を検証
+"""
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'my_llm_app'))
+
+from question_meta import (
+    build_question_meta, build_question_metadata, grade, grade_many,
+    QUESTION_TYPE_SINGLE, QUESTION_TYPE_MULTI, QUESTION_TYPE_ORDERING, QUESTION_TYPE_NUMERIC
+)
+
+CHOICES = ["選択肢1", "選択肢2", "選択肢3", "選択肢4", "選択肢5"]
+
+
+def _meta(answer, question="正しいのはどれか。", choices=CHOICES):
+    return build_question_meta({"number": "112A1", "question": question, "choices": choices, "answer": answer})
+
+
+def test_single_answer():
+    """単一選択は大文字・小文字を区別せず1つの記号だけを正解とすること"""
+    meta = _meta("C")
+    assert meta["type"] == QUESTION_TYPE_SINGLE
+    assert grade(meta, "C")
+    assert grade(meta, "c")
+    assert not grade(meta, "B")
+    assert not grade(meta, "BC")
+    assert not grade(meta, "")
+
+
+def test_multi_answer_any_order():
+    """複数選択は記号の順序・区切り文字によらず同じ組み合わせを正解とすること"""
+    meta = _meta("BE")
+    assert meta["type"] == QUESTION_TYPE_MULTI
+    assert grade(meta, "BE")
+    assert grade(meta, "EB")
+    assert grade(meta, "e, b")
+    assert grade(meta, "B、E")
+    assert not grade(meta, "B")
+    assert not grade(meta, "BDE")
+
+
+def test_multi_answer_alternatives():
+    """「/」区切りの別解はいずれの組み合わせも正解とすること"""
+    meta = _meta("AD/AC/CD")
+    assert meta["type"] == QUESTION_TYPE_MULTI
+    assert grade(meta, "CA")
+    assert grade(meta, "DA")
+    assert grade(meta, "DC")
+    assert not grade(meta, "AB")
+    assert not grade(meta, "ACD")
+
+    # 単一記号の別解
+    single = _meta("A/E")
+    assert single["type"] == QUESTION_TYPE_SINGLE
+    assert grade(single, "E")
+    assert not grade(single, "AE")
+
+
+def test_ordering_requires_exact_order():
+    """並び替え問題は記号の順序まで一致した場合のみ正解とすること"""
+    meta = _meta("CABD", question="操作の順番として正しいのはどれか。")
+    assert meta["type"] == QUESTION_TYPE_ORDERING
+    assert grade(meta, "CABD")
+    assert grade(meta, "c,a,b,d")
+    assert not grade(meta, "ABCD")
+    assert not grade(meta, "CADB")
+
+
+def test_numeric_answer_with_separators():
+    """選択肢のない数値問題は区切り文字を除いた文字列で比較すること"""
+    meta = _meta("1,250", question="必要量を求めよ。", choices=[])
+    assert meta["type"] == QUESTION_TYPE_NUMERIC
+    assert grade(meta, "1250")
+    assert grade(meta, "1,250")
+    assert grade(meta, "1 250")
+    assert not grade(meta, "125")
+    assert not grade(meta, "0521")
+
+
+def test_grade_many_without_metadata():
+    """grade_many はメタデータのない問題を不正解として扱うこと"""
+    metadata = build_question_metadata([
+        {"number": "112A1", "question": "正しいのはどれか。", "choices": CHOICES, "answer": "A"},
+        {"number": "112A2", "question": "正しいのはどれか。", "choices": CHOICES, "answer": "BD"},
+        {"question": "番号のない問題", "choices": CHOICES, "answer": "A"},
+    ])
+    assert set(metadata) == {"112A1", "112A2"}
+    assert grade_many(metadata, {"112A1": "A", "112A2": "DB", "999Z9": "A"}) == {
+        "112A1": True, "112A2": True, "999Z9": False,
+    }
+
+    # 解答のない問題は採点できない
+    no_answer = build_question_metadata([{"number": "112A3", "choices": CHOICES, "answer": ""}])
+    assert grade_many(no_answer, {"112A3": "A"}) == {"112A3": False}
+
+
+if __name__ == "__main__":
+    print("=== 問題メタデータ採点テスト ===")
+    test_single_answer()
+    test_multi_answer_any_order()
+    test_multi_answer_alternatives()
+    test_ordering_requires_exact_order()
+    test_numeric_answer_with_separators()
+    test_grade_many_without_metadata()
+    print("✅ 全テスト成功")
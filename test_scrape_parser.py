@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+スクレイピングのオフラインテスト
+保存済みHTML（scraping/fixtures）の解析と、ブラウザプールの再利用を検証（ネットワーク・ブラウザ不要）
+"""
+
+import os
+
+import pytest
+
+pytest.importorskip("bs4")
+
+from scraping.engine import BrowserPool
+from scraping.scrape_dentalyouth import parse_questions
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scraping", "fixtures")
+FIXTURE_URL = "https://dentalyouth.blog/118a/"
+
+
+def _load_fixture(name: str) -> str:
+    with open(os.path.join(FIXTURE_DIR, name), encoding="utf-8") as f:
+        return f.read()
+
+
+def test_parse_questions_from_fixture():
+    """問題番号・問題文・選択肢・画像・解答を取り出せること"""
+    questions = parse_questions(_load_fixture("dentalyouth_sample.html"), FIXTURE_URL)
+
+    assert [q["number"] for q in questions] == ["118A1", "118A2", "118A3"]
+
+    first = questions[0]
+    assert first["question"] == "う蝕の二次予防はどれか。1つ選べ。"
+    assert first["choices"] == ["フッ化物洗口", "小窩裂溝填塞", "定期健康診査", "歯口清掃指導", "シュガーコントロール"]
+    assert first["image_urls"] is None
+    assert first["answer"] == "C"
+
+    # 画像は絶対URL・元サイズ・png に正規化され、重複しない
+    image_question = questions[1]
+    assert image_question["question"].startswith("写真を別に示す。矢印で示すのはどれか。1つ選べ。")
+    assert image_question["image_urls"] == ["https://dentalyouth.blog/wp-content/uploads/2025/03/118A2.png"]
+    assert image_question["choices"] == ["エナメル質", "象牙質", "歯髄", "セメント質", "歯根膜"]
+    assert image_question["answer"] == "B"
+
+    # リスト形式の選択肢と、開いていない解答ボタン（空文字）
+    list_question = questions[2]
+    assert list_question["choices"] == ["緩衝作用", "骨形成作用", "抗菌作用", "造血作用", "止血作用"]
+    assert list_question["answer"] == ""
+
+
+class _FakeDriver:
+    def __init__(self):
+        self.closed = False
+
+    def quit(self):
+        self.closed = True
+
+
+def test_browser_pool_recreates_drivers_after_close():
+    """close 後の acquire は終了済みのブラウザではなく新しいブラウザを返すこと"""
+    pool = BrowserPool(size=1, factory=_FakeDriver)
+    driver = pool.acquire()
+    pool.release(driver)
+    pool.close()
+    assert driver.closed
+
+    new_driver = pool.acquire()
+    assert new_driver is not driver
+    assert not new_driver.closed
+    pool.release(new_driver)
+    pool.close()
+
+
+if __name__ == "__main__":
+    print("=== スクレイピング オフラインテスト ===")
+    test_parse_questions_from_fixture()
+    test_browser_pool_recreates_drivers_after_close()
+    print("✅ 全テスト成功")
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+セッション状態保存の往復テスト
+旧形式（JSON文字列リスト）・新形式（queues + queue_head）・差分更新の復元結果を検証
+"""
+
+import sys
+import os
+import json
+import datetime
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'my_llm_app'))
+
+from session_queue import (
+    ShortTermReviewQueue, coerce_main_queue, decode_session_document,
+    diff_session_state, RESULT_LOG_MAX_ENTRIES, RESULT_LOG_KEEP_ENTRIES
+)
+
+NOW = datetime.datetime(2025, 9, 1, 12, 0, tzinfo=datetime.timezone.utc)
+
+
+def _apply_updates(document, updates):
+    """Firestoreの update() 相当を辞書に適用"""
+    document = dict(document)
+    document["result_log"] = dict(document.get("result_log", {}))
+    for key, value in updates.items():
+        if isinstance(key, tuple):
+            document[key[0]][key[1]] = value
+        else:
+            document[key] = value
+    return document
+
+
+def _make_session():
+    review_queue = ShortTermReviewQueue()
+    review_queue.push(["112A5", "112A6"], NOW - datetime.timedelta(minutes=5))
+    review_queue.push(["G24-1-1-A-1"], NOW + datetime.timedelta(minutes=10))
+    return {
+        "current_q_group": ["101A1", "101A2"],
+        "main_queue": coerce_main_queue([["101A3"], ["G24-2再-A-1", "101A4"], ["101A5"]]),
+        "short_term_review_queue": review_queue,
+        "result_log": {"100A1": {"timestamp": "2025-09-01T10:00:00+09:00", "correct": True, "quality": 4}},
+    }
+
+
+def _assert_same_queues(restored, session):
+    assert restored["current_q_group"] == list(session["current_q_group"])
+    assert list(restored["main_queue"]) == [list(g) for g in session["main_queue"]]
+    assert list(restored["short_term_review_queue"]) == list(session["short_term_review_queue"])
+    assert restored["short_term_review_queue"].ready_count(NOW) == session["short_term_review_queue"].ready_count(NOW)
+
+
+def test_legacy_format_is_restored():
+    """旧形式のドキュメントから同じキューが復元できること"""
+    legacy_doc = {
+        "current_q_group": [json.dumps("101A1"), json.dumps("101A2")],
+        "main_queue": [json.dumps(["101A3"]), json.dumps(["G24-2再-A-1", "101A4"])],
+        "short_term_review_queue": [
+            {"group": ["112A5"], "ready_at": (NOW - datetime.timedelta(minutes=1)).isoformat()},
+        ],
+        "result_log": {},
+    }
+    restored, snapshot = decode_session_document(legacy_doc)
+    assert snapshot is None
+    assert restored["current_q_group"] == ["101A1", "101A2"]
+    assert restored["main_queue"] == [["101A3"], ["G24-2再-A-1", "101A4"]]
+    assert restored["short_term_review_queue"].ready_count(NOW) == 1
+    assert restored["short_term_review_queue"].pop_ready() == ["112A5"]
+
+
+def test_full_document_round_trip():
+    """全体保存したドキュメントから正確に復元できること"""
+    session = _make_session()
+    document, _ = diff_session_state(None, session)
+    restored, snapshot = decode_session_document(document)
+    _assert_same_queues(restored, session)
+    assert restored["result_log"] == session["result_log"]
+    assert snapshot is not None
+
+
+def test_incremental_updates_round_trip():
+    """先頭からの消化は queue_head のみ、結果追加は個別フィールドのみを書き込むこと"""
+    session = _make_session()
+    document, snapshot = diff_session_state(None, session)
+
+    # メインキューから1グループ取り出し、結果を1件追加
+    session["current_q_group"] = session["main_queue"].popleft()
+    session["result_log"]["101A1"] = {"timestamp": "2025-09-01T12:00:00+09:00", "correct": False, "quality": 1}
+    updates, snapshot = diff_session_state(snapshot, session)
+
+    assert "queues" not in updates
+    assert updates["queue_head"] == 1
+    assert ("result_log", "101A1") in updates
+    assert "result_log" not in updates
+
+    document = _apply_updates(document, updates)
+    restored, _ = decode_session_document(document)
+    _assert_same_queues(restored, session)
+    assert restored["result_log"] == session["result_log"]
+
+    # 短期復習キューが変わった場合はキュー全体を書き直す
+    session["short_term_review_queue"].push(["101A1"], NOW + datetime.timedelta(minutes=3))
+    updates, snapshot = diff_session_state(snapshot, session)
+    assert updates["queue_head"] == 0 and "queues" in updates
+
+    document = _apply_updates(document, updates)
+    restored, _ = decode_session_document(document)
+    _assert_same_queues(restored, session)
+
+    # 変更がなければ何も書き込まない
+    updates, _ = diff_session_state(snapshot, session)
+    assert updates == {}
+
+
+def test_result_log_compaction():
+    """result_log が上限を超えたら古い記録から間引くこと"""
+    session = _make_session()
+    session["result_log"] = {
+        f"Q{i:04d}": {"timestamp": f"2025-09-01T00:{i // 60 % 60:02d}:{i % 60:02d}", "quality": 3}
+        for i in range(RESULT_LOG_MAX_ENTRIES + 1)
+    }
+    updates, snapshot = diff_session_state(None, session)
+    assert len(updates["result_log"]) == RESULT_LOG_KEEP_ENTRIES
+    assert len(session["result_log"]) == RESULT_LOG_KEEP_ENTRIES
+    assert "Q0000" not in session["result_log"]
+    assert f"Q{RESULT_LOG_MAX_ENTRIES:04d}" in session["result_log"]
+
+
+if __name__ == "__main__":
+    print("=== セッション状態保存 往復テスト ===")
+    test_legacy_format_is_restored()
+    test_full_document_round_trip()
+    test_incremental_updates_round_trip()
+    test_result_log_compaction()
+    print("✅ 全テスト成功")
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+共有キャッシュのテスト
+キーがプロセスをまたいで同じになること・ディスクバックエンドの保存/期限/LRU削除を検証
+"""
+
+import sys
+import os
+import subprocess
+import tempfile
+import time
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'my_llm_app')
+sys.path.append(APP_DIR)
+
+import shared_cache
+
+# 内包表記・集合リテラルを含む関数（get_derived_data と同じ構造）のキーを出力
+_KEY_SCRIPT = r"""
+import sys
+sys.path.append(sys.argv[1])
+import shared_cache
+
+def derived(all_questions):
+    numbers = {q['number'] for q in all_questions}
+    subjects = sorted(list(set(q['subject'] for q in all_questions if q.get('subject') not in {'（未分類）', ''})))
+    return numbers, subjects, [n for n in numbers if n.startswith('G')]
+
+print(shared_cache.make_key("derived", shared_cache._code_digest(derived), "v1",
+                            ([{"number": "112A5", "subject": "歯周"}],), {}))
+"""
+
+
+def _key_in_subprocess(hash_seed: str) -> str:
+    env = dict(os.environ, PYTHONHASHSEED=hash_seed)
+    result = subprocess.run([sys.executable, "-c", _KEY_SCRIPT, APP_DIR],
+                            capture_output=True, text=True, env=env, check=True)
+    return result.stdout.strip()
+
+
+def test_key_is_stable_across_processes():
+    """同じ関数・引数のキーが別プロセス（ハッシュシード違い）でも一致すること"""
+    first = _key_in_subprocess("1")
+    second = _key_in_subprocess("2")
+    assert first
+    assert first == second
+
+
+def test_disk_backend_round_trip_and_expiry():
+    """保存した値を読めること・期限切れはミスになること"""
+    backend = shared_cache.DiskBackend(tempfile.mkdtemp())
+    backend.set("a", {"numbers": {"112A5"}}, ttl=60)
+    assert backend.get("a") == {"numbers": {"112A5"}}
+    assert backend.get("b") is shared_cache._MISS
+
+    backend.set("old", 1, ttl=1)
+    time.sleep(1.1)
+    assert backend.get("old") is shared_cache._MISS
+
+
+def test_disk_backend_evicts_least_recently_used():
+    """合計サイズが上限を超えたら最終アクセスの古いものから削除すること"""
+    backend = shared_cache.DiskBackend(tempfile.mkdtemp(), max_bytes=10 ** 9)
+    backend.set("first", "x" * 1000)
+    backend.set("second", "y" * 1000)
+    # first を後から参照して新しくする
+    old = time.time() - 100
+    os.utime(backend._path("second"), (old, old))
+    os.utime(backend._path("first"), (old - 50, old - 50))
+    assert backend.get("first") == "x" * 1000
+
+    backend.max_bytes = 1500
+    assert backend.evict() == 1
+    assert backend.get("second") is shared_cache._MISS
+    assert backend.get("first") == "x" * 1000
+
+
+def test_redis_requires_local_or_trusted_url():
+    """ローカル以外の Redis は信頼設定なしでは使わないこと（値を pickle で復元するため）"""
+    assert shared_cache.is_local_url("redis://localhost:6379/0")
+    assert shared_cache.is_local_url("redis://:secret@127.0.0.1:6379/1")
+    assert shared_cache.is_local_url("unix:///var/run/redis.sock")
+    assert not shared_cache.is_local_url("rediss://cache.example.com:6380/0")
+    assert not shared_cache.is_local_url("redis://10.0.0.5:6379/0")
+
+
+if __name__ == "__main__":
+    print("=== 共有キャッシュ テスト ===")
+    test_key_is_stable_across_processes()
+    test_disk_backend_round_trip_and_expiry()
+    test_disk_backend_evicts_least_recently_used()
+    test_redis_requires_local_or_trusted_url()
+    print("✅ 全テスト成功")